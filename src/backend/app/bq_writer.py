@@ -0,0 +1,307 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import lru_cache
+from glob import glob
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (table_id, insert_id, row). The insert id lets BigQuery drop duplicates of retried rows.
+Item = Tuple[str, str, Dict[str, Any]]
+
+_STOP = object()
+# Tags the replay files of this process. PIDs alone are not enough: a restarted
+# container usually gets the same PID (often 1) as the process it replaces.
+_PROCESS_ID = uuid.uuid4().hex
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BigQueryWriter:
+    """
+    Streams rows to BigQuery from a background thread.
+
+    Rows are queued without blocking the caller and inserted per table in
+    batches of up to `batch_size`, at least every `flush_interval_seconds`.
+    Failed inserts are retried with exponential backoff; rows that still cannot
+    be delivered, or that do not fit in the queue, are appended to a local JSONL
+    spool file, which is replayed when the writer starts. Rows BigQuery rejects
+    as invalid are logged and dropped, since retrying them cannot succeed.
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], spool_path: str, batch_size: int = 500,
+                 flush_interval_seconds: float = 5, max_queue: int = 10000,
+                 max_retries: int = 3, backoff_seconds: float = 1):
+        self._client_factory = client_factory
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stats = {"submitted": 0, "inserted": 0, "rejected": 0, "spooled": 0, "replayed": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="bq-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, table_id: str, row: Dict[str, Any]):
+        self.start()
+        item = (table_id, uuid.uuid4().hex, row)
+        with self._lock:
+            self._stats["submitted"] += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning(f"BigQuery writer queue is full. Spooling row for {table_id}.")
+            self._spool([item])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Inserts everything queued so far. Returns False if it did not finish within
+        timeout. If the queue stays full for that long, the queued rows are spooled instead.
+        """
+        if self._thread is None:
+            return True
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            logger.warning("BigQuery writer queue is full. Spooling queued rows instead of flushing them.")
+            self._spool_queued()
+            return False
+        return request.done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Inserts queued rows and stops the writer. Rows still queued after timeout are spooled.
+        """
+        if self._thread is None:
+            return
+        # The writer stops once the queue is empty; the marker only wakes it up if it is idle.
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"BigQuery writer did not stop within {timeout}s. Spooling queued rows.")
+        self._spool_queued()
+
+    def _spool_queued(self):
+        """
+        Moves every row still in the queue to the spool. Waiting flushes are released,
+        since their rows are spooled too.
+        """
+        leftovers = []
+        stop = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                leftovers.append(item)
+            elif isinstance(item, _FlushRequest):
+                item.done.set()
+            else:
+                stop = True
+        if leftovers:
+            self._spool(leftovers)
+        if stop:
+            self._queue.put_nowait(_STOP)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "queued": self._queue.qsize()}
+
+    def _count(self, key: str, amount: int):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _run(self):
+        self._replay_spool()
+        pending: Dict[str, List[Item]] = defaultdict(list)
+        deadline = None
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+            try:
+                if self._stopping.is_set():
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _STOP if self._stopping.is_set() else None
+
+            if item is _STOP:
+                self._flush_pending(pending)
+                return
+            if isinstance(item, _FlushRequest):
+                self._flush_pending(pending)
+                deadline = None
+                item.done.set()
+                continue
+            if item is not None:
+                table_id = item[0]
+                pending[table_id].append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval_seconds
+                if len(pending[table_id]) >= self.batch_size:
+                    self._insert(table_id, pending.pop(table_id))
+            if deadline is not None and time.monotonic() >= deadline:
+                self._flush_pending(pending)
+                deadline = None
+
+    def _flush_pending(self, pending: Dict[str, List[Item]]):
+        for table_id in list(pending):
+            self._insert(table_id, pending.pop(table_id))
+
+    def _insert(self, table_id: str, items: List[Item]):
+        attempt = 0
+        while items:
+            try:
+                client = self._client_factory()
+                if client is None:
+                    logger.warning(f"BigQuery is not configured. Dropping {len(items)} rows for {table_id}.")
+                    return
+                errors = client.insert_rows_json(
+                    table_id, [row for _, _, row in items], row_ids=[insert_id for _, insert_id, _ in items]
+                )
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"Failed to insert {len(items)} rows into {table_id}, spooling them: {e}")
+                    self._spool(items)
+                    return
+                delay = self.backoff_seconds * 2 ** attempt
+                attempt += 1
+                logger.warning(f"Insert into {table_id} failed, retry {attempt}/{self.max_retries} in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+
+            failed = {error["index"]: error.get("errors", []) for error in errors}
+            self._count("inserted", len(items) - len(failed))
+            if not failed:
+                return
+            # Rows reported only as "stopped" were valid but aborted because another row in
+            # the request was invalid; they are sent again without the invalid rows.
+            retry = []
+            for index, row_errors in failed.items():
+                if row_errors and all(error.get("reason") == "stopped" for error in row_errors):
+                    retry.append(items[index])
+                else:
+                    logger.error(f"BigQuery rejected a row for {table_id}: {row_errors} Row: {items[index][2]}")
+                    self._count("rejected", 1)
+            if len(retry) == len(items):
+                logger.error(f"BigQuery stopped all {len(items)} rows for {table_id} without naming an invalid row, spooling them.")
+                self._spool(items)
+                return
+            items = retry
+
+    def _spool(self, items: List[Item]):
+        with self._spool_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+                with open(self.spool_path, "a", encoding="utf-8") as spool:
+                    for table_id, insert_id, row in items:
+                        spool.write(json.dumps({"table_id": table_id, "insert_id": insert_id, "row": row}) + "\n")
+                self._count("spooled", len(items))
+            except OSError as e:
+                logger.critical(f"Failed to spool {len(items)} BigQuery rows to {self.spool_path}: {e}")
+
+    def _replay_spool(self):
+        """
+        Inserts rows spooled by this or an earlier process. Spool files are renamed
+        before they are read, so concurrent workers never replay the same file, and
+        rows that fail again are spooled anew.
+        """
+        for path in self._claim_spool_files():
+            by_table: Dict[str, List[Item]] = defaultdict(list)
+            with open(path, encoding="utf-8") as spool:
+                for line in spool:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.error(f"Skipping corrupt line in BigQuery spool {path}.")
+                        continue
+                    by_table[record["table_id"]].append((record["table_id"], record["insert_id"], record["row"]))
+
+            count = sum(len(items) for items in by_table.values())
+            logger.info(f"Replaying {count} spooled BigQuery rows from {path}.")
+            self._count("replayed", count)
+            for table_id, items in by_table.items():
+                for start in range(0, len(items), self.batch_size):
+                    self._insert(table_id, items[start:start + self.batch_size])
+            os.remove(path)
+
+    def _claim_spool_files(self) -> List[str]:
+        """
+        Renames the spool, and replay files left behind by processes that died
+        mid-replay, to replay files owned by this process.
+        """
+        claimed = []
+        candidates = [self.spool_path]
+        for path in glob(f"{self.spool_path}.replay-*"):
+            owner = path.rsplit(".replay-", 1)[1].split("-")
+            owner_pid, owner_id = int(owner[0]), owner[1] if len(owner) > 2 else None
+            if owner_id == _PROCESS_ID:
+                continue
+            # Another process with this PID was an earlier incarnation of this one, so it is gone.
+            if owner_pid == os.getpid() or not _process_alive(owner_pid):
+                candidates.append(path)
+        for path in candidates:
+            target = f"{self.spool_path}.replay-{os.getpid()}-{_PROCESS_ID}-{uuid.uuid4().hex[:8]}"
+            try:
+                # Rows being spooled right now must land in the file before it is claimed.
+                with self._spool_lock:
+                    os.rename(path, target)
+                claimed.append(target)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Failed to claim BigQuery spool {path}: {e}")
+        return claimed
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@lru_cache()
+def get_bq_writer() -> BigQueryWriter:
+    from app.dependencies import get_bq_client
+
+    return BigQueryWriter(
+        get_bq_client,
+        spool_path=settings.BQ_SPOOL_PATH,
+        batch_size=settings.BQ_WRITER_BATCH_SIZE,
+        flush_interval_seconds=settings.BQ_WRITER_FLUSH_SECONDS,
+        max_queue=settings.BQ_WRITER_MAX_QUEUE,
+        max_retries=settings.BQ_WRITER_MAX_RETRIES
+    )
@@ -1,8 +1,12 @@
+import os
 import yaml
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 from pathlib import Path
 
+# Only for local development: anyone who knows it can forge session cookies and media links.
+DEV_SECRET_KEY = 'a-very-secret-key-for-dev'
+
 
 class QuotaSettings(BaseModel):
     type: str = "NO_LIMIT"
@@ -27,6 +31,7 @@ class AppConfig(BaseModel):
     SHARED_VIDEOS_COLLECTION: str
     SECRET_ID: str
     ENABLE_OAUTH: bool = False
+    SECRET_KEY: str = Field(default_factory=lambda: os.environ.get('SECRET_KEY', DEV_SECRET_KEY))
     ALLOWED_DOMAINS: List[str] = []
     APP_ADMINS: List[str] = []
     COST_MANAGERS: List[str] = []
@@ -43,6 +48,45 @@ class AppConfig(BaseModel):
     FIND_SIMILAR_TOP_K: int
     LOCATION_MULTIMODAL_EMBEDDING_MODEL: str
     MAX_WORKER_COUNT: int
+    TASK_WORKER_COUNT: int = 4
+    CALLBACK_WORKER_COUNT: int = 4
+    BATCH_MAX_ITEMS: int = 50
+    BATCH_MAX_CONCURRENCY: int = 4
+    IDEMPOTENCY_WINDOW_SECONDS: int = 600
+    DUPLICATE_REQUEST_WINDOW_SECONDS: int = 5
+    RATE_LIMIT_MAX_RETRIES: int = 5
+    RATE_LIMIT_BACKOFF_SECONDS: float = 2
+    RATE_LIMIT_MAX_BACKOFF_SECONDS: float = 60
+    RATE_LIMIT_MAX_RETRY_SECONDS: float = 30
+    VEO_POLL_INTERVAL_SECONDS: int = 15
+    VEO_ADAPTIVE_POLLING: bool = True
+    VEO_LATENCY_HISTORY_DAYS: int = 30
+    TASK_STORE_BACKEND: str = "memory"
+    TASK_STORE_PATH: str = "/tmp/veospark/tasks.db"
+    TASK_STORE_DB: str = "(default)"
+    TASK_STORE_COLLECTION: str = "tasks"
+    TASK_STORE_TTL_SECONDS: Optional[int] = 21600
+    TASK_STORE_MAX_ENTRIES: Optional[int] = 5000
+    TASK_STORE_SPILL_DIR: Optional[str] = None
+    SIGNED_URL_CACHE_MAX_ENTRIES: int = 10000
+    SIGNED_URL_MIN_REMAINING_SECONDS: int = 900
+    SIGNING_KEY_FILE: Optional[str] = None
+    SIGNING_PARALLELISM: int = 16
+    CREDENTIAL_REFRESH_MARGIN_SECONDS: int = 300
+    MEDIA_LINK_TTL_SECONDS: int = 3600
+    MEDIA_REDIRECT_MAX_AGE_SECONDS: int = 300
+    CLIENT_HEALTH_CHECK_SECONDS: int = 300
+    OAUTH_SECRET_TTL_SECONDS: int = 3600
+    BQ_WRITER_BATCH_SIZE: int = 500
+    BQ_WRITER_FLUSH_SECONDS: float = 5
+    BQ_WRITER_MAX_QUEUE: int = 10000
+    BQ_WRITER_MAX_RETRIES: int = 3
+    BQ_SPOOL_PATH: str = "/tmp/veospark/bq_spool.jsonl"
+    QUOTA_RECONCILE_SECONDS: int = 300
+    QUOTA_RESERVATION_TTL_SECONDS: int = 3600
+    ENRICHMENT_QUOTA_OUTPUT_TOKENS: int = 1290
+    HISTORY_COUNT_TTL_SECONDS: int = 300
+    HISTORY_COUNT_CACHE_MAX_ENTRIES: int = 10000
 
 
 def load_config() -> AppConfig:
@@ -1,8 +1,11 @@
 from google.cloud import firestore
 import yaml
-from datetime import datetime
+from bisect import bisect_right
+from datetime import date, datetime
 from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 
 CONFIG_COLLECTION = 'system_config'
 CONFIG_DOCUMENT = 'quota_settings'
@@ -87,26 +90,79 @@ def save_bulk_project_configs(db: firestore.Client, configs: list):
             batch.set(doc_ref, config)
     batch.commit()
 
+# Pricing configs by model type; any other type is priced as video.
+PRICING_CONFIG_LOADERS = {
+    'video': get_models_config,
+    'image': get_image_models,
+    'image_enrichment': get_image_enrichment_models,
+}
+
+def _pricing_type(model_type: str) -> str:
+    return model_type if model_type in PRICING_CONFIG_LOADERS else 'video'
+
+class PricingIndex:
+    """
+    Read-only lookup of model prices by usage date.
+
+    For every (model type, model id) the pricing versions are parsed once and
+    kept as a sorted tuple of effective dates with the matching prices, so a
+    lookup is a bisect without any parsing or sorting. The source configs are
+    never modified and the returned prices are read-only views.
+    """
+
+    def __init__(self, configs: Dict[str, dict]):
+        self._versions: Dict[Tuple[str, str], Tuple[Tuple[date, ...], Tuple[Mapping[str, Any], ...]]] = {}
+        for model_type, config in configs.items():
+            for model in config.get('models', []):
+                key = (model_type, model.get('id'))
+                if key in self._versions:
+                    continue
+                by_date = {}
+                for price_info in model.get('pricing', []):
+                    effective_date = datetime.strptime(price_info['effective_date'], "%Y-%m-%d").date()
+                    by_date.setdefault(effective_date, MappingProxyType(dict(price_info)))
+                dates = tuple(sorted(by_date))
+                self._versions[key] = (dates, tuple(by_date[day] for day in dates))
+
+    def price(self, model_id: Optional[str], usage_date: Union[date, datetime], model_type: str = 'video') -> Optional[Mapping[str, Any]]:
+        """
+        Returns the pricing version in effect on usage_date, or None if the model
+        is unknown or has no price yet.
+        """
+        versions = self._versions.get((_pricing_type(model_type), model_id))
+        if not versions:
+            return None
+        dates, prices = versions
+        if isinstance(usage_date, datetime):
+            usage_date = usage_date.date()
+        index = bisect_right(dates, usage_date) - 1
+        return prices[index] if index >= 0 else None
+
+    def versions(self, model_id: str, model_type: str = 'video') -> List[Tuple[date, Mapping[str, Any]]]:
+        """
+        Returns every (effective_date, price) of the model, oldest first.
+        """
+        dates, prices = self._versions.get((_pricing_type(model_type), model_id), ((), ()))
+        return list(zip(dates, prices))
+
+_pricing_index: Optional[Tuple[Tuple[dict, ...], PricingIndex]] = None
+
+def get_pricing_index() -> PricingIndex:
+    """
+    Returns the pricing index of the currently loaded model configs, rebuilding
+    it only when a config has been reloaded.
+    """
+    global _pricing_index
+    configs = {model_type: loader() for model_type, loader in PRICING_CONFIG_LOADERS.items()}
+    sources = tuple(configs.values())
+    current = _pricing_index
+    if current is None or any(a is not b for a, b in zip(current[0], sources)):
+        current = (sources, PricingIndex(configs))
+        _pricing_index = current
+    return current[1]
+
 def get_price_for_model(model_id: str, usage_date: datetime, model_type: str):
     """
     Retrieves the correct pricing for a given model and usage date.
     """
-    if model_type == 'image':
-        config = get_image_models()
-    elif model_type == 'image_enrichment':
-        config = get_image_enrichment_models()
-    else:
-        config = get_models_config()
-
-    models = config.get('models', [])
-    for model in models:
-        if model.get('id') == model_id:
-            pricing_versions = model.get('pricing', [])
-            # Sort pricing versions by effective_date in descending order
-            pricing_versions.sort(key=lambda x: datetime.strptime(x['effective_date'], "%Y-%m-%d"), reverse=True)
-            
-            for price_info in pricing_versions:
-                effective_date = datetime.strptime(price_info['effective_date'], "%Y-%m-%d")
-                if usage_date.date() >= effective_date.date():
-                    return price_info
-    return None # Or a default price
+    return get_pricing_index().price(model_id, usage_date, model_type)
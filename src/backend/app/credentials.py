@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Sequence
+
+import google.auth
+from google.auth.transport.requests import Request as GoogleAuthRequest
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOUD_PLATFORM_SCOPES = ('https://www.googleapis.com/auth/cloud-platform',)
+# Wait between attempts when a background refresh fails.
+REFRESH_RETRY_SECONDS = 30
+
+
+class CredentialManager:
+    """
+    Holds one set of Google credentials for the process and keeps its access
+    token fresh. Tokens are refreshed `refresh_margin_seconds` before they
+    expire, by a background thread once started and otherwise on first use,
+    so callers never pay for a refresh per request.
+    """
+
+    def __init__(self, credentials=None, scopes: Sequence[str] = CLOUD_PLATFORM_SCOPES,
+                 refresh_margin_seconds: float = 300):
+        if credentials is None:
+            credentials, _ = google.auth.default(scopes=list(scopes))
+        self._credentials = credentials
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+    @property
+    def credentials(self):
+        """
+        Returns the credentials, refreshing them first if the token is missing or about to expire.
+        """
+        if self._needs_refresh():
+            with self._lock:
+                if self._needs_refresh():
+                    self._refresh()
+        return self._credentials
+
+    def start_background_refresh(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_periodically,
+                                               name="credential-refresh", daemon=True)
+            self._refresher.start()
+
+    def _seconds_until_refresh(self) -> float:
+        expiry = self._credentials.expiry
+        if not self._credentials.token:
+            return 0
+        if expiry is None:
+            return float('inf')
+        # google-auth reports expiry as a naive UTC datetime.
+        return (expiry - datetime.utcnow()).total_seconds() - self.refresh_margin_seconds
+
+    def _needs_refresh(self) -> bool:
+        return self._seconds_until_refresh() <= 0
+
+    def _refresh(self):
+        self._credentials.refresh(GoogleAuthRequest())
+        logger.info(f"Refreshed access token, valid until {self._credentials.expiry}.")
+
+    def _refresh_periodically(self):
+        while True:
+            delay = self._seconds_until_refresh()
+            if delay == float('inf'):
+                return
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                with self._lock:
+                    self._refresh()
+            except Exception as e:
+                logger.error(f"Background credential refresh failed: {e}", exc_info=True)
+                time.sleep(REFRESH_RETRY_SECONDS)
+
+
+@lru_cache()
+def get_credential_manager() -> CredentialManager:
+    manager = CredentialManager(refresh_margin_seconds=settings.CREDENTIAL_REFRESH_MARGIN_SECONDS)
+    manager.start_background_refresh()
+    return manager
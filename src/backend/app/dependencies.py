@@ -1,12 +1,12 @@
+import logging
 from functools import lru_cache
 from google.cloud import bigquery, firestore, storage
 from app.config import settings
-import google.auth
 import google.genai as genai
-from vertexai.preview.vision_models import ImageGenerationModel
-import vertexai
 from fastapi import Request
-from typing import Optional
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
 
 def get_user(request: Request) -> Optional[dict]:
     user = request.session.get('user')
@@ -52,3 +52,60 @@ def get_genai_client():
 @lru_cache()
 def get_imagen_client():
     return genai.Client(vertexai=True, project=settings.PROJECT_ID, location='us-central1')
+
+@lru_cache()
+def get_veo_client():
+    # Imported here because app.services depends on this module.
+    from app.services import VeoApiClient
+    return VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
+
+def init_clients():
+    """
+    Creates the shared GCP and GenAI clients, so the first requests do not pay for
+    authentication and connection setup. Clients that fail are retried on first use.
+    """
+    for factory in (get_storage_client, get_bq_client, get_genai_client, get_imagen_client, get_veo_client):
+        try:
+            factory()
+        except Exception as e:
+            logger.error(f"Failed to initialize {factory.__name__}: {e}", exc_info=True)
+
+def _probe_genai(client):
+    # Listing one model is the cheapest authenticated call of the GenAI API.
+    next(iter(client.models.list(config={"page_size": 1})), None)
+
+def check_clients() -> Dict[str, bool]:
+    """
+    Probes the shared clients that hold connections and credentials. Unhealthy
+    clients are dropped, so the next request that depends on them reconnects,
+    together with the shared services built from them.
+    """
+    # Imported here because these modules depend on this one.
+    from app.services import get_generation_service
+    from app.signed_urls import get_url_signer
+
+    probes = {
+        get_storage_client: lambda client: client.get_bucket(settings.VIDEO_BUCKET_NAME),
+        get_bq_client: lambda client: client and client.get_dataset(f"{settings.PROJECT_ID}.{settings.ANALYSIS_DATASET}"),
+        get_genai_client: _probe_genai,
+        get_imagen_client: _probe_genai,
+        get_veo_client: lambda client: client.storage_client.get_bucket(settings.VIDEO_BUCKET_NAME),
+    }
+    # Services that keep the clients they were built with are rebuilt with the new ones.
+    dependents = {
+        get_storage_client: (get_generation_service, get_url_signer),
+        get_genai_client: (get_generation_service,),
+        get_imagen_client: (get_generation_service,),
+    }
+    health = {}
+    for factory, probe in probes.items():
+        try:
+            probe(factory())
+            health[factory.__name__] = True
+        except Exception as e:
+            logger.warning(f"Health check of {factory.__name__} failed, reconnecting on next use: {e}")
+            factory.cache_clear()
+            for dependent in dependents.get(factory, ()):
+                dependent.cache_clear()
+            health[factory.__name__] = False
+    return health
@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.pagination import row_id_expression
+
+# asset_type -> (setting naming its history table, columns telling apart rows with the same trigger_time)
+HISTORY_SOURCES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "video": ("HISTORY_TABLE", ("completion_time", "output_video_gcs_paths", "status")),
+    "image": ("IMAGEN_HISTORY_TABLE", ("completion_time", "output_image_gcs_path", "status")),
+    "image_enrichment": ("IMAGE_ENRICHMENT_HISTORY_TABLE", ("completion_time", "output_image_gcs_path", "status")),
+}
+
+# Columns of the merged history: (name, type, asset types whose table has the column).
+# Other tables return NULL, so every row keeps the field names of its own history endpoint.
+HISTORY_COLUMNS: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("user_email", "STRING", ("video", "image", "image_enrichment")),
+    ("trigger_time", "TIMESTAMP", ("video", "image", "image_enrichment")),
+    ("completion_time", "TIMESTAMP", ("video", "image", "image_enrichment")),
+    ("prompt", "STRING", ("video", "image", "image_enrichment")),
+    ("negative_prompt", "STRING", ("image", "image_enrichment")),
+    ("model_used", "STRING", ("video", "image", "image_enrichment")),
+    ("status", "STRING", ("video", "image", "image_enrichment")),
+    ("error_message", "STRING", ("video", "image", "image_enrichment")),
+    ("operation_duration", "FLOAT64", ("video", "image", "image_enrichment")),
+    ("resolution", "STRING", ("video", "image", "image_enrichment")),
+    ("aspect_ratio", "STRING", ("video", "image", "image_enrichment")),
+    ("creative_project_id", "STRING", ("video", "image", "image_enrichment")),
+    ("video_duration", "INT64", ("video",)),
+    ("output_video_gcs_paths", "STRING", ("video",)),
+    ("first_frame_gcs_uri", "STRING", ("video",)),
+    ("last_frame_gcs_uri", "STRING", ("video",)),
+    ("output_image_gcs_path", "STRING", ("image", "image_enrichment")),
+    ("input_token", "INT64", ("image_enrichment",)),
+    ("output_token", "INT64", ("image_enrichment",)),
+]
+
+# Projection of the merged rows, with timestamps rendered like the per-type history endpoints.
+HISTORY_SELECT = ", ".join(
+    f"CAST({name} AS STRING) AS {name}" if column_type == "TIMESTAMP" else name
+    for name, column_type, _ in HISTORY_COLUMNS
+)
+
+
+def _branch(asset_type: str, where_sql: str) -> str:
+    table_setting, row_id_columns = HISTORY_SOURCES[asset_type]
+    columns = [f"'{asset_type}' AS asset_type"]
+    for name, column_type, asset_types in HISTORY_COLUMNS:
+        columns.append(f"CAST({name} AS {column_type}) AS {name}" if asset_type in asset_types
+                       else f"CAST(NULL AS {column_type}) AS {name}")
+    columns.append(f"{row_id_expression(repr(asset_type), *row_id_columns)} AS row_id")
+    return (
+        f"SELECT {', '.join(columns)} "
+        f"FROM `{settings.PROJECT_ID}.{settings.ANALYSIS_DATASET}.{getattr(settings, table_setting)}` "
+        f"WHERE {where_sql}"
+    )
+
+
+def history_source(asset_types: Optional[List[str]], where_clauses: List[str]) -> str:
+    """
+    FROM clause merging the history tables of `asset_types` (all by default)
+    with UNION ALL. Only the columns of HISTORY_COLUMNS are read, and the
+    filters are applied in every branch so each table is pruned on its own.
+    """
+    where_sql = " AND ".join(where_clauses) or "TRUE"
+    branches = [_branch(asset_type, where_sql) for asset_type in (asset_types or HISTORY_SOURCES)]
+    return "(\n            " + "\n            UNION ALL\n            ".join(branches) + "\n        )"
@@ -0,0 +1,125 @@
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Keep the most recent completions per key, so the model follows changes in backend speed.
+MAX_SAMPLES_PER_KEY = 200
+# Fewer samples than this are not trusted; the poller falls back to a fixed interval.
+MIN_SAMPLES = 5
+# Number of polls spread across the p10..p90 completion window.
+DENSE_POLL_DIVISIONS = 8
+MIN_POLL_INTERVAL_SECONDS = 2
+MAX_POLL_INTERVAL_SECONDS = 60
+
+LatencyKey = Tuple[str, int, str, bool]
+
+
+def video_latency_key(body: Dict[str, Any]) -> LatencyKey:
+    """
+    Builds the latency key (model, duration, resolution, generateAudio) for a video request.
+    """
+    return (
+        body.get('model') or "",
+        int(body.get('duration') or 8),
+        body.get('resolution') or "",
+        bool(body.get('generateAudio')),
+    )
+
+
+def _quantile(sorted_samples, fraction: float) -> float:
+    index = min(int(fraction * len(sorted_samples)), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+class LatencyModel:
+    """
+    Learns completion-time distributions of long-running operations and turns
+    them into a polling schedule.
+
+    Before the usual completion window (p10) the poller sleeps straight to it;
+    inside the window (p10..p90) it polls densely; past p90 it falls back to the
+    fixed interval. Keys without enough samples borrow the distribution of the
+    same model, and otherwise use the fixed interval.
+    """
+
+    def __init__(self, fallback_interval_seconds: float):
+        self.fallback_interval_seconds = fallback_interval_seconds
+        self._samples: Dict[Hashable, Deque[float]] = {}
+        self._model_samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: LatencyKey, seconds: float):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=MAX_SAMPLES_PER_KEY)).append(seconds)
+            self._model_samples.setdefault(key[0], deque(maxlen=MAX_SAMPLES_PER_KEY)).append(seconds)
+
+    def quantiles(self, key: LatencyKey) -> Optional[Tuple[float, float, float]]:
+        """
+        Returns (p10, p50, p90) completion times in seconds, or None if unknown.
+        """
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < MIN_SAMPLES:
+                samples = self._model_samples.get(key[0])
+            if not samples or len(samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return _quantile(ordered, 0.1), _quantile(ordered, 0.5), _quantile(ordered, 0.9)
+
+    def next_delay(self, key: Optional[LatencyKey], elapsed_seconds: float) -> float:
+        """
+        Returns how long to wait before the next poll of an operation started elapsed_seconds ago.
+        """
+        estimate = self.quantiles(key) if key else None
+        if estimate is None:
+            return self.fallback_interval_seconds
+
+        p10, _, p90 = estimate
+        if elapsed_seconds < p10:
+            delay = p10 - elapsed_seconds
+        elif elapsed_seconds < p90:
+            delay = (p90 - p10) / DENSE_POLL_DIVISIONS
+        else:
+            delay = self.fallback_interval_seconds
+        return min(max(delay, MIN_POLL_INTERVAL_SECONDS), MAX_POLL_INTERVAL_SECONDS)
+
+    def seed_from_history(self, bq_client, days: int) -> int:
+        """
+        Loads successful video generations of the last `days` days from BigQuery.
+        Multi-sample requests log one row per video with a share of the duration,
+        so rows are summed back per request. Returns the number of samples loaded.
+        """
+        from google.cloud import bigquery
+
+        table_id = f"{settings.PROJECT_ID}.{settings.ANALYSIS_DATASET}.{settings.HISTORY_TABLE}"
+        query = f"""
+            SELECT model_used, video_duration, resolution, with_audio, SUM(operation_duration) AS seconds
+            FROM `{table_id}`
+            WHERE status = 'SUCCESS'
+              AND operation_duration > 0
+              AND trigger_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY)
+            GROUP BY user_email, trigger_time, model_used, video_duration, resolution, with_audio
+            ORDER BY trigger_time
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("days", "INT64", days)]
+        )
+        count = 0
+        for row in bq_client.query(query, job_config=job_config).result():
+            key = video_latency_key({
+                'model': row.model_used,
+                'duration': row.video_duration,
+                'resolution': row.resolution,
+                'generateAudio': row.with_audio,
+            })
+            self.record(key, float(row.seconds))
+            count += 1
+        logger.info(f"Seeded latency model with {count} video generations from the last {days} days.")
+        return count
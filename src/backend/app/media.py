@@ -0,0 +1,60 @@
+import hashlib
+import hmac
+import time
+from typing import Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from app.config import DEV_SECRET_KEY, settings
+
+MEDIA_PATH = "/api/media"
+
+
+def _secret() -> bytes:
+    # The development key is public, so links signed with it would let anyone fetch any object.
+    if settings.ENABLE_OAUTH and settings.SECRET_KEY == DEV_SECRET_KEY:
+        raise RuntimeError("SECRET_KEY must be set when ENABLE_OAUTH is on; refusing to sign media links.")
+    return settings.SECRET_KEY.encode()
+
+
+def _signature(gcs_uri: str, expires: int, user_email: str) -> str:
+    message = f"{gcs_uri}\n{expires}\n{user_email}".encode()
+    return hmac.new(_secret(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def media_url(gcs_uri: Optional[str], user_email: str) -> Optional[str]:
+    """
+    Returns a cheap reference to a GCS object that GET /api/media turns into a
+    signed URL on demand. The link is bound to the user it was issued to, and
+    expires on a fixed window boundary so repeated listings return the same
+    link and browsers can cache the redirect.
+    """
+    if not gcs_uri or not gcs_uri.startswith("gs://"):
+        return None
+    window = settings.MEDIA_LINK_TTL_SECONDS
+    expires = (int(time.time()) // window + 2) * window
+    query = urlencode({"uri": gcs_uri, "exp": expires, "sig": _signature(gcs_uri, expires, user_email)})
+    return f"{MEDIA_PATH}?{query}"
+
+
+def verify_media_link(gcs_uri: str, expires: int, signature: str, user_email: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(gcs_uri, expires, user_email))
+
+
+def parse_media_url(url: str, user_email: str) -> Optional[str]:
+    """
+    Returns the gcs_uri of a valid media link issued to user_email, or None if
+    url is not a media link. Raises ValueError for expired or forged links.
+    """
+    parsed = urlparse(url)
+    if parsed.path != MEDIA_PATH:
+        return None
+    params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+    try:
+        gcs_uri, expires, signature = params["uri"], int(params["exp"]), params["sig"]
+    except (KeyError, ValueError):
+        raise ValueError("Malformed media link.")
+    if not verify_media_link(gcs_uri, expires, signature, user_email):
+        raise ValueError("Media link is expired or invalid.")
+    return gcs_uri
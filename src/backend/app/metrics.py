@@ -0,0 +1,76 @@
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+# Upper bounds in seconds, from sub-second Imagen calls to long Veo operations.
+DEFAULT_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180, 300, 600, 1200, 1800)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Quantiles are estimated as the upper
+    bound of the bucket they fall in.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self._counts: List[int] = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def _quantile(self, fraction: float) -> Optional[float]:
+        if not self._count:
+            return None
+        rank = fraction * self._count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self._max
+        return self._max
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "count": self._count,
+                "avg": round(self._sum / self._count, 3) if self._count else None,
+                "p50": self._quantile(0.5),
+                "p95": self._quantile(0.95),
+                "max": round(self._max, 3) if self._count else None,
+                "buckets": {
+                    **{f"le_{bound:g}": count for bound, count in zip(self.buckets, self._counts)},
+                    "le_inf": self._counts[-1],
+                },
+            }
+
+
+class HistogramFamily:
+    """
+    Histograms keyed by a label such as the task function name.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(label)
+            if histogram is None:
+                histogram = self._histograms[label] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {label: histogram.snapshot() for label, histogram in sorted(histograms.items())}
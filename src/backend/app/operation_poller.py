@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import re
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+import requests
+
+from app.config import settings
+from app.credentials import get_credential_manager
+from app.dependencies import get_bq_client, get_genai_client
+from app.latency_model import LatencyKey, LatencyModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL_SECONDS = 15
+DEFAULT_POLL_TIMEOUT_SECONDS = 600
+
+
+class OperationPoller:
+    """
+    Tracks every pending long-running operation on one asyncio event loop.
+
+    The loop runs in a dedicated daemon thread, so worker threads can hand an
+    operation over with watch() and return to the pool immediately.
+
+    Operations watched with a latency key are polled on the schedule of the
+    latency model, which also learns from every operation that finishes.
+    Others are polled every poll_interval_seconds.
+
+    get_client returns the GenAI client for each poll, so a client rebuilt
+    after a failed health check is picked up by operations already in flight.
+    """
+
+    def __init__(self, get_client: Callable[[], Any], poll_interval_seconds: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                 latency_model: Optional[LatencyModel] = None):
+        self._get_client = get_client
+        self.poll_interval_seconds = poll_interval_seconds
+        self.latency_model = latency_model
+        self._pending = 0
+        self._polls = 0
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="operation-poller", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @property
+    def pending_count(self) -> int:
+        return self._pending
+
+    @property
+    def poll_count(self) -> int:
+        return self._polls
+
+    def watch(self, operation: Any, timeout_seconds: float = DEFAULT_POLL_TIMEOUT_SECONDS,
+              latency_key: Optional[LatencyKey] = None) -> Future:
+        """
+        Starts polling an operation and returns a future that resolves with the
+        finished operation, or raises TimeoutError after timeout_seconds.
+        latency_key selects the completion-time distribution used to schedule polls.
+        """
+        logger.info(f"Watching operation {operation.name}.")
+        return asyncio.run_coroutine_threadsafe(self._poll(operation, timeout_seconds, latency_key), self._loop)
+
+    def _next_delay(self, latency_key: Optional[LatencyKey], elapsed: float) -> float:
+        if self.latency_model and latency_key:
+            return self.latency_model.next_delay(latency_key, elapsed)
+        return self.poll_interval_seconds
+
+    async def _poll(self, operation: Any, timeout_seconds: float, latency_key: Optional[LatencyKey]) -> Any:
+        with self._lock:
+            self._pending += 1
+        try:
+            started_at = self._loop.time()
+            deadline = started_at + timeout_seconds
+            # Elapsed time of the last poll that still saw the operation running.
+            last_running = 0.0
+            elapsed = 0.0
+            polls = 0
+            while not operation.done:
+                now = self._loop.time()
+                if now >= deadline:
+                    raise TimeoutError(f"Polling timed out after {timeout_seconds}s.")
+                last_running = elapsed
+                # The last poll happens at the deadline rather than up to a full interval after it.
+                await asyncio.sleep(min(self._next_delay(latency_key, now - started_at), deadline - now))
+                operation = await self._get_client().aio.operations.get(operation)
+                elapsed = self._loop.time() - started_at
+                polls += 1
+            with self._lock:
+                self._polls += polls
+            if self.latency_model and latency_key and polls:
+                # The operation finished somewhere between the last two polls.
+                self.latency_model.record(latency_key, (last_running + elapsed) / 2)
+            logger.info(f"Operation {operation.name} finished after {elapsed:.0f}s and {polls} polls.")
+            return operation
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+def cancel_operation(operation_name: str):
+    """
+    Asks Vertex AI to stop a long-running operation.
+    The SDK has no cancel call, so this goes through the REST operations API.
+    Cancellation is best effort: the operation may still finish.
+    """
+    match = re.search(r"/locations/([^/]+)/", operation_name)
+    location = match.group(1) if match else settings.LOCATION
+    host = "aiplatform.googleapis.com" if location == "global" else f"{location}-aiplatform.googleapis.com"
+    # The shared credential manager keeps the token fresh, so no credentials are loaded per call.
+    token = get_credential_manager().credentials.token
+    response = requests.post(f"https://{host}/v1/{operation_name}:cancel",
+                             headers={"Authorization": f"Bearer {token}"}, timeout=10)
+    response.raise_for_status()
+    logger.info(f"Requested cancellation of operation {operation_name}.")
+
+
+def _seed_latency_model(latency_model: LatencyModel):
+    try:
+        latency_model.seed_from_history(get_bq_client(), settings.VEO_LATENCY_HISTORY_DAYS)
+    except Exception as e:
+        logger.warning(f"Could not seed latency model from BigQuery history: {e}")
+
+
+@lru_cache()
+def get_operation_poller() -> OperationPoller:
+    latency_model = None
+    if settings.VEO_ADAPTIVE_POLLING:
+        latency_model = LatencyModel(fallback_interval_seconds=settings.VEO_POLL_INTERVAL_SECONDS)
+        if settings.ENABLE_BIGQUERY_LOGGING:
+            # Seed in the background; until it finishes, polls use the fixed interval.
+            threading.Thread(target=_seed_latency_model, args=(latency_model,),
+                             name="latency-model-seed", daemon=True).start()
+    return OperationPoller(get_genai_client, poll_interval_seconds=settings.VEO_POLL_INTERVAL_SECONDS,
+                           latency_model=latency_model)
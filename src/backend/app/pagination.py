@@ -0,0 +1,132 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from app.config import settings
+
+
+def row_id_expression(*columns: str) -> str:
+    """
+    SQL for a stable INT64 id of a history row, from columns that tell apart rows
+    with the same trigger_time. It breaks ties in the keyset order.
+    """
+    parts = ", '|', ".join(f"IFNULL(CAST({column} AS STRING), '')" for column in columns)
+    return f"FARM_FINGERPRINT(CONCAT({parts}))"
+
+
+def encode_cursor(page_time: datetime, row_id: int) -> str:
+    payload = json.dumps([page_time.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Returns the (trigger_time, row_id) of the last row of the previous page.
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        page_time, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(page_time), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid page cursor.") from e
+
+
+class CountCache:
+    """
+    Row counts of history queries, keyed by the table and filters, kept for
+    `ttl_seconds`. Totals are estimates for pagination only, so rows logged
+    since the count was taken show up once the entry expires.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, count: int):
+        with self._lock:
+            self._entries[key] = (count, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@lru_cache()
+def get_count_cache() -> CountCache:
+    return CountCache(ttl_seconds=settings.HISTORY_COUNT_TTL_SECONDS, max_entries=settings.HISTORY_COUNT_CACHE_MAX_ENTRIES)
+
+
+def query_history_page(bq_client: bigquery.Client, source: str, columns: str, where_clauses: List[str],
+                       query_params: List[bigquery.ScalarQueryParameter], row_id: str, page_size: int,
+                       cursor: Optional[str] = None, page: int = 1) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+    """
+    Returns (rows, total, next_cursor) of one page of `source`, newest first.
+
+    Pages are read with keyset pagination on (trigger_time, row_id): a cursor
+    resumes right after the last row of the previous page, so every page costs
+    the same as the first. Without a cursor, `page` falls back to OFFSET
+    paging for older clients. `total` comes from the count cache and is only
+    recounted, in parallel with the page query, when it is missing.
+    """
+    filters = list(where_clauses)
+    params = list(query_params)
+    if cursor:
+        cursor_time, cursor_row_id = decode_cursor(cursor)
+        filters.append(f"(trigger_time < @cursor_time OR (trigger_time = @cursor_time AND {row_id} < @cursor_row_id))")
+        params.append(bigquery.ScalarQueryParameter("cursor_time", "TIMESTAMP", cursor_time))
+        params.append(bigquery.ScalarQueryParameter("cursor_row_id", "INT64", cursor_row_id))
+    where_sql = " AND ".join(filters) or "TRUE"
+    offset = (page - 1) * page_size if not cursor and page > 1 else 0
+
+    query = f"""
+        SELECT {columns}, trigger_time AS page_time, {row_id} AS page_row_id
+        FROM {source}
+        WHERE {where_sql}
+        ORDER BY page_time DESC, page_row_id DESC
+        LIMIT {page_size + 1}{f" OFFSET {offset}" if offset else ""}
+    """
+
+    count_key = (source, " AND ".join(where_clauses), tuple((p.name, str(p.value)) for p in query_params))
+    count_cache = get_count_cache()
+    total = count_cache.get(count_key)
+    count_job = None
+    if total is None:
+        count_job = bq_client.query(
+            f"SELECT COUNT(*) AS total FROM {source} WHERE {' AND '.join(where_clauses) or 'TRUE'}",
+            job_config=bigquery.QueryJobConfig(query_parameters=query_params)
+        )
+    page_job = bq_client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+
+    rows = [dict(row) for row in page_job.result()]
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]["page_time"], rows[-1]["page_row_id"])
+    for row in rows:
+        row.pop("page_time", None)
+        row.pop("page_row_id", None)
+
+    if count_job is not None:
+        total = list(count_job.result())[0].total
+        count_cache.put(count_key, total)
+    return rows, total, next_cursor
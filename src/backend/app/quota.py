@@ -0,0 +1,355 @@
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.config_manager import get_pricing_index
+
+logger = logging.getLogger(__name__)
+
+QUOTA_PERIODS = ("day", "week")
+# The longest window of QUOTA_PERIODS; older local records cannot count towards any quota.
+LONGEST_QUOTA_PERIOD_SECONDS = 7 * 24 * 3600
+
+# Settings naming the history tables whose successful rows, and their stored cost, count towards quota.
+QUOTA_TABLE_SETTINGS = ("HISTORY_TABLE", "IMAGEN_HISTORY_TABLE", "IMAGE_ENRICHMENT_HISTORY_TABLE")
+
+# (scope, key): "user" with a user email, or "project" with a creative project id.
+UsageKey = Tuple[str, str]
+
+
+def estimate_quota_cost(model: Optional[str], video_duration: Optional[int], with_audio: Optional[bool],
+                        usage_date: Optional[datetime] = None) -> float:
+    """
+    Cost of one video from the pricing config, as stored in the cost column of its history row.
+    """
+    price_info = get_pricing_index().price(model, usage_date or datetime.now(timezone.utc), 'video')
+    if not price_info or not video_duration:
+        return 0
+    price_key = 'video_with_audio' if with_audio else 'video_without_audio'
+    return price_info.get(price_key, 0) * video_duration
+
+
+def estimate_image_quota_cost(model: Optional[str], usage_date: Optional[datetime] = None) -> float:
+    """
+    Cost of one generated image from the pricing config, as stored in the cost column of its history row.
+    """
+    price_info = get_pricing_index().price(model, usage_date or datetime.now(timezone.utc), 'image')
+    return price_info.get('per_image', 0) if price_info else 0
+
+
+def estimate_enrichment_quota_cost(model: Optional[str], usage_date: Optional[datetime] = None) -> float:
+    """
+    Estimated cost of one enriched image. Its stored cost depends on the tokens
+    used, so the output is assumed to take ENRICHMENT_QUOTA_OUTPUT_TOKENS tokens.
+    """
+    price_info = get_pricing_index().price(model, usage_date or datetime.now(timezone.utc), 'image_enrichment')
+    if not price_info:
+        return 0
+    return price_info.get('cost_per_million_output_token', 0) * settings.ENRICHMENT_QUOTA_OUTPUT_TOKENS / 1_000_000
+
+
+def quota_tables(conf: dict) -> Tuple[str, ...]:
+    return tuple(conf[name] for name in QUOTA_TABLE_SETTINGS if conf.get(name))
+
+
+def _successful_rows(project: str, dataset: str, tables: Tuple[str, ...], columns: str, condition: str) -> str:
+    return "\n            UNION ALL\n            ".join(
+        f"SELECT {columns} FROM `{project}.{dataset}.{table}` WHERE status = 'SUCCESS' AND {condition}"
+        for table in tables
+    )
+
+
+@lru_cache(maxsize=64)
+def quota_usage_query(project: str, dataset: str, tables: Tuple[str, ...], scope: str, windowed: bool) -> str:
+    """
+    Query for the generation count and total stored cost of one user (scope
+    "user") or creative project ("project"), bound to @key, across the history
+    tables, since @start_time if windowed. The filters are applied in every
+    branch of the UNION ALL so each table is pruned on its own. The text is
+    built once per distinct arguments and only the parameters change, so every
+    check in a window sends BigQuery the same query.
+    """
+    condition = "creative_project_id = @key" if scope == "project" else "user_email = @key"
+    if windowed:
+        condition += " AND trigger_time >= @start_time"
+    return f"""
+        SELECT COUNT(*) AS generation_count, SUM(cost) AS total_cost
+        FROM (
+            {_successful_rows(project, dataset, tables, "cost", condition)}
+        )
+    """
+
+
+@lru_cache(maxsize=8)
+def _ledger_snapshot_query(project: str, dataset: str, tables: Tuple[str, ...]) -> str:
+    rows = _successful_rows(project, dataset, tables, "user_email, creative_project_id, trigger_time, cost",
+                            "trigger_time >= @start_time")
+    return f"""
+        SELECT
+            user_email,
+            creative_project_id,
+            DATE(trigger_time) AS day,
+            COUNT(*) AS generation_count,
+            SUM(cost) AS total_cost
+        FROM (
+            {rows}
+        )
+        GROUP BY user_email, creative_project_id, day
+    """
+
+
+def quota_window_start(period: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Start of the current quota window in UTC, or None for periods without a window.
+    """
+    now = now or datetime.now(timezone.utc)
+    if period == 'day':
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        start = now - timedelta(days=now.weekday())
+        return start.replace(hour=0, minute=0, second=0, microsecond=0)
+    return None
+
+
+def quota_exceeded(quota_type: str, limit, generation_count: int, total_cost: float,
+                   requested_count: int = 1, requested_cost: float = 0) -> bool:
+    """
+    True if the current usage plus the request does not fit in the quota.
+    A request may use the quota up exactly; once it is used up, nothing more fits.
+    """
+    return (quota_type == 'GENERATION_QUANTITY' and generation_count + requested_count > limit) or \
+           (quota_type == 'COST_LIMIT' and (total_cost >= limit or total_cost + requested_cost > limit))
+
+
+def _usage_keys(user_email: Optional[str], project_id: Optional[str]) -> List[UsageKey]:
+    keys = []
+    if user_email:
+        keys.append(("user", user_email))
+    if project_id:
+        keys.append(("project", project_id))
+    return keys
+
+
+class QuotaLedger:
+    """
+    Running totals of successful generations (count and stored cost) of every
+    history table per user and per creative project, by UTC day, for the
+    current week.
+
+    Totals are replaced by a BigQuery snapshot on every reconciliation and
+    updated in between as this process logs successful generations, so quota
+    checks never query BigQuery. Generations logged by other instances are
+    picked up at the next reconciliation.
+
+    In-flight generations hold reservations of their estimated count and cost,
+    which count towards usage until they are released: after the actual usage
+    has been recorded on success, or right away on failure or cancellation.
+    Reservations that are never released expire after `reservation_ttl_seconds`.
+    """
+
+    def __init__(self, reservation_ttl_seconds: float = 3600):
+        self.reservation_ttl_seconds = reservation_ttl_seconds
+        # reservation id -> (usage keys, count, cost, expires_at)
+        self._reservations: Dict[str, Tuple[List[UsageKey], int, float, float]] = {}
+        self._usage: Dict[UsageKey, Dict[date, List[float]]] = defaultdict(dict)
+        # Records logged locally, kept to be re-applied on top of a snapshot that may predate them.
+        self._recent: Deque[Tuple[float, UsageKey, date, int, float]] = deque()
+        self._lock = threading.Lock()
+        self.reconciled_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.reconciled_at is not None
+
+    def record(self, user_email: Optional[str], project_id: Optional[str], trigger_time: datetime,
+               cost: float, count: int = 1):
+        day = trigger_time.astimezone(timezone.utc).date()
+        now = time.time()
+        with self._lock:
+            # Without reconciliation (e.g. BigQuery logging disabled), this keeps the list bounded.
+            while self._recent and self._recent[0][0] < now - LONGEST_QUOTA_PERIOD_SECONDS:
+                self._recent.popleft()
+            for key in _usage_keys(user_email, project_id):
+                self._add(key, day, count, cost)
+                self._recent.append((now, key, day, count, cost))
+
+    def usage(self, scope: str, key: str, period: str) -> Optional[Tuple[int, float]]:
+        """
+        Returns (generation_count, total_cost) in the current window, or None if
+        the ledger is not loaded yet or cannot answer for the period.
+        """
+        if not self.loaded or period not in QUOTA_PERIODS:
+            return None
+        with self._lock:
+            return self._window_usage((scope, key), period)
+
+    def reserved(self, scope: str, key: str) -> Tuple[int, float]:
+        """
+        Returns (count, cost) held by unreleased reservations of the user or project.
+        """
+        with self._lock:
+            return self._reserved((scope, key))
+
+    def try_reserve(self, scope: str, key: str, period: str, quota_type: str, limit,
+                    user_email: Optional[str], project_id: Optional[str], amounts: List[Tuple[int, float]],
+                    committed: Optional[Tuple[int, float]] = None,
+                    committed_at: Optional[float] = None) -> Optional[List[str]]:
+        """
+        Atomically checks the quota of (scope, key) against its usage, including
+        other reservations, plus all `amounts` (count, cost), and reserves them
+        against the user and project. Returns one reservation id per amount, or
+        None if the quota would be exceeded. `committed` supplies the completed
+        usage when the ledger cannot answer for the period itself; records logged
+        locally since `committed_at`, when its query started, are added to it, as
+        their reservations may already be released.
+        """
+        requested_count = sum(count for count, _ in amounts)
+        requested_cost = sum(cost for _, cost in amounts)
+        with self._lock:
+            if committed is not None:
+                reserved_count, reserved_cost = self._reserved((scope, key))
+                recent_count, recent_cost = self._recorded_since((scope, key), period, committed_at)
+                usage = (committed[0] + reserved_count + recent_count, committed[1] + reserved_cost + recent_cost)
+            else:
+                usage = self._window_usage((scope, key), period)
+            if quota_type != 'NO_LIMIT' and quota_exceeded(quota_type, limit, usage[0], usage[1],
+                                                           requested_count, requested_cost):
+                return None
+            keys = _usage_keys(user_email, project_id)
+            expires_at = time.time() + self.reservation_ttl_seconds
+            reservation_ids = []
+            for count, cost in amounts:
+                reservation_id = uuid.uuid4().hex
+                self._reservations[reservation_id] = (keys, count, cost, expires_at)
+                reservation_ids.append(reservation_id)
+            return reservation_ids
+
+    def release(self, reservation_id: Optional[str]):
+        if not reservation_id:
+            return
+        with self._lock:
+            self._reservations.pop(reservation_id, None)
+
+    def _reserved(self, key: UsageKey) -> Tuple[int, float]:
+        now = time.time()
+        for reservation_id in [rid for rid, reservation in self._reservations.items() if reservation[3] <= now]:
+            logger.warning(f"Quota reservation {reservation_id} expired without being released.")
+            del self._reservations[reservation_id]
+        count, cost = 0, 0.0
+        for keys, reserved_count, reserved_cost, _ in self._reservations.values():
+            if key in keys:
+                count += reserved_count
+                cost += reserved_cost
+        return count, cost
+
+    def _recorded_since(self, key: UsageKey, period: str, since: Optional[float]) -> Tuple[int, float]:
+        if since is None:
+            return 0, 0.0
+        window_start = quota_window_start(period)
+        start = window_start.date() if window_start else None
+        count, cost = 0, 0.0
+        for recorded_at, recorded_key, day, recorded_count, recorded_cost in self._recent:
+            if recorded_at >= since and recorded_key == key and (start is None or day >= start):
+                count += recorded_count
+                cost += recorded_cost
+        return count, cost
+
+    def _window_usage(self, key: UsageKey, period: str) -> Tuple[int, float]:
+        start = quota_window_start(period).date()
+        totals = [totals for day, totals in self._usage.get(key, {}).items() if day >= start]
+        reserved_count, reserved_cost = self._reserved(key)
+        return (int(sum(count for count, _ in totals)) + reserved_count,
+                sum(cost for _, cost in totals) + reserved_cost)
+
+    def replace(self, rows: Iterable[Tuple[Optional[str], Optional[str], date, int, float]], snapshot_started_at: float):
+        """
+        Replaces the totals with a snapshot of (user_email, project_id, day, count, cost)
+        rows, then re-applies records logged locally since the snapshot started.
+        """
+        usage: Dict[UsageKey, Dict[date, List[float]]] = defaultdict(dict)
+        for user_email, project_id, day, count, cost in rows:
+            for key in _usage_keys(user_email, project_id):
+                totals = usage[key].setdefault(day, [0, 0.0])
+                totals[0] += count
+                totals[1] += cost
+
+        with self._lock:
+            while self._recent and self._recent[0][0] < snapshot_started_at:
+                self._recent.popleft()
+            self._usage = usage
+            for _, key, day, count, cost in self._recent:
+                self._add(key, day, count, cost)
+            self.reconciled_at = time.time()
+
+    def _add(self, key: UsageKey, day: date, count: int, cost: float):
+        totals = self._usage[key].setdefault(day, [0, 0.0])
+        totals[0] += count
+        totals[1] += cost
+
+
+@lru_cache()
+def get_quota_ledger() -> QuotaLedger:
+    return QuotaLedger(reservation_ttl_seconds=settings.QUOTA_RESERVATION_TTL_SECONDS)
+
+
+def reconcile_quota_ledger(bq_client) -> int:
+    """
+    Reloads the ledger from the history tables for the current week.
+    Queued history rows are flushed first so the snapshot includes them.
+    Returns the number of (user, project, day) groups loaded.
+    """
+    from google.cloud import bigquery
+    from app.bq_writer import get_bq_writer
+
+    snapshot_started_at = time.time()
+    get_bq_writer().flush(timeout=30)
+
+    # The week window always contains the day window.
+    start = quota_window_start('week')
+    query = _ledger_snapshot_query(settings.PROJECT_ID, settings.ANALYSIS_DATASET, quota_tables(settings.dict()))
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("start_time", "TIMESTAMP", start)]
+    )
+    rows = [
+        (row.user_email, row.creative_project_id, row.day, row.generation_count or 0, row.total_cost or 0)
+        for row in bq_client.query(query, job_config=job_config).result()
+    ]
+    get_quota_ledger().replace(rows, snapshot_started_at)
+    logger.info(f"Reconciled quota ledger with {len(rows)} usage groups since {start.isoformat()}.")
+    return len(rows)
+
+
+def _reconcile_periodically():
+    from app.dependencies import get_bq_client
+
+    while True:
+        try:
+            bq_client = get_bq_client()
+            if bq_client:
+                reconcile_quota_ledger(bq_client)
+        except Exception as e:
+            logger.error(f"Quota ledger reconciliation failed: {e}", exc_info=True)
+        time.sleep(settings.QUOTA_RECONCILE_SECONDS)
+
+
+_reconciler_lock = threading.Lock()
+_reconciler: Optional[threading.Thread] = None
+
+
+def start_quota_reconciliation():
+    """
+    Loads the ledger and keeps reconciling it every QUOTA_RECONCILE_SECONDS in a background thread.
+    """
+    global _reconciler
+    if not settings.ENABLE_BIGQUERY_LOGGING:
+        return
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = threading.Thread(target=_reconcile_periodically, name="quota-reconciler", daemon=True)
+            _reconciler.start()
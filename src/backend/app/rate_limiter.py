@@ -0,0 +1,137 @@
+import logging
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from google.api_core import exceptions as google_api_exceptions
+
+from app.config import settings
+from app.config_manager import get_models_config, get_image_models, get_image_enrichment_models
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` acquisitions per minute, with bursts of up to `burst`.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1, int(per_minute // 10))
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ModelLimit:
+    """
+    Concurrency and requests-per-minute limit for one model.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, qpm: Optional[float] = None, burst: Optional[int] = None):
+        self._semaphore = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._bucket = TokenBucket(qpm, burst) if qpm else None
+
+    def acquire(self):
+        if self._bucket:
+            self._bucket.acquire()
+        if self._semaphore:
+            self._semaphore.acquire()
+
+    def release(self):
+        if self._semaphore:
+            self._semaphore.release()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    True for Vertex AI quota errors (HTTP 429 / RESOURCE_EXHAUSTED) from either SDK.
+    """
+    if isinstance(error, (google_api_exceptions.TooManyRequests, google_api_exceptions.ResourceExhausted)):
+        return True
+    return getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+class RateLimiter:
+    """
+    Runs model calls under the per-model limits, retrying quota errors with
+    jittered exponential backoff. Models without a limit are only retried.
+
+    Backoff sleeps in the calling worker thread, so the time one call spends
+    backing off is capped at max_retry_seconds; past it the quota error is raised.
+    """
+
+    def __init__(self, limits: Dict[str, ModelLimit], max_retries: int,
+                 backoff_seconds: float, max_backoff_seconds: float,
+                 max_retry_seconds: Optional[float] = None):
+        self._limits = limits
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_retry_seconds = max_retry_seconds
+
+    def call(self, model_id: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        limit = self._limits.get(model_id)
+        attempt = 0
+        waited = 0.0
+        while True:
+            if limit:
+                limit.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                # Full jitter, so throttled callers do not retry in lockstep.
+                delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+                if self.max_retry_seconds is not None:
+                    if waited >= self.max_retry_seconds:
+                        raise
+                    delay = min(delay, self.max_retry_seconds - waited)
+                waited += delay
+                attempt += 1
+                logger.warning(f"Model {model_id} is rate limited. Retry {attempt}/{self.max_retries} in {delay:.1f}s.")
+            finally:
+                if limit:
+                    limit.release()
+            time.sleep(delay)
+
+
+def _load_limits() -> Dict[str, ModelLimit]:
+    limits = {}
+    for config in (get_models_config(), get_image_models(), get_image_enrichment_models()):
+        for model in config.get('models', []):
+            rate_limit = model.get('rate_limit')
+            if rate_limit:
+                limits[model['id']] = ModelLimit(
+                    concurrency=rate_limit.get('concurrency'),
+                    qpm=rate_limit.get('qpm'),
+                    burst=rate_limit.get('burst')
+                )
+    return limits
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    return RateLimiter(
+        _load_limits(),
+        max_retries=settings.RATE_LIMIT_MAX_RETRIES,
+        backoff_seconds=settings.RATE_LIMIT_BACKOFF_SECONDS,
+        max_backoff_seconds=settings.RATE_LIMIT_MAX_BACKOFF_SECONDS,
+        max_retry_seconds=settings.RATE_LIMIT_MAX_RETRY_SECONDS
+    )
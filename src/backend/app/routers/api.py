@@ -1,20 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
-from app.schemas import TaskStatus
+from app.schemas import TaskStatus, BatchStatus
 from app.services import GenerationService, get_generation_service, log_generation_to_bq, VeoApiClient
 from app.config import settings
-from app.dependencies import get_bq_client, get_config_db, get_prompt_gallery_db, get_shared_videos_db, get_groups_db, get_creative_projects_db, get_user
+from app.dependencies import get_bq_client, get_config_db, get_prompt_gallery_db, get_shared_videos_db, get_groups_db, get_creative_projects_db, get_user, get_storage_client, get_genai_client, get_veo_client
 from app.video_processing import check_quota, process_video_from_gcs
 from app.config_manager import get_project_config, save_project_config, save_bulk_project_configs, get_config, save_config, get_image_models, get_models_config
 from google.cloud import bigquery, firestore, storage
 import logging
 from datetime import datetime, timezone, timedelta
-from app.task_manager import get_task_status
+from app.media import media_url, verify_media_link
+from app.history import HISTORY_SELECT, HISTORY_SOURCES, history_source
+from app.pagination import query_history_page
+from app.signed_urls import get_url_signer
+from app.task_manager import get_task_status, get_batch_status, cancel_task, get_task_store_stats, get_executor_stats, get_task_metrics, subscribe_to_tasks, unsubscribe_from_tasks, TERMINAL_STATUSES
 from typing import Optional, List, Dict, Any
 from pathlib import Path
+import asyncio
 import json
 import re
 import uuid
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from google.cloud.firestore_v1.base_query import FieldFilter
 import google.genai as genai
 from google.genai import types
@@ -82,6 +88,70 @@ def get_notification_banner():
     """
     return JSONResponse({"messages": settings.BANNER_MESSAGES})
 
+TASK_STREAM_RECHECK_SECONDS = 15
+# A task whose record is gone (never existed or evicted) will not change again either.
+TASK_STREAM_FINAL_STATUSES = TERMINAL_STATUSES | {"not_found"}
+
+def _format_task_event(task_id: str, status: Dict[str, Any]) -> str:
+    payload = {"task_id": task_id, **TaskStatus(**status).dict()}
+    return f"event: task\ndata: {json.dumps(payload, default=str)}\n\n"
+
+@router.get("/tasks/stream", tags=["Tasks"])
+async def stream_task_status(request: Request, task_ids: str):
+    """
+    Streams status updates for one or more tasks as Server-Sent Events.
+    task_ids is a comma-separated list. The stream ends once every task has finished
+    or is not found.
+    """
+    requested_ids = [task_id.strip() for task_id in task_ids.split(',') if task_id.strip()]
+    if not requested_ids:
+        raise HTTPException(status_code=400, detail="task_ids is required.")
+
+    async def event_stream():
+        subscription = subscribe_to_tasks(requested_ids)
+        try:
+            # Send the current state first so late subscribers never miss a transition.
+            pending = {}
+            for task_id in requested_ids:
+                status = await run_in_threadpool(get_task_status, task_id)
+                yield _format_task_event(task_id, status)
+                if status["status"] not in TASK_STREAM_FINAL_STATUSES:
+                    pending[task_id] = status["status"]
+
+            while pending:
+                if await request.is_disconnected():
+                    break
+                try:
+                    task_id, status = await asyncio.wait_for(subscription.queue.get(), timeout=TASK_STREAM_RECHECK_SECONDS)
+                    updates = [(task_id, status)]
+                except asyncio.TimeoutError:
+                    # Tasks running on another worker never publish here, so re-read them from the store.
+                    updates = []
+                    for task_id in list(pending):
+                        status = await run_in_threadpool(get_task_status, task_id)
+                        if status["status"] != pending[task_id]:
+                            updates.append((task_id, status))
+                    if not updates:
+                        yield ": keep-alive\n\n"
+                        continue
+
+                for task_id, status in updates:
+                    if task_id not in pending:
+                        continue
+                    yield _format_task_event(task_id, status)
+                    if status["status"] in TASK_STREAM_FINAL_STATUSES:
+                        pending.pop(task_id)
+                    else:
+                        pending[task_id] = status["status"]
+        finally:
+            unsubscribe_from_tasks(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/tasks/{task_id}", tags=["Tasks"], response_model=TaskStatus)
 def get_task_status_endpoint(task_id: str):
     """
@@ -90,6 +160,187 @@ def get_task_status_endpoint(task_id: str):
     status = get_task_status(task_id)
     return TaskStatus(**status)
 
+@router.get("/batches/{batch_id}", tags=["Tasks"], response_model=BatchStatus)
+def get_batch_status_endpoint(batch_id: str, user: dict = Depends(get_user)):
+    """
+    Retrieves the status of a batch of generation tasks, with per-item progress.
+    Only the user who created the batch, or an admin, can read it.
+    """
+    if settings.ENABLE_OAUTH and not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    status = get_batch_status(batch_id)
+    if status["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    user_email = user.get('email', 'anonymous') if user else 'anonymous'
+    is_admin = user and user.get('role') == 'APP_ADMIN'
+    if status.get("owner") and status["owner"] != user_email and not is_admin:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return BatchStatus(**status)
+
+@router.delete("/tasks/{task_id}", tags=["Tasks"], response_model=TaskStatus)
+def cancel_task_endpoint(task_id: str, user: dict = Depends(get_user)):
+    """
+    Cancels a queued or running background task.
+    Only the user who started the task, or an admin, can cancel it.
+    """
+    if settings.ENABLE_OAUTH and not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    status = get_task_status(task_id)
+    if status["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    user_email = user.get('email', 'anonymous') if user else 'anonymous'
+    is_admin = user and user.get('role') == 'APP_ADMIN'
+    if status.get("owner") and status["owner"] != user_email and not is_admin:
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    if status["status"] in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Task has already finished with status {status['status']}.")
+
+    logger.info(f"User {user_email} cancelled task {task_id}.")
+    return TaskStatus(**cancel_task(task_id))
+
+@router.get("/admin/tasks/stats", tags=["Tasks"])
+def get_task_store_stats_endpoint(user: dict = Depends(get_user)):
+    """
+    Returns size and eviction counters of the task store. Admin only.
+    """
+    if not user or user.get('role') != 'APP_ADMIN':
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return get_task_store_stats()
+
+@router.get("/admin/tasks/executors", tags=["Tasks"])
+def get_executor_stats_endpoint(user: dict = Depends(get_user)):
+    """
+    Returns queue depth and worker counters of the background task pools. Admin only.
+    """
+    if not user or user.get('role') != 'APP_ADMIN':
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return get_executor_stats()
+
+@router.get("/admin/tasks/metrics", tags=["Tasks"])
+def get_task_metrics_endpoint(user: dict = Depends(get_user)):
+    """
+    Returns queue depth, worker counts and per-function queue/run time histograms. Admin only.
+    """
+    if not user or user.get('role') != 'APP_ADMIN':
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return get_task_metrics()
+
+@router.get("/media", tags=["Media"])
+def get_media(uri: str, exp: int, sig: str, user: dict = Depends(get_user)):
+    """
+    Redirects a media link issued by a list endpoint to a short-lived signed URL.
+    """
+    if settings.ENABLE_OAUTH and not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    user_email = user.get('email', 'anonymous') if user else 'anonymous'
+    if not verify_media_link(uri, exp, sig, user_email):
+        raise HTTPException(status_code=403, detail="Media link is expired or invalid.")
+
+    signed_url = get_url_signer().sign_url(uri)
+    if not signed_url:
+        raise HTTPException(status_code=500, detail="Failed to generate signed URL")
+    return RedirectResponse(
+        signed_url,
+        status_code=302,
+        headers={"Cache-Control": f"private, max-age={settings.MEDIA_REDIRECT_MAX_AGE_SECONDS}"}
+    )
+
+@router.get("/history", tags=["History"])
+def get_history(
+    user: dict = Depends(get_user),
+    asset_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    model: Optional[str] = None,
+    is_edited: Optional[bool] = False,
+    page: int = 1,
+    page_size: int = 10,
+    cursor: Optional[str] = None,
+    bq_client: bigquery.Client = Depends(get_bq_client),
+    creative_projects_db: firestore.Client = Depends(get_creative_projects_db)
+):
+    """
+    Returns the user's video, image and image enrichment history as one
+    time-ordered stream, read with a single UNION ALL query per page.
+    asset_type is a comma-separated subset of video, image and image_enrichment.
+    """
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required.")
+    if not settings.ENABLE_BIGQUERY_LOGGING or not bq_client:
+        logger.warning(f"Attempted to access history for {user.get('email')} but BigQuery is disabled.")
+        return JSONResponse({"rows": [], "total": 0, "next_cursor": None}, status_code=200)
+
+    asset_types = [value.strip() for value in asset_type.split(",") if value.strip()] if asset_type else None
+    unknown = [value for value in asset_types or [] if value not in HISTORY_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown asset_type: {', '.join(unknown)}.")
+
+    user_email = user.get('email')
+
+    query_params = [bigquery.ScalarQueryParameter("user_email", "STRING", user_email)]
+    where_clauses = ["user_email = @user_email"]
+
+    if start_date:
+        where_clauses.append("trigger_time >= @start_date")
+        query_params.append(bigquery.ScalarQueryParameter("start_date", "TIMESTAMP", start_date))
+    if end_date:
+        end_date_inclusive = (datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc) + timedelta(days=1)).isoformat()
+        where_clauses.append("trigger_time < @end_date")
+        query_params.append(bigquery.ScalarQueryParameter("end_date", "TIMESTAMP", end_date_inclusive))
+    if status:
+        where_clauses.append("status = @status")
+        query_params.append(bigquery.ScalarQueryParameter("status", "STRING", status))
+    if model:
+        where_clauses.append("model_used = @model")
+        query_params.append(bigquery.ScalarQueryParameter("model", "STRING", model))
+    if is_edited:
+        where_clauses.append("model_used LIKE 'EDITING_TOOL_%'")
+
+    try:
+        # The filters are applied inside every branch of the union, so none are left for the outer query.
+        rows, total_rows, next_cursor = query_history_page(
+            bq_client, history_source(asset_types, where_clauses), f"asset_type, {HISTORY_SELECT}", [], query_params,
+            "row_id", page_size, cursor=cursor, page=page
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error querying history for user {user_email}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to retrieve history.")
+
+    project_ids = {row['creative_project_id'] for row in rows if row.get('creative_project_id')}
+    project_names = {}
+    if creative_projects_db and project_ids:
+        project_refs = [creative_projects_db.collection('projects').document(pid) for pid in project_ids]
+        for doc in creative_projects_db.get_all(project_refs):
+            if doc.exists:
+                project_names[doc.id] = doc.to_dict().get('name')
+
+    for row in rows:
+        # Drop the columns of the other asset types so each row looks like its own history endpoint's.
+        for name in [name for name, value in row.items() if value is None]:
+            del row[name]
+        if row['asset_type'] == 'video':
+            try:
+                gcs_paths = json.loads(row.get("output_video_gcs_paths") or "[]")
+            except (json.JSONDecodeError, TypeError):
+                gcs_paths = []
+            row["signed_urls"] = [url for url in (media_url(uri, user_email) for uri in gcs_paths) if url]
+            row["video_name"] = Path(gcs_paths[0]).name if gcs_paths else None
+        elif row.get("output_image_gcs_path"):
+            row["signed_url"] = media_url(row["output_image_gcs_path"], user_email)
+        if row.get('creative_project_id'):
+            row['project_name'] = project_names.get(row['creative_project_id'])
+
+    return JSONResponse({"rows": rows, "total": total_rows, "next_cursor": next_cursor})
+
 @router.get("/configurations", tags=["Configuration"])
 def get_configurations(user: dict = Depends(get_user), config_db: firestore.Client = Depends(get_config_db)):
     
@@ -107,7 +358,7 @@ async def set_configurations(request: Request, user: dict = Depends(get_user), c
     return {"message": "Configuration saved successfully."}
 
 @router.get("/gcs/videos", tags=["GCS"])
-def list_user_videos(user: dict = Depends(get_user), prefix: Optional[str] = None):
+def list_user_videos(user: dict = Depends(get_user), prefix: Optional[str] = None, storage_client: storage.Client = Depends(get_storage_client)):
     """
     Lists all video files in the user's GCS folder, optionally filtered by a prefix.
     """
@@ -120,20 +371,17 @@ def list_user_videos(user: dict = Depends(get_user), prefix: Optional[str] = Non
     search_prefix = prefix if prefix else f"veo_outputs/{user_folder}/"
 
     try:
-        storage_client = storage.Client(project=settings.PROJECT_ID)
         bucket = storage_client.bucket(settings.VIDEO_BUCKET_NAME)
         blobs = bucket.list_blobs(prefix=search_prefix)
 
         videos = []
-        veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
         for blob in blobs:
             if blob.name.lower().endswith(('.mp4', '.mov', '.avi', '.mkv')):
                 gcs_uri = f"gs://{settings.VIDEO_BUCKET_NAME}/{blob.name}"
-                signed_url = veo_client.generate_signed_gcs_url(gcs_uri)
                 videos.append({
                     "name": blob.name,
                     "gcs_uri": gcs_uri,
-                    "signed_url": signed_url
+                    "signed_url": media_url(gcs_uri, user_email)
                 })
         
         return JSONResponse({"videos": videos, "prefix": search_prefix})
@@ -220,7 +468,7 @@ def delete_prompt_from_gallery(prompt_id: str, user: dict = Depends(get_user), p
     return JSONResponse({"message": "Prompt deleted successfully"})
 
 @router.post("/images/upload", tags=["Image Upload"])
-async def upload_image_endpoint(user: dict = Depends(get_user), file: UploadFile = File(...)):
+async def upload_image_endpoint(user: dict = Depends(get_user), file: UploadFile = File(...), storage_client: storage.Client = Depends(get_storage_client)):
     """
     Uploads an image to GCS and returns its URI.
     """
@@ -234,7 +482,6 @@ async def upload_image_endpoint(user: dict = Depends(get_user), file: UploadFile
     user_folder = re.sub(r'[^a-zA-Z0-9_.-]', '_', user_email).lower()
     
     try:
-        storage_client = storage.Client(project=settings.PROJECT_ID)
         bucket = storage_client.bucket(settings.VIDEO_BUCKET_NAME)
         
         file_extension = Path(file.filename).suffix
@@ -256,7 +503,7 @@ async def upload_image_endpoint(user: dict = Depends(get_user), file: UploadFile
         raise HTTPException(status_code=500, detail=f"Image upload failed: {e}")
 
 @router.post("/videos/edit", tags=["Video Editing"])
-async def edit_video_endpoint(request: Request, user: dict = Depends(get_user)):
+async def edit_video_endpoint(request: Request, user: dict = Depends(get_user), veo_client: VeoApiClient = Depends(get_veo_client)):
     """
     Edits a video based on the provided parameters (e.g., clipping).
     """
@@ -300,7 +547,6 @@ async def edit_video_endpoint(request: Request, user: dict = Depends(get_user)):
             output_video_gcs_paths=[processed_gcs_uri]
         )
 
-        veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
         signed_url = veo_client.generate_signed_gcs_url(processed_gcs_uri)
 
         return JSONResponse({
@@ -315,7 +561,7 @@ async def edit_video_endpoint(request: Request, user: dict = Depends(get_user)):
 
 
 @router.post("/videos/dub", tags=["Video Editing"])
-async def dub_video_endpoint(request: Request, user: dict = Depends(get_user)):
+async def dub_video_endpoint(request: Request, user: dict = Depends(get_user), veo_client: VeoApiClient = Depends(get_veo_client)):
     """
     Adds a text-to-speech voiceover to a video.
     """
@@ -357,7 +603,6 @@ async def dub_video_endpoint(request: Request, user: dict = Depends(get_user)):
             output_video_gcs_paths=[processed_gcs_uri]
         )
 
-        veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
         signed_url = veo_client.generate_signed_gcs_url(processed_gcs_uri)
 
         return JSONResponse({
@@ -663,7 +908,6 @@ def get_project_assets(project_id: str, user: dict = Depends(get_user), creative
 
     assets_ref = project_ref.collection('assets').order_by('added_at', direction=firestore.Query.DESCENDING)
     assets = []
-    veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
     for doc in assets_ref.stream():
         asset_data = doc.to_dict()
         asset_data["id"] = doc.id
@@ -687,10 +931,7 @@ def get_project_assets(project_id: str, user: dict = Depends(get_user), creative
                 except (json.JSONDecodeError, TypeError):
                     pass
         
-        if gcs_uri:
-            asset_data['signed_url'] = veo_client.generate_signed_gcs_url(gcs_uri)
-        else:
-            asset_data['signed_url'] = None
+        asset_data['signed_url'] = media_url(gcs_uri, user.get('email'))
         
         assets.append(asset_data)
 
@@ -742,7 +983,7 @@ async def import_groups(request: Request, user: dict = Depends(get_user), groups
 
 
 @router.get("/teamgallery/{group_id}/items", tags=["Team Gallery"])
-def get_shared_items(group_id: str, user: dict = Depends(get_user), groups_db: firestore.Client = Depends(get_groups_db), shared_videos_db: firestore.Client = Depends(get_shared_videos_db)):
+def get_shared_items(group_id: str, user: dict = Depends(get_user), groups_db: firestore.Client = Depends(get_groups_db), shared_videos_db: firestore.Client = Depends(get_shared_videos_db), veo_client: VeoApiClient = Depends(get_veo_client)):
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     if not groups_db or not shared_videos_db:
@@ -756,7 +997,6 @@ def get_shared_items(group_id: str, user: dict = Depends(get_user), groups_db: f
     items_ref = shared_videos_db.collection(settings.SHARED_VIDEOS_COLLECTION).where(filter=FieldFilter('shared_with_group_id', '==', group_id)).order_by('shared_at', direction=firestore.Query.DESCENDING)
     
     items = []
-    veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
     
     for doc in items_ref.stream():
         item_data = doc.to_dict()
@@ -1152,13 +1392,13 @@ def get_top_users_analytics(
 async def generate_prompt_from_images(
     character_image: Optional[UploadFile] = File(None),
     background_image: Optional[UploadFile] = File(None),
-    prop_image: Optional[UploadFile] = File(None)
+    prop_image: Optional[UploadFile] = File(None),
+    client: genai.Client = Depends(get_genai_client)
 ):
     if not character_image and not background_image and not prop_image:
         raise HTTPException(status_code=400, detail="At least one image must be provided.")
 
     try:
-        client = genai.Client(vertexai=True, project=settings.PROJECT_ID, location=settings.LOCATION)
         
         parts = []
         prompt_text = "Describe a scene based on the following images: "
@@ -1211,7 +1451,7 @@ async def generate_prompt_from_images(
 
 
 @router.post("/translate", tags=["Translation"])
-async def translate_text_endpoint(request: Request, user: dict = Depends(get_user)):
+async def translate_text_endpoint(request: Request, user: dict = Depends(get_user), genai_client: genai.Client = Depends(get_genai_client)):
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
@@ -1223,7 +1463,6 @@ async def translate_text_endpoint(request: Request, user: dict = Depends(get_use
         raise HTTPException(status_code=400, detail="Text and target_language are required.")
 
     try:
-        genai_client = genai.Client(vertexai=True, project=settings.PROJECT_ID, location=settings.LOCATION)
         response = genai_client.models.generate_content(
             model = "gemini-2.5-flash",
             contents=[
@@ -1,18 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from app.config import settings
 from app.dependencies import get_storage_client, get_user
+from app.media import parse_media_url
+from app.signed_urls import get_url_signer
 from google.cloud import storage
-import cv2
-import numpy as np
 import requests
 import os
 import uuid
 import tempfile
 import logging
-import time
-from datetime import timedelta
-import google.auth
-from google.auth.transport.requests import Request as GoogleAuthRequest
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -22,19 +18,7 @@ class SignUrlRequest(dict):
         self.gcs_uri = gcs_uri
 
 def generate_signed_url(blob, expiration_minutes=60):
-    try:
-        creds, _ = google.auth.default(scopes=['https://www.googleapis.com/auth/cloud-platform'])
-        creds.refresh(GoogleAuthRequest())
-        return blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=expiration_minutes),
-            method="GET",
-            service_account_email=creds.service_account_email,
-            access_token=creds.token,
-        )
-    except Exception as e:
-        logger.error(f"Failed to generate signed URL: {e}")
-        return ""
+    return get_url_signer().sign_url(f"gs://{blob.bucket.name}/{blob.name}", expiration_minutes)
 
 @router.post("/sign_url")
 async def sign_url_endpoint(
@@ -91,8 +75,14 @@ async def capture_frame(
                 tmp.write(content)
             elif video_url:
                 # Download video from URL
-                # If it's a GCS URL, we might need to sign it or use storage client, 
-                # but here we assume it's a signed URL or public URL provided by frontend
+                # Media links from the history endpoints are resolved to a signed URL here;
+                # anything else is assumed to be a signed URL or public URL provided by frontend
+                try:
+                    media_gcs_uri = parse_media_url(video_url, user_email)
+                except ValueError as e:
+                    raise HTTPException(status_code=403, detail=str(e))
+                if media_gcs_uri:
+                    video_url = get_url_signer().sign_url(media_gcs_uri)
                 response = requests.get(video_url, stream=True)
                 response.raise_for_status()
                 for chunk in response.iter_content(chunk_size=8192):
@@ -100,7 +90,8 @@ async def capture_frame(
             else:
                 raise HTTPException(status_code=400, detail="Either video_file or video_url must be provided")
 
-        # Capture frame using OpenCV
+        # Capture frame using OpenCV, imported here to keep it out of application startup
+        import cv2
         cap = cv2.VideoCapture(temp_video_path)
         if not cap.isOpened():
             raise HTTPException(status_code=500, detail="Failed to open video file")
@@ -1,31 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from app.schemas import VideoGenerationRequest, TaskResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from app.schemas import VideoGenerationRequest, VideoBatchRequest, TaskResponse, BatchResponse
 from app.services import GenerationService, get_generation_service
 from app.config import settings
 from app.dependencies import get_bq_client, get_config_db, get_creative_projects_db, get_shared_videos_db
-from app.video_processing import check_quota
+from app.video_processing import reserve_quota
+from app.quota import estimate_quota_cost, get_quota_ledger
 from app.config_manager import get_project_config, get_config
 from google.cloud import bigquery, firestore
-from app.dependencies import get_user
+from app.dependencies import get_user, get_veo_client
 from app.services import VeoApiClient
+from app.media import media_url
+from app.pagination import query_history_page, row_id_expression
 import logging
 from datetime import datetime, timezone, timedelta
-from app.task_manager import create_task
+from app.task_manager import create_task, create_batch, build_request_key, claim_request, release_request, run_task_call, IdempotencyConflictError
 from typing import Optional
 import json
+import uuid
 from pathlib import Path
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+def _quota_amount(request: VideoGenerationRequest):
+    """
+    Estimated (count, cost) of a generation request, as counted once its videos are logged.
+    """
+    sample_count = request.sampleCount or 1
+    return sample_count, sample_count * estimate_quota_cost(request.model, request.duration, request.generateAudio)
+
 @router.post("/generate", response_model=TaskResponse)
 async def generate_video_endpoint(
     request: VideoGenerationRequest,
     user: dict = Depends(get_user),
     generation_service: GenerationService = Depends(get_generation_service),
     bq_client: bigquery.Client = Depends(get_bq_client),
-    config_db: firestore.Client = Depends(get_config_db)
+    config_db: firestore.Client = Depends(get_config_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if settings.ENABLE_OAUTH and not user:
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -33,28 +46,121 @@ async def generate_video_endpoint(
     user_email = user.get('email', 'anonymous') if user else 'anonymous'
     logger.info(f"Received video generation request from user: {user_email} with prompt: '{request.prompt[:50]}...'")
 
-    project_id = request.creative_project_id
-    project_config = get_project_config(config_db, project_id) if project_id else None
-    quota_exceeded, message = check_quota(user_email, bq_client, get_config(config_db), settings.dict(), project_id, project_config)
-    if quota_exceeded:
-        logger.warning(f"Quota exceeded for user {user_email}: {message}")
-        raise HTTPException(status_code=429, detail=message)
-
-    logger.info("Submitting video generation task to the background processor.")
-
-    task_id = create_task(
-        generation_service.generate_video,
-        on_success=generation_service.on_video_generation_success,
-        on_error=lambda e, **kwargs: generation_service.on_generation_error(e, asset_type="veo", **kwargs),
-        prompt=request.prompt,
-        user_info=user,
-        body=request.dict(),
-        trigger_time=datetime.now(timezone.utc)
-    )
-    logger.info(f"Task {task_id} created for video generation.")
+    # Double-clicks and client retries get the task of the original request instead of new paid work.
+    request_key, fingerprint = build_request_key(user_email, "videos/generate", request.dict(), idempotency_key)
+    task_id = str(uuid.uuid4())
+    try:
+        window_seconds = settings.IDEMPOTENCY_WINDOW_SECONDS if idempotency_key else settings.DUPLICATE_REQUEST_WINDOW_SECONDS
+        existing_task_id = await run_task_call(claim_request, request_key, fingerprint, task_id, window_seconds)
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if existing_task_id:
+        logger.info(f"Duplicate video generation request from user {user_email}. Returning task {existing_task_id}.")
+        return TaskResponse(task_id=existing_task_id)
+
+    # A request that fails before its task exists frees its claim and any quota it reserved.
+    reservation_ids = []
+    try:
+        # The quota check reads Firestore and may query BigQuery, so it runs off the event loop.
+        project_id = request.creative_project_id
+        global_config = await run_in_threadpool(get_config, config_db)
+        project_config = await run_in_threadpool(get_project_config, config_db, project_id) if project_id else None
+        quota_exceeded, message, reservation_ids = await run_in_threadpool(
+            reserve_quota, user_email, bq_client, global_config, settings.dict(), project_id, project_config,
+            [_quota_amount(request)]
+        )
+        if quota_exceeded:
+            logger.warning(f"Quota exceeded for user {user_email}: {message}")
+            raise HTTPException(status_code=429, detail=message)
+
+        logger.info("Submitting video generation task to the background processor.")
+
+        task_id = await run_task_call(
+            create_task,
+            generation_service.generate_video,
+            on_success=generation_service.on_video_generation_success,
+            on_error=lambda e, **kwargs: generation_service.on_generation_error(e, asset_type="veo", **kwargs),
+            prompt=request.prompt,
+            user_info=user,
+            owner=user_email,
+            task_id=task_id,
+            body=request.dict(),
+            trigger_time=datetime.now(timezone.utc),
+            quota_reservation_id=reservation_ids[0]
+        )
+        logger.info(f"Task {task_id} created for video generation.")
+    except Exception:
+        await run_task_call(release_request, request_key)
+        for reservation_id in reservation_ids:
+            get_quota_ledger().release(reservation_id)
+        raise
 
     return TaskResponse(task_id=task_id)
 
+@router.post("/batch", response_model=BatchResponse)
+async def generate_video_batch_endpoint(
+    request: VideoBatchRequest,
+    user: dict = Depends(get_user),
+    generation_service: GenerationService = Depends(get_generation_service),
+    bq_client: bigquery.Client = Depends(get_bq_client),
+    config_db: firestore.Client = Depends(get_config_db)
+):
+    if settings.ENABLE_OAUTH and not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="At least one request is required.")
+    if len(request.requests) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {settings.BATCH_MAX_ITEMS} requests.")
+
+    user_email = user.get('email', 'anonymous') if user else 'anonymous'
+    logger.info(f"Received video batch of {len(request.requests)} requests from user: {user_email}")
+
+    # One reservation per request, checked per creative project against all of its requests.
+    global_config = await run_in_threadpool(get_config, config_db)
+    requests_by_project = {}
+    for index, item in enumerate(request.requests):
+        requests_by_project.setdefault(item.creative_project_id, []).append(index)
+    reservation_ids = [None] * len(request.requests)
+    for project_id, indexes in requests_by_project.items():
+        project_config = await run_in_threadpool(get_project_config, config_db, project_id) if project_id else None
+        quota_exceeded, message, project_reservation_ids = await run_in_threadpool(
+            reserve_quota, user_email, bq_client, global_config, settings.dict(), project_id, project_config,
+            [_quota_amount(request.requests[index]) for index in indexes]
+        )
+        if quota_exceeded:
+            for reservation_id in reservation_ids:
+                get_quota_ledger().release(reservation_id)
+            logger.warning(f"Quota exceeded for user {user_email} on batch of {len(indexes)} videos: {message}")
+            raise HTTPException(status_code=429, detail=message)
+        for index, reservation_id in zip(indexes, project_reservation_ids):
+            reservation_ids[index] = reservation_id
+
+    trigger_time = datetime.now(timezone.utc)
+    items = [
+        {
+            "target_func": generation_service.generate_video,
+            "on_success": generation_service.on_video_generation_success,
+            "on_error": lambda e, **kwargs: generation_service.on_generation_error(e, asset_type="veo", **kwargs),
+            "kwargs": {
+                "prompt": item.prompt,
+                "user_info": user,
+                "body": item.dict(),
+                "trigger_time": trigger_time,
+                "quota_reservation_id": reservation_id,
+            },
+        }
+        for item, reservation_id in zip(request.requests, reservation_ids)
+    ]
+    batch_id, task_ids = await run_task_call(
+        create_batch,
+        items,
+        max_concurrency=min(request.max_concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY),
+        owner=user_email
+    )
+    logger.info(f"Batch {batch_id} created for video generation.")
+
+    return BatchResponse(batch_id=batch_id, task_ids=task_ids)
+
 @router.get("/history")
 def get_user_history(
     request: Request,
@@ -66,6 +172,7 @@ def get_user_history(
     is_edited: Optional[bool] = False,
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
     bq_client: bigquery.Client = Depends(get_bq_client),
     creative_projects_db: firestore.Client = Depends(get_creative_projects_db)
 ):
@@ -96,17 +203,7 @@ def get_user_history(
     if is_edited:
         where_clauses.append("model_used LIKE 'EDITING_TOOL_%'")
 
-    count_query = f"""
-        SELECT COUNT(*) as total
-        FROM `{settings.PROJECT_ID}.{settings.ANALYSIS_DATASET}.{settings.HISTORY_TABLE}`
-        WHERE {" AND ".join(where_clauses)}
-    """
-    count_job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-    count_query_job = bq_client.query(count_query, job_config=count_job_config)
-    total_rows = list(count_query_job.result())[0].total
-
-    query = f"""
-        SELECT
+    columns = """
             user_email,
             CAST(trigger_time AS STRING) AS trigger_time,
             CAST(completion_time AS STRING) AS completion_time,
@@ -121,17 +218,16 @@ def get_user_history(
             last_frame_gcs_uri,
             resolution,
             creative_project_id
-        FROM
-            `{settings.PROJECT_ID}.{settings.ANALYSIS_DATASET}.{settings.HISTORY_TABLE}`
-        WHERE {" AND ".join(where_clauses)} ORDER BY trigger_time DESC
-        LIMIT {page_size} OFFSET {(page - 1) * page_size}
     """
-    
-    job_config = bigquery.QueryJobConfig(query_parameters=query_params)
 
     try:
-        query_job = bq_client.query(query, job_config=job_config)
-        rows = [dict(row) for row in query_job.result()]
+        rows, total_rows, next_cursor = query_history_page(
+            bq_client,
+            f"`{settings.PROJECT_ID}.{settings.ANALYSIS_DATASET}.{settings.HISTORY_TABLE}`",
+            columns, where_clauses, query_params,
+            row_id_expression("completion_time", "output_video_gcs_paths", "status"),
+            page_size, cursor=cursor, page=page
+        )
 
         project_ids = {row['creative_project_id'] for row in rows if row.get('creative_project_id')}
         project_names = {}
@@ -142,13 +238,12 @@ def get_user_history(
                 if doc.exists:
                     project_names[doc.id] = doc.to_dict().get('name')
 
-        veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
         for row in rows:
             gcs_paths_str = row.get("output_video_gcs_paths", "[]")
             try:
                 gcs_paths = json.loads(gcs_paths_str)
-                signed_urls = [veo_client.generate_signed_gcs_url(uri) for uri in gcs_paths]
-                row["signed_urls"] = [url for url in signed_urls if url]
+                media_urls = [media_url(uri, user_email) for uri in gcs_paths]
+                row["signed_urls"] = [url for url in media_urls if url]
                 if gcs_paths:
                     row["video_name"] = Path(gcs_paths[0]).name
                 else:
@@ -160,8 +255,10 @@ def get_user_history(
             if row.get('creative_project_id'):
                 row['project_name'] = project_names.get(row['creative_project_id'])
 
-        return JSONResponse({"rows": rows, "total": total_rows})
+        return JSONResponse({"rows": rows, "total": total_rows, "next_cursor": next_cursor})
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error querying history for user {user_email}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve history.")
@@ -222,7 +319,8 @@ async def search_similarity_video(
     request: Request,
     user: dict = Depends(get_user),
     bq_client: bigquery.Client = Depends(get_bq_client),
-    creative_projects_db: firestore.Client = Depends(get_creative_projects_db)
+    creative_projects_db: firestore.Client = Depends(get_creative_projects_db),
+    veo_client: VeoApiClient = Depends(get_veo_client)
 ):
     body = await request.json()
     text = body.get("text")
@@ -271,7 +369,6 @@ async def search_similarity_video(
                 if doc.exists:
                     project_names[doc.id] = doc.to_dict().get('name')
 
-        veo_client = VeoApiClient(settings.PROJECT_ID, settings.LOCATION, settings.VIDEO_BUCKET_NAME)
         for row in rows:
             gcs_paths_str = row.get("output_video_gcs_paths", "[]")
             try:
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class VideoGenerationRequest(BaseModel):
     prompt: str
@@ -25,9 +25,21 @@ class ImageGenerationRequest(BaseModel):
     image_size: Optional[str] = "1024x1024"
     creative_project_id: Optional[str] = None
 
+class VideoBatchRequest(BaseModel):
+    requests: List[VideoGenerationRequest]
+    max_concurrency: Optional[int] = None
+
+class ImageBatchRequest(BaseModel):
+    requests: List[ImageGenerationRequest]
+    max_concurrency: Optional[int] = None
+
 class TaskResponse(BaseModel):
     task_id: str
 
+class BatchResponse(BaseModel):
+    batch_id: str
+    task_ids: List[str]
+
 class VideoData(BaseModel):
     gcs_uri: str
     signed_url: str
@@ -71,3 +83,15 @@ class TaskStatus(BaseModel):
     status: str
     result: Optional[dict] = None
     error: Optional[str] = None
+    queued_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+
+class BatchItemStatus(TaskStatus):
+    task_id: str
+
+class BatchStatus(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    counts: Dict[str, int]
+    items: List[BatchItemStatus]
@@ -1,3 +1,5 @@
+import asyncio
+import threading
 import time
 import uuid
 import re
@@ -5,6 +7,7 @@ import json
 import yaml
 from pathlib import Path
 import tempfile
+from functools import lru_cache
 from typing import Dict, Any, Optional, List, Tuple
 from app.config import settings
 from app.dependencies import get_genai_client, get_imagen_client, get_storage_client
@@ -14,19 +17,28 @@ import google.genai as genai
 from google.genai import types
 import google.auth
 from google.auth.transport.requests import Request as GoogleAuthRequest
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import logging
-from google.cloud import bigquery, firestore
+from google.cloud import firestore
 from google.cloud.firestore_v1.vector import Vector
 from app.prompts import IMAGE_ENRICHMENT_PROMPT_PREFIX, IMAGE_ENRICHMENT_PROMPT_SUFFIX, IMAGE_ENRICHMENT_PROMPT_COMBINATION, IMAGE_DESC_SYSTEM_PROMPT
 from PIL import Image
 from io import BytesIO
-import vertexai
-from vertexai.vision_models import Image as VisionImage, Video as VisionVideo, MultiModalEmbeddingModel
 from google.api_core import exceptions as google_api_exceptions
+from app.operation_poller import get_operation_poller, cancel_operation
+from app.latency_model import video_latency_key
+from app.rate_limiter import get_rate_limiter
+from app.signed_urls import get_url_signer
+from app.bq_writer import get_bq_writer
+from app.quota import estimate_quota_cost, get_quota_ledger
+from app.task_manager import DeferredResult, TaskCancelledError, register_resumer
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL_ID = "multimodalembedding@001"
+# Wait before retrying to load the embedding model after a failure.
+EMBEDDING_MODEL_RETRY_SECONDS = 300
+
 generate_content_config = types.GenerateContentConfig(
     temperature=0,
     top_p=1,
@@ -117,10 +129,12 @@ def add_asset_to_creative_project(project_id: str, asset_data: Dict[str, Any], u
 
 
 def log_generation_to_bq(asset_type: str, **kwargs):
+    """
+    Queues a history row for the background BigQuery writer; returns without waiting for the insert.
+    """
     if not settings.ENABLE_BIGQUERY_LOGGING:
         return
 
-    bq_client = bigquery.Client(project=settings.PROJECT_ID)
     if asset_type == "imgen":
         table_name = settings.IMAGEN_HISTORY_TABLE
     elif asset_type == "veo":
@@ -142,9 +156,16 @@ def log_generation_to_bq(asset_type: str, **kwargs):
         else:
             serialized_kwargs[k] = v
 
-    errors = bq_client.insert_rows_json(table_id, [serialized_kwargs])
-    if errors:
-        logging.error(f"Encountered errors while inserting rows: {errors}")
+    get_bq_writer().submit(table_id, serialized_kwargs)
+
+    # Quota is counted over successful rows of every history table, at their stored cost.
+    if kwargs.get('status') == "SUCCESS" and isinstance(kwargs.get('trigger_time'), datetime):
+        get_quota_ledger().record(
+            kwargs.get('user_email'),
+            kwargs.get('creative_project_id'),
+            kwargs['trigger_time'],
+            kwargs.get('cost') or 0
+        )
 
 
 class VeoApiClient:
@@ -171,22 +192,7 @@ class VeoApiClient:
             raise ConnectionError(f"GCP Authentication or GCS/GenAI connection failed: {e}")
 
     def generate_signed_gcs_url(self, gcs_uri: str, expiration_minutes: int = 60) -> str:
-        if not gcs_uri or not gcs_uri.startswith("gs://"):
-            return ""
-        try:
-            bucket_name, blob_name = gcs_uri[5:].split("/", 1)
-            bucket = self.storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
-            return blob.generate_signed_url(
-                version="v4",
-                expiration=timedelta(minutes=expiration_minutes),
-                method="GET",
-                service_account_email=self._credentials.service_account_email,
-                access_token=self._credentials.token,
-            )
-        except Exception as e:
-            self.logger.error(f"Failed to generate signed URL for {gcs_uri}: {e}", exc_info=True)
-            return ""
+        return get_url_signer().sign_url(gcs_uri, expiration_minutes)
 
 
 class GenerationService:
@@ -194,20 +200,52 @@ class GenerationService:
         self.genai_client = genai_client
         self.imagen_client = imagen_client
         self.storage_client = storage_client
-        try:
-            vertexai.init(project=settings.PROJECT_ID, location=settings.LOCATION_MULTIMODAL_EMBEDDING_MODEL)
-            self.embedding_model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
-            logger.info("MultiModalEmbeddingModel initialized successfully.")
-        except Exception as e:
-            logger.error(f"Failed to initialize MultiModalEmbeddingModel: {e}", exc_info=True)
-            self.embedding_model = None
+        self._embedding_model = None
+        self._embedding_model_failed_at: Optional[float] = None
+        self._embedding_model_lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        """
+        The multimodal embedding model, loaded on first use. Returns None if it
+        cannot be loaded; loading is retried after EMBEDDING_MODEL_RETRY_SECONDS.
+        """
+        if self._embedding_model is not None:
+            return self._embedding_model
+        with self._embedding_model_lock:
+            if self._embedding_model is None and not self._embedding_model_backing_off():
+                try:
+                    # The Vertex AI SDK is slow to import, so it is only loaded with the model.
+                    import vertexai
+                    from vertexai.vision_models import MultiModalEmbeddingModel
+
+                    vertexai.init(project=settings.PROJECT_ID, location=settings.LOCATION_MULTIMODAL_EMBEDDING_MODEL)
+                    self._embedding_model = MultiModalEmbeddingModel.from_pretrained(EMBEDDING_MODEL_ID)
+                    self._embedding_model_failed_at = None
+                    logger.info("MultiModalEmbeddingModel initialized successfully.")
+                except Exception as e:
+                    logger.error(f"Failed to initialize MultiModalEmbeddingModel: {e}", exc_info=True)
+                    self._embedding_model_failed_at = time.monotonic()
+            return self._embedding_model
+
+    def _embedding_model_backing_off(self) -> bool:
+        return (self._embedding_model_failed_at is not None
+                and time.monotonic() - self._embedding_model_failed_at < EMBEDDING_MODEL_RETRY_SECONDS)
+
+    def warm_up(self):
+        """
+        Loads the embedding model ahead of the first generation callback.
+        """
+        self.embedding_model
 
     def _generate_asset_description(self, gcs_uri: str, mime_type: str, prompt_text: str) -> str:
         try:
             logger.info(f"Generating description for {gcs_uri} using model {settings.GEMINI_MODEL}.")
             asset_part = types.Part.from_uri(file_uri=gcs_uri, mime_type=mime_type)
 
-            response = self.genai_client.models.generate_content(
+            response = get_rate_limiter().call(
+                settings.GEMINI_MODEL,
+                self.genai_client.models.generate_content,
                 model=settings.GEMINI_MODEL,
                 contents=[prompt_text, asset_part],
                 config=generate_content_config
@@ -221,40 +259,17 @@ class GenerationService:
             raise
 
     def _generate_signed_urls(self, gcs_uris: List[str]) -> Dict[str, str]:
-        """Generates signed URLs for a list of GCS URIs."""
+        """Generates signed URLs for a list of GCS URIs, reusing cached ones."""
         if not gcs_uris:
             return {}
-
-        try:
-            credentials, _ = google.auth.default(scopes=['https://www.googleapis.com/auth/cloud-platform'])
-            credentials.refresh(GoogleAuthRequest())
-        except Exception as e:
-            logger.error(f"Failed to refresh credentials for signing URLs: {e}")
-            return {}
-
-        signed_urls = {}
-        for uri in gcs_uris:
-            try:
-                bucket_name, blob_name = uri[5:].split("/", 1)
-                bucket = self.storage_client.bucket(bucket_name)
-                blob = bucket.blob(blob_name)
-                url = blob.generate_signed_url(
-                    version="v4",
-                    expiration=timedelta(minutes=60),
-                    method="GET",
-                    service_account_email=credentials.service_account_email,
-                    access_token=credentials.token,
-                )
-                signed_urls[uri] = url
-            except Exception as e:
-                logger.error(f"Failed to generate signed URL for {uri}: {e}")
-                signed_urls[uri] = ""
-        return signed_urls
+        return get_url_signer().sign_urls(gcs_uris)
 
     def generate_video_embedding(self, gcs_uri: str) -> dict:
         """
         Generates a description and embeddings for a single video.
         """
+        from vertexai.vision_models import Video as VisionVideo
+
         logger.info(f"Starting to process video: {gcs_uri}")
 
         if not isinstance(gcs_uri, str) or not gcs_uri.startswith("gs://"):
@@ -265,7 +280,9 @@ class GenerationService:
 
         try:
             logger.info(f"Generating embeddings for {gcs_uri}.")
-            embeddings = self.embedding_model.get_embeddings(
+            embeddings = get_rate_limiter().call(
+                EMBEDDING_MODEL_ID,
+                self.embedding_model.get_embeddings,
                 video=VisionVideo.load_from_file(gcs_uri),
                 contextual_text=description[:1000]
             )
@@ -285,6 +302,8 @@ class GenerationService:
         """
         Generates a description and embeddings for a single image.
         """
+        from vertexai.vision_models import Image as VisionImage
+
         logger.info(f"Starting to process image: {gcs_uri}")
 
         if not isinstance(gcs_uri, str) or not gcs_uri.startswith("gs://"):
@@ -296,7 +315,9 @@ class GenerationService:
 
         try:
             logger.info(f"Generating embeddings for {gcs_uri}.")
-            embeddings = self.embedding_model.get_embeddings(
+            embeddings = get_rate_limiter().call(
+                EMBEDDING_MODEL_ID,
+                self.embedding_model.get_embeddings,
                 image=VisionImage.load_from_file(gcs_uri),
                 contextual_text=description[:1000]
             )
@@ -314,6 +335,13 @@ class GenerationService:
 
     def on_video_generation_success(self, result: Dict[str, Any], **kwargs):
         """Callback for successful video generation."""
+        try:
+            self._log_video_generation(result, **kwargs)
+        finally:
+            # The logged videos now count towards the quota in place of the reservation.
+            get_quota_ledger().release(kwargs.get('quota_reservation_id'))
+
+    def _log_video_generation(self, result: Dict[str, Any], **kwargs):
         if "error" in result:
             logger.error(f"Video generation failed, processing error callback. Error: {result['error']}")
             self.on_generation_error(
@@ -333,18 +361,13 @@ class GenerationService:
         op_duration = result.get("duration", 0)
         revised_prompt = result.get("revisedPrompt")
 
-        completion_time = datetime.now(timezone.utc)
+        completion_time = kwargs.get('completion_time') or datetime.now(timezone.utc)
         user_email = user_info.get('email', 'anonymous') if user_info else 'anonymous'
 
         model_id = body.get('model')
         video_duration = body.get('duration')
         with_audio = body.get('generateAudio', False)
-        price_info = get_price_for_model(model_id, trigger_time, 'video')
-        cost = 0
-        if price_info and video_duration:
-            price_key = 'video_with_audio' if with_audio else 'video_without_audio'
-            price_per_second = price_info.get(price_key, 0)
-            cost = price_per_second * video_duration
+        cost = estimate_quota_cost(model_id, video_duration, with_audio, trigger_time)
 
         for video in video_data:
             path = video['gcs_uri']
@@ -399,6 +422,13 @@ class GenerationService:
 
     def on_image_generation_success(self, result: Dict[str, Any], **kwargs):
         """Callback for successful image generation."""
+        try:
+            self._log_image_generation(result, **kwargs)
+        finally:
+            # The logged images now count towards the quota in place of the reservation.
+            get_quota_ledger().release(kwargs.get('quota_reservation_id'))
+
+    def _log_image_generation(self, result: Dict[str, Any], **kwargs):
         logger.info("Image generation succeeded. Processing results.")
         user_info = kwargs.get('user_info')
         body = kwargs.get('body')
@@ -408,7 +438,7 @@ class GenerationService:
         image_data = result.get("images", [])
         op_duration = result.get("duration", 0)
 
-        completion_time = datetime.now(timezone.utc)
+        completion_time = kwargs.get('completion_time') or datetime.now(timezone.utc)
         user_email = user_info.get('email', 'anonymous') if user_info else 'anonymous'
 
         model_id = body.get('model')
@@ -463,6 +493,12 @@ class GenerationService:
 
     def on_image_enrichment_success(self, result: Dict[str, Any], **kwargs):
         """Callback for successful image enrichment."""
+        try:
+            self._log_image_enrichment(result, **kwargs)
+        finally:
+            get_quota_ledger().release(kwargs.get('quota_reservation_id'))
+
+    def _log_image_enrichment(self, result: Dict[str, Any], **kwargs):
         logger.info("Image enrichment succeeded. Processing results.")
         user_info = kwargs.get('user_info')
         creative_project_id = kwargs.get('creative_project_id')
@@ -476,7 +512,7 @@ class GenerationService:
         input_token = result.get("input_token", 0)
         output_token = result.get("output_token", 0)
 
-        completion_time = datetime.now(timezone.utc)
+        completion_time = kwargs.get('completion_time') or datetime.now(timezone.utc)
         user_email = user_info.get('email', 'anonymous') if user_info else 'anonymous'
 
         price_info = get_price_for_model(model, trigger_time, 'image_enrichment')
@@ -540,23 +576,25 @@ class GenerationService:
     def on_generation_error(self, error: Exception, asset_type: str, **kwargs):
         """Generic callback for failed generation tasks."""
         logger.error(f"Generation task failed. Logging error. Error: {error}", exc_info=False)
+        get_quota_ledger().release(kwargs.get('quota_reservation_id'))
         user_info = kwargs.get('user_info')
         body = kwargs.get('body', {})
         prompt = kwargs.get('prompt') or body.get('prompt')
         trigger_time = kwargs.get('trigger_time')
         user_email = user_info.get('email', 'anonymous') if user_info else 'anonymous'
+        status = "CANCELLED" if isinstance(error, TaskCancelledError) else "FAILURE"
 
         if asset_type == "imgen":
             log_generation_to_bq(
                 asset_type='imgen',
                 user_email=user_email,
                 trigger_time=trigger_time,
-                completion_time=datetime.now(timezone.utc),
+                completion_time=kwargs.get('completion_time') or datetime.now(timezone.utc),
                 operation_duration=0,
                 prompt=prompt,
                 negative_prompt=body.get('negative_prompt'),
                 model_used=kwargs.get('model') or body.get('model'),
-                status="FAILURE",
+                status=status,
                 error_message=str(error),
                 aspect_ratio=body.get('aspect_ratio'),
                 resolution=kwargs.get('image_size') or body.get('image_size'),
@@ -567,11 +605,11 @@ class GenerationService:
                 asset_type='veo',
                 user_email=user_email,
                 trigger_time=trigger_time,
-                completion_time=datetime.now(timezone.utc),
+                completion_time=kwargs.get('completion_time') or datetime.now(timezone.utc),
                 operation_duration=0,
                 prompt=prompt,
                 model_used=body.get('model'),
-                status="FAILURE",
+                status=status,
                 error_message=str(error),
                 video_duration=body.get('duration'),
                 with_audio=body.get('generateAudio', False),
@@ -588,11 +626,11 @@ class GenerationService:
                 asset_type='image_enrichment',
                 user_email=user_email,
                 trigger_time=trigger_time,
-                completion_time=datetime.now(timezone.utc),
+                completion_time=kwargs.get('completion_time') or datetime.now(timezone.utc),
                 operation_duration=0,
                 prompt=prompt,
                 model_used=kwargs.get('model'),
-                status="FAILURE",
+                status=status,
                 error_message=str(error),
                 resolution=kwargs.get('image_size'),
                 creative_project_id=kwargs.get('creative_project_id')
@@ -645,7 +683,7 @@ class GenerationService:
             prompt: str,
             user_info: Optional[Dict[str, Any]],
             **kwargs
-    ) -> Dict[str, Any]:
+    ) -> DeferredResult:
         start_time = time.time()
         body = kwargs.get('body', {})
         model_id = body.get('model')
@@ -712,24 +750,69 @@ class GenerationService:
                 person_generation=types.PersonGeneration.ALLOW_ALL
             )
 
-        operation = self.genai_client.models.generate_videos(
+        operation = get_rate_limiter().call(
+            model_id,
+            self.genai_client.models.generate_videos,
             model=model_id,
             prompt=prompt,
             config=config,
             **sdk_call_kwargs
         )
 
-        poll_timeout_seconds = 600
-        polling_start = time.monotonic()
-        while not operation.done:
-            elapsed_polling_time = time.monotonic() - polling_start
-            if elapsed_polling_time > poll_timeout_seconds:
-                raise TimeoutError(f"Polling timed out after {poll_timeout_seconds}s.")
-            time.sleep(15)
-            operation = self.genai_client.operations.get(operation)
+        # Everything needed to finish the task in another process if this one dies.
+        resume = {
+            "kind": "veo",
+            "operation_name": operation.name,
+            "output_gcs_prefix": output_gcs_prefix,
+            "start_time": start_time,
+            "reference_image_gcs_uris": reference_image_gcs_uris,
+            "image_gcs_uri": image_gcs_uri,
+            "final_frame_gcs_uri": final_frame_gcs_uri,
+            "kwargs": {
+                "prompt": prompt,
+                "user_info": user_info,
+                "body": body,
+                "trigger_time": kwargs['trigger_time'].isoformat() if kwargs.get('trigger_time') else None,
+            },
+        }
+        return self._defer_video_operation(operation, resume, latency_key=video_latency_key(body))
 
-        # print(operation)
+    def resume_video_operation(self, resume: Dict[str, Any]) -> DeferredResult:
+        """
+        Re-attaches to a Veo operation started by a process that has since died.
+        """
+        logger.info(f"Resuming Veo operation {resume['operation_name']}.")
+        operation = types.GenerateVideosOperation(name=resume["operation_name"])
+        # The elapsed time seen by this poller is not the operation's, so it must not train the latency model.
+        return self._defer_video_operation(operation, resume, latency_key=None)
+
+    def _defer_video_operation(self, operation, resume: Dict[str, Any], latency_key) -> DeferredResult:
+        # Hand the operation to the shared poller so this worker thread is released immediately.
+        body = resume["kwargs"]["body"]
+        return DeferredResult(
+            get_operation_poller().watch(operation, latency_key=latency_key),
+            finalize=lambda finished_operation: self._build_video_result(
+                finished_operation,
+                start_time=resume["start_time"],
+                reference_image_gcs_uris=resume["reference_image_gcs_uris"],
+                image_gcs_uri=resume["image_gcs_uri"],
+                final_frame_gcs_uri=resume["final_frame_gcs_uri"],
+                body=body
+            ),
+            on_cancel=lambda: cancel_operation(operation.name),
+            resume=resume
+        )
 
+    def _build_video_result(
+            self,
+            operation,
+            start_time: float,
+            reference_image_gcs_uris: Optional[List[str]],
+            image_gcs_uri: Optional[str],
+            final_frame_gcs_uri: Optional[str],
+            **kwargs
+    ) -> Dict[str, Any]:
+        """Builds the task result for a finished video generation operation."""
         if operation.error:
             error_str = str(operation.error)
             rai_reasons = self._parse_rai_reason_from_error(error_str)
@@ -819,7 +902,9 @@ class GenerationService:
         user_email = user_info.get('email', 'anonymous') if user_info else 'anonymous'
 
         try:
-            images = self.imagen_client.models.generate_images(
+            images = get_rate_limiter().call(
+                model_used,
+                self.imagen_client.models.generate_images,
                 model=model_used,
                 prompt=prompt,
                 config=types.GenerateImagesConfig(
@@ -932,7 +1017,9 @@ class GenerationService:
         contents.append(types.Part.from_text(text=sub_prompt))
         contents.extend(image_parts)
 
-        response = self.genai_client.models.generate_content(
+        response = get_rate_limiter().call(
+            model,
+            self.genai_client.models.generate_content,
             model=model,
             contents=contents,
             config=types.GenerateContentConfig(
@@ -979,7 +1066,9 @@ class GenerationService:
                     if upscale_factor:
                         try:
                             # Upscale Image
-                            upscale = self.genai_client.models.upscale_image(
+                            upscale = get_rate_limiter().call(
+                                "imagen-4.0-upscale-preview",
+                                self.genai_client.models.upscale_image,
                                 model="imagen-4.0-upscale-preview",
                                 image=types.Image(image_bytes=image_bytes),
                                 upscale_factor=upscale_factor,
@@ -1031,7 +1120,11 @@ class GenerationService:
             image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/png")
             full_prompt = f"{prompt}"
             
-            response = self.genai_client.models.generate_content(
+            # Run in a thread so rate-limit waits and retries do not block the event loop.
+            response = await asyncio.to_thread(
+                get_rate_limiter().call,
+                settings.GEMINI_MODEL,
+                self.genai_client.models.generate_content,
                 model=settings.GEMINI_MODEL,
                 contents=[full_prompt, image_part],
                 config=generate_content_config_image_desc
@@ -1042,5 +1135,26 @@ class GenerationService:
             raise
 
 
+@lru_cache()
 def get_generation_service() -> GenerationService:
     return GenerationService(get_genai_client(), get_imagen_client(), get_storage_client())
+
+
+def _resume_video_task(resume: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Continues a video task from its persisted context, including BigQuery logging
+    and creative project writes in the success callback.
+    """
+    generation_service = get_generation_service()
+    task_kwargs = dict(resume["kwargs"])
+    if task_kwargs.get("trigger_time"):
+        task_kwargs["trigger_time"] = datetime.fromisoformat(task_kwargs["trigger_time"])
+    return {
+        "target_func": lambda **_: generation_service.resume_video_operation(resume),
+        "on_success": generation_service.on_video_generation_success,
+        "on_error": lambda e, **kwargs: generation_service.on_generation_error(e, asset_type="veo", **kwargs),
+        "kwargs": task_kwargs,
+    }
+
+
+register_resumer("veo", _resume_video_task)
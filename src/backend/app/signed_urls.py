@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import settings
+from app.credentials import CredentialManager, get_credential_manager
+
+logger = logging.getLogger(__name__)
+
+# Expired entries are dropped in bulk at most this often; lookups drop them individually.
+EXPIRY_SWEEP_SECONDS = 60
+
+
+class SignedUrlCache:
+    """
+    Process-wide cache of signed GCS URLs. UrlSigner keys entries by
+    (gcs_uri, expiration_minutes), so callers asking for different lifetimes
+    never share a URL.
+
+    A cached URL is only returned while it has at least `min_remaining_seconds`
+    of lifetime left. Entries are evicted least-recently-used first once
+    `max_entries` is reached, and dropped when they expire.
+    """
+
+    def __init__(self, max_entries: int, min_remaining_seconds: float):
+        self.max_entries = max_entries
+        self.min_remaining_seconds = min_remaining_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + EXPIRY_SWEEP_SECONDS
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            entry = self._entries.get(key)
+            if entry and entry[1] - now >= self.min_remaining_seconds:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def put(self, key: Hashable, url: str, expiration_seconds: float):
+        if not url:
+            return
+        with self._lock:
+            self._entries[key] = (url, time.monotonic() + expiration_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "misses": self._misses}
+
+    def _sweep(self, now: float):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + EXPIRY_SWEEP_SECONDS
+        for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+
+@lru_cache()
+def get_signed_url_cache() -> SignedUrlCache:
+    return SignedUrlCache(
+        max_entries=settings.SIGNED_URL_CACHE_MAX_ENTRIES,
+        min_remaining_seconds=settings.SIGNED_URL_MIN_REMAINING_SECONDS
+    )
+
+
+class UrlSigner:
+    """
+    Signs V4 GET URLs for GCS objects, reusing cached URLs.
+
+    With `signing_credentials` (credentials holding a private key, such as a
+    service account key file) URLs are signed locally in microseconds.
+    Otherwise each URL is signed remotely through IAM signBlob with the
+    managed access token, and cache misses are signed in parallel.
+    """
+
+    def __init__(self, storage_client, url_cache: SignedUrlCache,
+                 credential_manager: Optional[CredentialManager] = None,
+                 signing_credentials=None, parallelism: int = 16):
+        if signing_credentials is None and credential_manager is None:
+            raise ValueError("Either signing_credentials or a credential_manager is required.")
+        self.storage_client = storage_client
+        self.url_cache = url_cache
+        self.credential_manager = credential_manager
+        self.signing_credentials = signing_credentials
+        self._pool = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="url-signer") \
+            if signing_credentials is None else None
+
+    @property
+    def signs_locally(self) -> bool:
+        return self.signing_credentials is not None
+
+    def sign_url(self, gcs_uri: str, expiration_minutes: int = 60) -> str:
+        return self.sign_urls([gcs_uri], expiration_minutes).get(gcs_uri, "")
+
+    def sign_urls(self, gcs_uris: Iterable[str], expiration_minutes: int = 60) -> Dict[str, str]:
+        """
+        Returns {gcs_uri: signed_url} for every gs:// URI. Failed signings map to "".
+        """
+        signed_urls = {}
+        missing = []
+        for uri in dict.fromkeys(gcs_uris):
+            if not uri or not uri.startswith("gs://"):
+                continue
+            url = self.url_cache.get((uri, expiration_minutes))
+            if url is None:
+                missing.append(uri)
+            else:
+                signed_urls[uri] = url
+        if not missing:
+            return signed_urls
+
+        if self.signs_locally:
+            sign = lambda uri: self._sign(uri, expiration_minutes, credentials=self.signing_credentials)
+            urls = map(sign, missing)
+        else:
+            try:
+                credentials = self.credential_manager.credentials
+            except Exception as e:
+                logger.error(f"Failed to refresh credentials for signing URLs: {e}")
+                return {**signed_urls, **{uri: "" for uri in missing}}
+            sign = lambda uri: self._sign(
+                uri, expiration_minutes,
+                service_account_email=credentials.service_account_email,
+                access_token=credentials.token,
+            )
+            urls = self._pool.map(sign, missing) if len(missing) > 1 else map(sign, missing)
+
+        for uri, url in zip(missing, urls):
+            signed_urls[uri] = url
+            self.url_cache.put((uri, expiration_minutes), url, expiration_minutes * 60)
+        return signed_urls
+
+    def _sign(self, gcs_uri: str, expiration_minutes: int, **signing_kwargs) -> str:
+        try:
+            bucket_name, blob_name = gcs_uri[5:].split("/", 1)
+            blob = self.storage_client.bucket(bucket_name).blob(blob_name)
+            return blob.generate_signed_url(
+                version="v4",
+                expiration=timedelta(minutes=expiration_minutes),
+                method="GET",
+                **signing_kwargs
+            )
+        except Exception as e:
+            logger.error(f"Failed to generate signed URL for {gcs_uri}: {e}")
+            return ""
+
+
+def _load_signing_credentials(credential_manager: CredentialManager):
+    """
+    Returns credentials that can sign locally: SIGNING_KEY_FILE if set, else the
+    default credentials when they are a service account key, else None.
+    """
+    from google.oauth2 import service_account
+
+    if settings.SIGNING_KEY_FILE:
+        return service_account.Credentials.from_service_account_file(settings.SIGNING_KEY_FILE)
+    if isinstance(credential_manager.credentials, service_account.Credentials):
+        return credential_manager.credentials
+    return None
+
+
+@lru_cache()
+def get_url_signer() -> UrlSigner:
+    from app.dependencies import get_storage_client
+
+    credential_manager = get_credential_manager()
+    signing_credentials = _load_signing_credentials(credential_manager)
+    logger.info(f"Signing URLs {'locally' if signing_credentials else 'through IAM signBlob'}.")
+    return UrlSigner(
+        get_storage_client(),
+        get_signed_url_cache(),
+        credential_manager=credential_manager,
+        signing_credentials=signing_credentials,
+        parallelism=settings.SIGNING_PARALLELISM
+    )
@@ -1,21 +1,272 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Any, Callable, Optional
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+from typing import Dict, Any, Callable, Deque, Iterable, List, Optional, Set, Tuple
 import logging
+from app.config import settings
+from app.metrics import HistogramFamily
+from app.task_store import ACTIVE_STATUSES, TaskStore, build_task_store
+from starlette.concurrency import run_in_threadpool
 
 logger = logging.getLogger(__name__)
 
 # ==============================================================================
-# 1. In-Memory Task Store
+# 1. Task Store and Executors
 # ==============================================================================
 
-# Using a simple dictionary for in-memory task tracking.
-# In a production environment, consider a more persistent store like Redis or a database.
-_task_store: Dict[str, Dict[str, Any]] = {}
-_executor = ThreadPoolExecutor(max_workers=4) # Adjust max_workers as needed
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """
+    Thread pool that keeps queue depth and wait time counters.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._max_queued = 0
+        self._total_wait_seconds = 0.0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        enqueued_at = time.monotonic()
+
+        def run():
+            with self._stats_lock:
+                self._queued -= 1
+                self._active += 1
+                self._total_wait_seconds += time.monotonic() - enqueued_at
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        with self._stats_lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        try:
+            future = super().submit(run)
+        except RuntimeError:
+            with self._stats_lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        # A cancelled future never reaches run(), so take it off the queue here.
+        if future.cancelled():
+            with self._stats_lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "max_queued": self._max_queued,
+                "avg_wait_seconds": round(self._total_wait_seconds / self._completed, 3) if self._completed else 0.0,
+            }
+
+
+# Keys of batch and idempotency records, which live in the task store next to the tasks.
+BATCH_KEY_PREFIX = "batch:"
+IDEMPOTENCY_KEY_PREFIX = "idem:"
+
+# The backend is selected by TASK_STORE_BACKEND (see app/task_store.py).
+# Use a shared backend (sqlite/firestore) when running more than one worker.
+# Batch and idempotency records are kept when the store is full, since their tasks may still run.
+_task_store: TaskStore = build_task_store(pinned_prefixes=(BATCH_KEY_PREFIX, IDEMPOTENCY_KEY_PREFIX))
+# Generation work and post-processing callbacks (embeddings, BigQuery, creative projects)
+# run on separate pools, so slow callbacks never hold up new generations.
+_executor = InstrumentedExecutor("generation", max_workers=settings.TASK_WORKER_COUNT)
+_callback_executor = InstrumentedExecutor("callbacks", max_workers=settings.CALLBACK_WORKER_COUNT)
+
+# Per-function time spent waiting for a worker, and from start to final status.
+_queued_seconds = HistogramFamily()
+_run_seconds = HistogramFamily()
+
+TERMINAL_STATUSES = {"SUCCESS", "FAILURE", "CANCELLED"}
+
+
+class TaskCancelledError(Exception):
+    """
+    Passed to on_error when a task is cancelled before it finishes.
+    """
+
+
+class DeferredResult:
+    """
+    Returned by a target function whose work continues outside the worker thread,
+    e.g. a long-running operation tracked by the operation poller.
+
+    The task stays RUNNING and the worker thread is released. When the future
+    resolves, finalize(outcome) runs on the executor to build the task result.
+    If the task is cancelled, on_cancel() is called to stop the remote work and
+    the future is still awaited; without on_cancel the future is cancelled.
+
+    resume is a JSON-serializable context, with a "kind" registered through
+    register_resumer, that lets another process finish the task if this one dies.
+    """
+
+    def __init__(self, future: Future, finalize: Optional[Callable[[Any], Any]] = None,
+                 on_cancel: Optional[Callable[[], None]] = None, resume: Optional[Dict[str, Any]] = None):
+        self.future = future
+        self.finalize = finalize
+        self.on_cancel = on_cancel
+        self.resume = resume
+
+    def cancel(self):
+        if not self.on_cancel:
+            self.future.cancel()
+            return
+        # Stopping remote work is best effort, so the future is still awaited: the
+        # work may finish anyway and then has to be accounted for.
+        try:
+            self.on_cancel()
+        except Exception as e:
+            logger.warning(f"Failed to cancel deferred work: {e}")
+
+
+class _TaskHandle:
+    """
+    In-process bookkeeping for a task that has not finished yet.
+    """
+
+    def __init__(self, owner: Optional[str]):
+        self.owner = owner
+        self.future: Optional[Future] = None
+        self.deferred: Optional[DeferredResult] = None
+        self.cancelled = False
+        self.finished = False
+        self.on_cancel: Optional[Callable[[], None]] = None
+
+
+_task_handles: Dict[str, _TaskHandle] = {}
+# Batch items waiting for a slot, by task ID. Whoever pops an item (launching or
+# cancelling it) owns it, so its callbacks run exactly once.
+_pending_batch_items: Dict[str, Dict[str, Any]] = {}
+_handles_lock = threading.Lock()
+
+# Resumable tasks carry a lease that this process renews while it is alive.
+# Once the lease expires, any process sharing the task store may resume the task.
+RESUME_LEASE_SECONDS = 120
+_WORKER_ID = str(uuid.uuid4())
+_leased_tasks: Set[str] = set()
 
 # ==============================================================================
-# 2. Task Management Functions
+# 2. Task Status Events
+# ==============================================================================
+
+class TaskSubscription:
+    """
+    Receives status updates for a set of task IDs on the subscriber's event loop.
+    """
+
+    def __init__(self, task_ids: Iterable[str], loop: asyncio.AbstractEventLoop):
+        self.task_ids: Set[str] = set(task_ids)
+        self.queue: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+        self._loop = loop
+
+    def push(self, task_id: str, record: Dict[str, Any]):
+        # Called from worker threads; hand the update over to the subscriber's loop.
+        self._loop.call_soon_threadsafe(self.queue.put_nowait, (task_id, record))
+
+
+class TaskEventBroker:
+    """
+    Fans out task status transitions to subscribers in this process.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, List[TaskSubscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_ids: Iterable[str]) -> TaskSubscription:
+        """
+        Must be called from a running event loop.
+        """
+        subscription = TaskSubscription(task_ids, asyncio.get_running_loop())
+        with self._lock:
+            for task_id in subscription.task_ids:
+                self._subscriptions.setdefault(task_id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: TaskSubscription):
+        with self._lock:
+            for task_id in subscription.task_ids:
+                subscribers = self._subscriptions.get(task_id, [])
+                if subscription in subscribers:
+                    subscribers.remove(subscription)
+                if not subscribers:
+                    self._subscriptions.pop(task_id, None)
+
+    def publish(self, task_id: str, record: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(task_id, []))
+        for subscription in subscribers:
+            try:
+                subscription.push(task_id, record)
+            except RuntimeError:
+                # The subscriber's loop has already been closed.
+                self.unsubscribe(subscription)
+
+
+_task_events = TaskEventBroker()
+
+
+def _with_timings(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Adds queued_seconds and run_seconds derived from the record's timestamps.
+    """
+    enqueued_at = record.get("enqueued_at")
+    if enqueued_at is None:
+        return record
+    started_at = record.get("started_at")
+    finished_at = record.get("finished_at")
+    now = time.time()
+    return {
+        **record,
+        "queued_seconds": round((started_at or finished_at or now) - enqueued_at, 3),
+        "run_seconds": round((finished_at or now) - started_at, 3) if started_at else None,
+    }
+
+def _set_task_record(task_id: str, record: Dict[str, Any]):
+    """
+    Persists a task record and pushes the transition to live subscribers.
+    """
+    _task_store.set(task_id, record)
+    _task_events.publish(task_id, _with_timings(record))
+
+def _transition_task_record(task_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Persists a task record unless the task has already reached a terminal status,
+    e.g. CANCELLED by a concurrent request or another worker. The check and the
+    write are one compare_and_set. Returns the terminal record that was kept, or
+    None if the record was stored.
+    """
+    while True:
+        current = _task_store.get(task_id)
+        if current and current.get("status") in TERMINAL_STATUSES:
+            return current
+        if _task_store.compare_and_set(task_id, current, record):
+            _task_events.publish(task_id, _with_timings(record))
+            return None
+
+# ==============================================================================
+# 3. Task Management Functions
 # ==============================================================================
 
 def create_task(
@@ -23,78 +274,642 @@ def create_task(
     on_success: Optional[Callable] = None,
     on_error: Optional[Callable] = None,
     *args,
+    staged: bool = True,
+    owner: Optional[str] = None,
+    task_id: Optional[str] = None,
+    on_finish: Optional[Callable[[str], None]] = None,
+    initial_fields: Optional[Dict[str, Any]] = None,
     **kwargs
 ) -> str:
     """
     Submits a function to the thread pool, returning a task ID.
     Executes on_success or on_error callbacks upon completion.
+
+    With staged=True (the default) the task is marked finished as soon as the target
+    returns, and the callbacks run on the callback pool. Otherwise they run inline
+    before the worker thread is released. Callbacks receive the original kwargs plus
+    completion_time, the moment the target finished.
+
+    owner is stored with the task so only that user (or an admin) can cancel it.
+    task_id may be reserved by the caller; on_finish(task_id) is called once the
+    task has reached a terminal status, including cancellation. initial_fields
+    are added to the RUNNING records stored before the target returns.
     """
-    task_id = str(uuid.uuid4())
-    logger.info(f"Creating task {task_id} for function: {target_func.__name__}")
+    task_id = task_id or str(uuid.uuid4())
+    func_name = getattr(target_func, "__name__", "task")
+    logger.info(f"Creating task {task_id} for function: {func_name}")
+    handle = _TaskHandle(owner)
+    timings: Dict[str, float] = {"enqueued_at": time.time()}
 
     # Extract original kwargs for the target function, separating them from callback args
     # This assumes that the callbacks will get their arguments from the result/error
     # and the shared context passed in kwargs.
     func_kwargs = kwargs.copy()
 
+    def run_callback(callback: Callable, payload: Any, name: str, completion_time: datetime):
+        try:
+            logger.info(f"Executing {name} callback for task {task_id}.")
+            callback(payload, **func_kwargs, completion_time=completion_time)
+        except Exception as cb_e:
+            logger.error(f"Error in {name} callback for task {task_id}: {cb_e}", exc_info=True)
+
+    def dispatch_callback(callback: Optional[Callable], payload: Any, name: str):
+        if not callback:
+            return
+        completion_time = datetime.now(timezone.utc)
+        if staged:
+            _callback_executor.submit(run_callback, callback, payload, name, completion_time)
+        else:
+            run_callback(callback, payload, name, completion_time)
+
+    def notify_finished():
+        with _handles_lock:
+            if handle.finished:
+                return
+            handle.finished = True
+        if on_finish:
+            try:
+                on_finish(task_id)
+            except Exception as e:
+                logger.error(f"Error in on_finish hook for task {task_id}: {e}", exc_info=True)
+
+    def finish() -> bool:
+        """
+        Takes the task off the in-flight set. Returns True if it was cancelled,
+        here or through another worker sharing the store.
+        """
+        with _handles_lock:
+            _task_handles.pop(task_id, None)
+            _leased_tasks.discard(task_id)
+            cancelled = handle.cancelled
+        if not cancelled:
+            current = _task_store.get(task_id)
+            cancelled = bool(current and current.get("status") == "CANCELLED")
+
+        timings["finished_at"] = time.time()
+        started_at = timings.get("started_at", timings["finished_at"])
+        _queued_seconds.observe(func_name, started_at - timings["enqueued_at"])
+        _run_seconds.observe(func_name, timings["finished_at"] - started_at)
+        return cancelled
+
+    def store(record: Dict[str, Any]) -> bool:
+        """
+        Stores a status unless the task has been cancelled or has finished meanwhile.
+        """
+        record.update(timings)
+        if owner:
+            record["owner"] = owner
+        return _transition_task_record(task_id, record) is None
+
+    def handle_cancelled(result: Any = None):
+        """
+        Settles a cancelled task once its work has stopped. Work that produced output
+        anyway (e.g. a Veo operation that could not be stopped) has been paid for, so
+        it goes to on_success to be logged and counted towards quota.
+        """
+        if result is not None:
+            logger.info(f"Task {task_id} was cancelled but its work finished. Logging its output.")
+            dispatch_callback(on_success, result, "on_success")
+        else:
+            logger.info(f"Task {task_id} was cancelled. Discarding its outcome.")
+            dispatch_callback(on_error, TaskCancelledError("Task was cancelled."), "on_error")
+        notify_finished()
+
+    def handle_result(result: Any):
+        """
+        Stores the result of a completed task and runs the matching callback.
+        """
+        # Check if the result indicates a graceful failure (e.g., RAI violation)
+        handled_error = isinstance(result, dict) and "error" in result
+        # Store the entire result so the frontend can get detailed RAI reasons
+        if finish() or not store({"status": "SUCCESS", "result": result}):
+            handle_cancelled(None if handled_error else result)
+            return
+        if handled_error:
+            logger.warning(f"Task {task_id} completed with a handled error: {result['error']}")
+            # Create an exception object from the error message for the callback
+            error = Exception(result['error'])
+            # If rai_reasons are available, attach them to the exception
+            if "rai_reasons" in result:
+                error.rai_reasons = result["rai_reasons"]
+            dispatch_callback(on_error, error, "on_error")
+        else:
+            # Task succeeded
+            logger.info(f"Task {task_id} completed successfully.")
+            dispatch_callback(on_success, result, "on_success")
+        notify_finished()
+
+    def handle_exception(e: Exception):
+        """
+        Stores the failure of a task and runs the on_error callback.
+        """
+        if finish() or not store({"status": "FAILURE", "error": str(e)}):
+            handle_cancelled()
+            return
+        logger.error(f"Task {task_id} failed with an unhandled exception: {e}", exc_info=True)
+        # Pass the error and the original context to the callback
+        dispatch_callback(on_error, e, "on_error")
+        notify_finished()
+
+    def resume_deferred(deferred: DeferredResult):
+        """
+        Completes a task once its deferred work has finished.
+        """
+        try:
+            outcome = deferred.future.result()
+            result = deferred.finalize(outcome) if deferred.finalize else outcome
+        except Exception as e:
+            handle_exception(e)
+            return
+        handle_result(result)
+
     def task_wrapper(task_id: str):
         """
         A wrapper to execute the target function and handle callbacks.
         """
         logger.info(f"Task {task_id} started.")
+        timings["started_at"] = time.time()
+        with _handles_lock:
+            cancelled = handle.cancelled
+        if cancelled or not store({"status": "RUNNING", **(initial_fields or {})}):
+            finish()
+            handle_cancelled()
+            return
         try:
             # Pass only the relevant kwargs to the target function
             result = target_func(*args, **func_kwargs)
-            
-            # Check if the result indicates a graceful failure (e.g., RAI violation)
-            if isinstance(result, dict) and "error" in result:
-                # Store the entire result so the frontend can get detailed RAI reasons
-                _task_store[task_id] = {"status": "SUCCESS", "result": result}
-                logger.warning(f"Task {task_id} completed with a handled error: {result['error']}")
-                if on_error:
-                    try:
-                        # Create an exception object from the error message for the callback
-                        error = Exception(result['error'])
-                        # If rai_reasons are available, attach them to the exception
-                        if "rai_reasons" in result:
-                            error.rai_reasons = result["rai_reasons"]
-                        logger.info(f"Executing on_error callback for task {task_id} due to handled error.")
-                        on_error(error, **func_kwargs)
-                    except Exception as cb_e:
-                        logger.error(f"Error in on_error callback for task {task_id}: {cb_e}", exc_info=True)
-            else:
-                # Task succeeded
-                _task_store[task_id] = {"status": "SUCCESS", "result": result}
-                logger.info(f"Task {task_id} completed successfully.")
-                if on_success:
-                    try:
-                        logger.info(f"Executing on_success callback for task {task_id}.")
-                        on_success(result, **func_kwargs)
-                    except Exception as cb_e:
-                        logger.error(f"Error in on_success callback for task {task_id}: {cb_e}", exc_info=True)
-
         except Exception as e:
-            _task_store[task_id] = {"status": "FAILURE", "error": str(e)}
-            logger.error(f"Task {task_id} failed with an unhandled exception: {e}", exc_info=True)
-            if on_error:
-                try:
-                    logger.info(f"Executing on_error callback for task {task_id}.")
-                    # Pass the error and the original context to the callback
-                    on_error(e, **func_kwargs)
-                except Exception as cb_e:
-                    logger.error(f"Error in on_error callback for task {task_id}: {cb_e}", exc_info=True)
+            handle_exception(e)
+            return
+
+        if isinstance(result, DeferredResult):
+            with _handles_lock:
+                handle.deferred = result
+                cancelled = handle.cancelled
+            if cancelled:
+                # Cancelled while the target was still starting the work.
+                result.cancel()
+            elif result.resume and _task_store.persistent:
+                leased = store({"status": "RUNNING", "resume": result.resume, "worker": _WORKER_ID,
+                                "lease_until": time.time() + RESUME_LEASE_SECONDS})
+                with _handles_lock:
+                    leased = leased and not handle.cancelled
+                    if leased:
+                        _leased_tasks.add(task_id)
+                if leased:
+                    _ensure_lease_renewal()
+                else:
+                    result.cancel()
+            # Release this worker thread; the rest of the task runs when the future resolves.
+            # A cancelled task waits for it too, so work that still finishes is accounted for.
+            logger.info(f"Task {task_id} is waiting on deferred work. Releasing worker thread.")
+            result.future.add_done_callback(lambda _: _executor.submit(resume_deferred, result))
+            return
+
+        handle_result(result)
+
+    def on_cancel():
+        # Cancelled before the target started, so there is no work to wait for.
+        finish()
+        handle_cancelled()
+
+    handle.on_cancel = on_cancel
+    with _handles_lock:
+        _task_handles[task_id] = handle
+
+    # Store the initial status before submitting, so a fast task cannot be overwritten by it
+    if not store({"status": "RUNNING", **(initial_fields or {})}):
+        # Cancelled before it could start, e.g. a batch item cancelled while it was being launched.
+        on_cancel()
+        return task_id
 
     # Submit the wrapped function to the executor
-    _executor.submit(task_wrapper, task_id)
-    
-    # Immediately store the initial status
-    _task_store[task_id] = {"status": "RUNNING"}
+    handle.future = _executor.submit(task_wrapper, task_id)
     logger.info(f"Task {task_id} is now running.")
-    
+
     return task_id
 
 def get_task_status(task_id: str) -> Dict[str, Any]:
     """
-    Retrieves the status of a task from the in-memory store.
+    Retrieves the status of a task from the task store, with its queue and run times.
+    """
+    record = _task_store.get(task_id)
+    return _with_timings(record) if record else {"status": "not_found"}
+
+def cancel_task(task_id: str) -> Dict[str, Any]:
+    """
+    Cancels a queued or running task and records it as CANCELLED.
+
+    Queued tasks are removed from the executor queue and get their on_error called
+    with TaskCancelledError, as do batch items still waiting for a slot. Deferred
+    work (e.g. a Veo operation) is asked to stop. A target that is already
+    executing cannot be interrupted: its callbacks run once it returns, on_success
+    if it produced output anyway, so paid work is still logged and counted towards
+    quota. Finished tasks are returned unchanged.
+    """
+    record = _task_store.get(task_id)
+    if not record:
+        return {"status": "not_found"}
+    if record.get("status") in TERMINAL_STATUSES:
+        return record
+
+    with _handles_lock:
+        handle = _task_handles.pop(task_id, None)
+        pending_item = _pending_batch_items.pop(task_id, None)
+        _leased_tasks.discard(task_id)
+        if handle:
+            handle.cancelled = True
+            deferred = handle.deferred
+
+    cancelled_record = {"status": "CANCELLED", "error": "Task was cancelled.", "finished_at": time.time()}
+    for field in ("owner", "enqueued_at", "started_at"):
+        if record.get(field) is not None:
+            cancelled_record[field] = record[field]
+    final_record = _transition_task_record(task_id, cancelled_record)
+    if final_record is not None:
+        # The task finished before it could be cancelled.
+        return final_record
+
+    if handle is None:
+        # Not started yet (a pending batch item), or owned by another worker that
+        # settles the outcome once it sees the CANCELLED record.
+        logger.info(f"Task {task_id} marked as cancelled.")
+        if pending_item:
+            _dispatch_item_cancelled(task_id, pending_item)
+        return cancelled_record
+
+    if handle.future and handle.future.cancel():
+        logger.info(f"Task {task_id} removed from the queue.")
+        handle.on_cancel()
+    elif deferred:
+        logger.info(f"Task {task_id} cancelling deferred work; its outcome is settled when it stops.")
+        deferred.cancel()
+    else:
+        logger.info(f"Task {task_id} is executing; its outcome is settled when it returns.")
+    return cancelled_record
+
+async def run_task_call(func: Callable, *args, **kwargs):
+    """
+    Runs a task manager call from an async endpoint.
+
+    The SQLite and Firestore stores do blocking I/O, so with them the call runs in the threadpool
+    instead of on the event loop. The in-memory store is called directly.
+    """
+    if not _task_store.persistent:
+        return func(*args, **kwargs)
+    return await run_in_threadpool(func, *args, **kwargs)
+
+def get_task_store_stats() -> Dict[str, Any]:
+    """
+    Returns size and eviction counters of the configured task store.
+    """
+    return _task_store.stats()
+
+def get_executor_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns queue depth and worker counters of the generation and callback pools.
+    """
+    return {pool.name: pool.stats() for pool in (_executor, _callback_executor)}
+
+def get_task_metrics() -> Dict[str, Any]:
+    """
+    Returns pool counters, the number of unfinished tasks in this process, and
+    per-function histograms of queue wait and run time in seconds.
+    """
+    with _handles_lock:
+        in_flight = len(_task_handles)
+    return {
+        "executors": get_executor_stats(),
+        "in_flight_tasks": in_flight,
+        "queued_seconds": _queued_seconds.snapshot(),
+        "run_seconds": _run_seconds.snapshot(),
+    }
+
+def subscribe_to_tasks(task_ids: Iterable[str]) -> TaskSubscription:
+    """
+    Subscribes to status updates for the given task IDs.
+    Only transitions made by this process are pushed; callers should fall back
+    to get_task_status for tasks running elsewhere.
+    """
+    return _task_events.subscribe(task_ids)
+
+def unsubscribe_from_tasks(subscription: TaskSubscription):
+    _task_events.unsubscribe(subscription)
+
+# ==============================================================================
+# 4. Batches
+# ==============================================================================
+
+def _dispatch_item_cancelled(task_id: str, item: Dict[str, Any]):
+    """
+    Runs the on_error callback of a batch item cancelled before it started,
+    so it can release its resources and log the cancellation.
+    """
+    on_error = item.get("on_error")
+    if not on_error:
+        return
+
+    def run_callback(completion_time: datetime):
+        try:
+            logger.info(f"Executing on_error callback for cancelled task {task_id}.")
+            on_error(TaskCancelledError("Task was cancelled."), **item.get("kwargs", {}), completion_time=completion_time)
+        except Exception as cb_e:
+            logger.error(f"Error in on_error callback for task {task_id}: {cb_e}", exc_info=True)
+
+    _callback_executor.submit(run_callback, datetime.now(timezone.utc))
+
+
+class _Batch:
+    """
+    Starts the items of a batch as tasks, keeping at most max_concurrency in flight.
+    """
+
+    def __init__(self, batch_id: str, max_concurrency: int, owner: Optional[str]):
+        self.batch_id = batch_id
+        self.max_concurrency = max_concurrency
+        self.owner = owner
+        self.pending: Deque[Tuple[str, Dict[str, Any]]] = deque()
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def launch_next(self):
+        while True:
+            with self._lock:
+                if self.running >= self.max_concurrency or not self.pending:
+                    return
+                task_id, item = self.pending.popleft()
+                self.running += 1
+
+            with _handles_lock:
+                # Missing if cancel_task already cancelled the item and ran its on_error.
+                owned = _pending_batch_items.pop(task_id, None) is not None
+            record = _task_store.get(task_id) if owned else None
+            if not owned or (record and record.get("status") == "CANCELLED"):
+                # Cancelled while waiting for a slot, possibly through another worker.
+                if owned:
+                    _dispatch_item_cancelled(task_id, item)
+                with self._lock:
+                    self.running -= 1
+                continue
+
+            create_task(
+                item["target_func"],
+                item.get("on_success"),
+                item.get("on_error"),
+                owner=self.owner,
+                task_id=task_id,
+                on_finish=self._on_item_finished,
+                **item.get("kwargs", {})
+            )
+
+    def _on_item_finished(self, task_id: str):
+        with self._lock:
+            self.running -= 1
+        self.launch_next()
+
+
+def create_batch(items: List[Dict[str, Any]], max_concurrency: int, owner: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Schedules a list of tasks as one batch, returning the batch ID and the item task IDs.
+
+    Each item holds the create_task arguments: target_func, on_success, on_error and kwargs.
+    Items wait as PENDING until one of the max_concurrency slots of the batch frees up.
+    """
+    batch_id = str(uuid.uuid4())
+    batch = _Batch(batch_id, max(1, max_concurrency), owner)
+    task_ids = [str(uuid.uuid4()) for _ in items]
+
+    _task_store.set(BATCH_KEY_PREFIX + batch_id, {
+        "task_ids": task_ids,
+        "owner": owner,
+        "max_concurrency": batch.max_concurrency,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    for task_id, item in zip(task_ids, items):
+        pending_record = {"status": "PENDING", "batch_id": batch_id}
+        if owner:
+            pending_record["owner"] = owner
+        _set_task_record(task_id, pending_record)
+        with _handles_lock:
+            _pending_batch_items[task_id] = item
+        batch.pending.append((task_id, item))
+
+    logger.info(f"Batch {batch_id} created with {len(items)} items, {batch.max_concurrency} at a time.")
+    batch.launch_next()
+    return batch_id, task_ids
+
+def get_batch_status(batch_id: str) -> Dict[str, Any]:
+    """
+    Returns the overall status of a batch with per-item progress.
+    The batch is RUNNING until every item has finished. It is then SUCCESS if
+    every item succeeded, FAILURE if none did, and PARTIAL_SUCCESS otherwise.
+    Items that completed with a handled error (e.g. an RAI block) count as failed.
+    """
+    record = _task_store.get(BATCH_KEY_PREFIX + batch_id)
+    if not record:
+        return {"status": "not_found"}
+
+    items = []
+    counts: Dict[str, int] = {}
+    for task_id in record["task_ids"]:
+        item = get_task_status(task_id)
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+        items.append({"task_id": task_id, **item})
+
+    finished = all(item["status"] in TERMINAL_STATUSES or item["status"] == "not_found" for item in items)
+    succeeded = sum(1 for item in items if item["status"] == "SUCCESS"
+                    and not (isinstance(item.get("result"), dict) and "error" in item["result"]))
+    if not finished:
+        status = "RUNNING"
+    elif succeeded == len(items):
+        status = "SUCCESS"
+    else:
+        status = "PARTIAL_SUCCESS" if succeeded else "FAILURE"
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "total": len(items),
+        "counts": counts,
+        "items": items,
+        "owner": record.get("owner"),
+    }
+
+# ==============================================================================
+# 5. Request Deduplication
+# ==============================================================================
+
+# A claimed task that is not in the store yet is being started by its request for at most this long.
+CLAIM_START_GRACE_SECONDS = 30
+
+
+class IdempotencyConflictError(Exception):
+    """
+    Raised when an Idempotency-Key is reused with a different request body.
+    """
+
+
+def build_request_key(user_email: str, route: str, body: Dict[str, Any],
+                      idempotency_key: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Returns (request key, body fingerprint) for a generation request.
+    Without an Idempotency-Key, the request is keyed by its fingerprint, so
+    identical requests from the same user are deduplicated automatically.
+    """
+    fingerprint = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+    scope = f"key:{idempotency_key}" if idempotency_key else f"body:{fingerprint}"
+    request_key = hashlib.sha256(f"{user_email}|{route}|{scope}".encode()).hexdigest()
+    return request_key, fingerprint
+
+def _claim_is_live(claim: Dict[str, Any], window_seconds: float) -> bool:
+    """
+    Whether a claimed request still stands for its duplicates: its task is in
+    flight, or succeeded within window_seconds of the claim. A task that is not
+    found only counts while its request may still be starting it.
+    """
+    status = get_task_status(claim["task_id"])["status"]
+    age = time.time() - claim.get("claimed_at", 0)
+    if status in ACTIVE_STATUSES:
+        return True
+    if status == "not_found":
+        return age <= CLAIM_START_GRACE_SECONDS
+    return status == "SUCCESS" and age <= window_seconds
+
+def claim_request(request_key: str, fingerprint: str, task_id: str, window_seconds: float) -> Optional[str]:
+    """
+    Reserves task_id for a request. Returns the task ID of an earlier identical
+    request whose task is still in flight, or succeeded within window_seconds;
+    otherwise returns None and the caller should start task_id.
+
+    Callers pass a long window for an explicit Idempotency-Key and a few seconds
+    for requests keyed by their body, so a user can deliberately repeat a prompt.
+    """
+    record = {"task_id": task_id, "fingerprint": fingerprint, "claimed_at": time.time()}
+    store_key = IDEMPOTENCY_KEY_PREFIX + request_key
+    while True:
+        existing = _task_store.claim(store_key, record)
+        if existing is None:
+            return None
+        if existing.get("fingerprint") != fingerprint:
+            raise IdempotencyConflictError("Idempotency-Key has already been used with a different request.")
+        if _claim_is_live(existing, window_seconds):
+            return existing["task_id"]
+        # The earlier request is stale, so this one starts new work, unless a
+        # concurrent duplicate took the key over first; then look at its claim.
+        if _task_store.compare_and_set(store_key, existing, record):
+            return None
+
+def release_request(request_key: str):
+    """
+    Frees a request key claimed by a request that was rejected before its task started.
+    """
+    _task_store.delete(IDEMPOTENCY_KEY_PREFIX + request_key)
+
+# ==============================================================================
+# 6. Resuming Interrupted Tasks
+# ==============================================================================
+
+_resumers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+_lease_thread: Optional[threading.Thread] = None
+_recovery_thread: Optional[threading.Thread] = None
+_background_lock = threading.Lock()
+
+
+def register_resumer(kind: str, resumer: Callable[[Dict[str, Any]], Dict[str, Any]]):
+    """
+    Registers how to resume tasks whose DeferredResult.resume has this kind.
+    resumer(resume) returns the create_task arguments to continue the task:
+    target_func (returning a new DeferredResult), on_success, on_error and kwargs.
+    """
+    _resumers[kind] = resumer
+
+def _renew_leases():
+    while True:
+        time.sleep(RESUME_LEASE_SECONDS / 3)
+        for task_id in list(_leased_tasks):
+            try:
+                record = _task_store.get(task_id)
+                # Hold the lock so a lease renewal can never overwrite a final status.
+                with _handles_lock:
+                    if task_id not in _leased_tasks:
+                        continue
+                    if not record or record.get("status") != "RUNNING" or record.get("worker") != _WORKER_ID:
+                        _leased_tasks.discard(task_id)
+                        continue
+                    # Only renew the record that was read, never one cancelled in the meantime.
+                    _task_store.compare_and_set(task_id, record, {**record, "lease_until": time.time() + RESUME_LEASE_SECONDS})
+            except Exception as e:
+                logger.error(f"Failed to renew lease of task {task_id}: {e}")
+
+def _ensure_lease_renewal():
+    global _lease_thread
+    with _background_lock:
+        if _lease_thread is None:
+            _lease_thread = threading.Thread(target=_renew_leases, name="task-lease-renewal", daemon=True)
+            _lease_thread.start()
+
+def resume_interrupted_tasks() -> int:
+    """
+    Resumes running tasks whose lease has expired, i.e. whose process has died.
+    Returns the number of tasks resumed by this process.
+    """
+    now = time.time()
+    resumed = 0
+    for task_id, record in _task_store.scan_active():
+        resume = record.get("resume")
+        if not resume or record.get("lease_until", 0) > now:
+            continue
+        resumer = _resumers.get(resume.get("kind"))
+        if not resumer:
+            logger.warning(f"No resumer registered for task {task_id} of kind '{resume.get('kind')}'.")
+            continue
+        # Only one process may take over a given expired lease.
+        lock_key = f"resume-lock:{task_id}:{record.get('lease_until')}"
+        if _task_store.claim(lock_key, {"worker": _WORKER_ID}) is not None:
+            continue
+        try:
+            spec = resumer(resume)
+            # Keep the resume context under a lease of this process until the target
+            # returns its own, so the task can still be resumed if this process dies too.
+            with _handles_lock:
+                _leased_tasks.add(task_id)
+            _ensure_lease_renewal()
+            create_task(
+                spec["target_func"],
+                spec.get("on_success"),
+                spec.get("on_error"),
+                owner=record.get("owner"),
+                task_id=task_id,
+                initial_fields={"resume": resume, "worker": _WORKER_ID,
+                                "lease_until": time.time() + RESUME_LEASE_SECONDS},
+                **spec.get("kwargs", {})
+            )
+            resumed += 1
+            logger.info(f"Resumed interrupted task {task_id}.")
+        except Exception as e:
+            logger.error(f"Failed to resume task {task_id}: {e}", exc_info=True)
+            with _handles_lock:
+                _leased_tasks.discard(task_id)
+            _set_task_record(task_id, {"status": "FAILURE", "error": f"Task could not be resumed: {e}"})
+    return resumed
+
+def _recover_periodically():
+    while True:
+        try:
+            resume_interrupted_tasks()
+        except Exception as e:
+            logger.error(f"Task recovery pass failed: {e}", exc_info=True)
+        time.sleep(RESUME_LEASE_SECONDS)
+
+def start_task_recovery():
+    """
+    Starts resuming interrupted tasks in the background: once at startup, then
+    every lease period to catch tasks whose previous process was still within its lease.
+    Only persistent task stores keep tasks across restarts.
     """
-    return _task_store.get(task_id, {"status": "not_found"})
+    global _recovery_thread
+    if not _task_store.persistent:
+        return
+    with _background_lock:
+        if _recovery_thread is None:
+            _recovery_thread = threading.Thread(target=_recover_periodically, name="task-recovery", daemon=True)
+            _recovery_thread.start()
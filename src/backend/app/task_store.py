@@ -0,0 +1,451 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 1. Task Store Interface
+# ==============================================================================
+
+class TaskStore:
+    """
+    Key/value store for task records.
+    Records are plain JSON-serializable dicts keyed by task ID.
+    Persistent stores outlive the process, so their running tasks can be resumed.
+    """
+
+    persistent = False
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, task_id: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, task_id: str) -> None:
+        raise NotImplementedError
+
+    def claim(self, task_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Stores the record only if the key is free, atomically.
+        Returns the existing record if the key was taken, otherwise None.
+        """
+        raise NotImplementedError
+
+    def compare_and_set(self, task_id: str, expected: Optional[Dict[str, Any]], record: Dict[str, Any]) -> bool:
+        """
+        Replaces the record only if the stored one still equals expected
+        (None for a missing key), atomically. Returns whether it was replaced.
+        """
+        raise NotImplementedError
+
+    def scan_active(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yields (task_id, record) for every task that is still in flight.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns size and eviction counters for the admin endpoint.
+        """
+        return {"backend": type(self).__name__}
+
+
+# Records in these states belong to work that is still in flight and are never evicted.
+# PENDING batch items are in flight too: they are started once a slot of their batch frees up.
+ACTIVE_STATUSES = {"PENDING", "RUNNING"}
+
+# Expired records are swept at most this often, so writes stay cheap.
+EXPIRY_SWEEP_SECONDS = 60
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    # Results may carry SDK objects (e.g. operation errors), so fall back to str().
+    return json.dumps(record, default=str)
+
+
+# ==============================================================================
+# 2. Backends
+# ==============================================================================
+
+class InMemoryTaskStore(TaskStore):
+    """
+    Process-local store. Only suitable for a single worker.
+
+    Finished records expire ttl_seconds after their last write, and the least
+    recently read ones are evicted once max_entries is exceeded. If spill_dir is
+    set, evicted records are written there so late pollers can still fetch them.
+    Records whose key starts with one of pinned_prefixes are never evicted,
+    only expired.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                 spill_dir: Optional[str] = None, pinned_prefixes: Tuple[str, ...] = ()):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.pinned_prefixes = tuple(pinned_prefixes)
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        # task_id -> (record, size in bytes, last write time), ordered by last read
+        self._records: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self._total_bytes = 0
+        self._evicted = 0
+        self._expired = 0
+        self._spilled = 0
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._records.get(task_id)
+            if entry is not None:
+                if self._is_expired(entry, time.time()):
+                    self._remove(task_id)
+                    self._expired += 1
+                    return None
+                self._records.move_to_end(task_id)
+                return entry[0]
+        return self._read_spilled(task_id)
+
+    def set(self, task_id: str, record: Dict[str, Any]) -> None:
+        size = len(_dumps(record))
+        with self._lock:
+            self._remove(task_id)
+            self._records[task_id] = (record, size, time.time())
+            self._total_bytes += size
+            self._evict()
+
+    def claim(self, task_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._records.get(task_id)
+            if entry is not None and not self._is_expired(entry, time.time()):
+                return entry[0]
+            size = len(_dumps(record))
+            self._remove(task_id)
+            self._records[task_id] = (record, size, time.time())
+            self._total_bytes += size
+            self._evict()
+        return None
+
+    def compare_and_set(self, task_id: str, expected: Optional[Dict[str, Any]], record: Dict[str, Any]) -> bool:
+        with self._lock:
+            entry = self._records.get(task_id)
+            current = entry[0] if entry is not None and not self._is_expired(entry, time.time()) else None
+            if current != expected:
+                return False
+            size = len(_dumps(record))
+            self._remove(task_id)
+            self._records[task_id] = (record, size, time.time())
+            self._total_bytes += size
+            self._evict()
+        return True
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._remove(task_id)
+        if self.spill_dir:
+            self._spill_path(task_id).unlink(missing_ok=True)
+
+    def scan_active(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            active = [(task_id, record) for task_id, (record, _, _) in self._records.items()
+                      if record.get("status") in ACTIVE_STATUSES]
+        return iter(active)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = sum(1 for record, _, _ in self._records.values() if record.get("status") in ACTIVE_STATUSES)
+            return {
+                "backend": "memory",
+                "entries": len(self._records),
+                "active_entries": active,
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "evicted": self._evicted,
+                "expired": self._expired,
+                "spilled": self._spilled,
+                "spill_dir": str(self.spill_dir) if self.spill_dir else None,
+            }
+
+    def _is_expired(self, entry: Tuple[Dict[str, Any], int, float], now: float) -> bool:
+        record, _, written_at = entry
+        return (self.ttl_seconds is not None
+                and record.get("status") not in ACTIVE_STATUSES
+                and now - written_at > self.ttl_seconds)
+
+    def _remove(self, task_id: str):
+        entry = self._records.pop(task_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        """
+        Drops expired records, then the least recently read ones over max_entries.
+        Must be called with the lock held.
+        """
+        now = time.time()
+        if now - self._last_sweep >= EXPIRY_SWEEP_SECONDS:
+            self._last_sweep = now
+            for task_id, entry in list(self._records.items()):
+                if self._is_expired(entry, now):
+                    self._remove(task_id)
+                    self._expired += 1
+            self._sweep_spilled(now)
+
+        if self.max_entries is None or len(self._records) <= self.max_entries:
+            return
+        for task_id, (record, _, _) in list(self._records.items()):
+            if len(self._records) <= self.max_entries:
+                break
+            if record.get("status") in ACTIVE_STATUSES or task_id.startswith(self.pinned_prefixes):
+                continue
+            self._remove(task_id)
+            self._evicted += 1
+            self._spill(task_id, record)
+
+    def _spill_path(self, task_id: str) -> Path:
+        return self.spill_dir / f"{task_id}.json"
+
+    def _spill(self, task_id: str, record: Dict[str, Any]):
+        if not self.spill_dir:
+            return
+        try:
+            self._spill_path(task_id).write_text(_dumps(record))
+            self._spilled += 1
+        except OSError as e:
+            logger.error(f"Failed to spill task {task_id} to disk: {e}")
+
+    def _sweep_spilled(self, now: float):
+        if not self.spill_dir or self.ttl_seconds is None:
+            return
+        for path in self.spill_dir.glob("*.json"):
+            try:
+                if now - path.stat().st_mtime > self.ttl_seconds:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                continue
+
+    def _read_spilled(self, task_id: str) -> Optional[Dict[str, Any]]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(task_id)
+        try:
+            if self.ttl_seconds is not None and time.time() - path.stat().st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    File-backed store shared by all workers on the same host.
+    Finished records older than ttl_seconds are purged periodically.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._last_sweep = 0.0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id TEXT PRIMARY KEY, record TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT record FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, task_id: str, record: Dict[str, Any]) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, record, updated_at) VALUES (?, ?, ?)",
+            (task_id, _dumps(record), now)
+        )
+        if self.ttl_seconds is not None and now - self._last_sweep >= EXPIRY_SWEEP_SECONDS:
+            self._last_sweep = now
+            placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+            conn.execute(
+                f"DELETE FROM tasks WHERE updated_at < ? "
+                f"AND COALESCE(json_extract(record, '$.status'), '') NOT IN ({placeholders})",
+                (now - self.ttl_seconds, *ACTIVE_STATUSES)
+            )
+
+    def claim(self, task_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO tasks (task_id, record, updated_at) VALUES (?, ?, ?)",
+            (task_id, _dumps(record), time.time())
+        )
+        if cursor.rowcount == 1:
+            return None
+        return self.get(task_id)
+
+    def compare_and_set(self, task_id: str, expected: Optional[Dict[str, Any]], record: Dict[str, Any]) -> bool:
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front, so no other writer can slip in between.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT record FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if (json.loads(row[0]) if row else None) != expected:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, record, updated_at) VALUES (?, ?, ?)",
+                (task_id, _dumps(record), time.time())
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, task_id: str) -> None:
+        self._connect().execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def scan_active(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        rows = self._connect().execute(
+            f"SELECT task_id, record FROM tasks WHERE json_extract(record, '$.status') IN ({placeholders})",
+            tuple(ACTIVE_STATUSES)
+        ).fetchall()
+        for task_id, record in rows:
+            yield task_id, json.loads(record)
+
+    def stats(self) -> Dict[str, Any]:
+        entries, total_bytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(record)), 0) FROM tasks"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": total_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+class FirestoreTaskStore(TaskStore):
+    """
+    Firestore-backed store shared by all workers and Cloud Run instances.
+    The record is stored as a JSON string to avoid Firestore's nested array restrictions.
+    Each document carries an expire_at field for use with a Firestore TTL policy,
+    and a copy of the status so running tasks can be queried.
+    """
+
+    persistent = True
+
+    def __init__(self, database: str, collection: str, ttl_seconds: Optional[float] = None):
+        from app.dependencies import get_db_client
+        self._client = get_db_client(database)
+        self._collection = self._client.collection(collection)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        doc = self._collection.document(task_id).get()
+        if not doc.exists:
+            return None
+        return json.loads(doc.to_dict().get("record", "{}"))
+
+    def _document(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        from google.cloud import firestore
+        document = {
+            "record": _dumps(record),
+            "status": record.get("status"),
+            "updated_at": firestore.SERVER_TIMESTAMP
+        }
+        if self.ttl_seconds is not None and record.get("status") not in ACTIVE_STATUSES:
+            document["expire_at"] = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        return document
+
+    def set(self, task_id: str, record: Dict[str, Any]) -> None:
+        self._collection.document(task_id).set(self._document(record))
+
+    def claim(self, task_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        from google.api_core.exceptions import AlreadyExists
+        try:
+            self._collection.document(task_id).create(self._document(record))
+        except AlreadyExists:
+            return self.get(task_id)
+        return None
+
+    def compare_and_set(self, task_id: str, expected: Optional[Dict[str, Any]], record: Dict[str, Any]) -> bool:
+        from google.cloud import firestore
+        reference = self._collection.document(task_id)
+
+        @firestore.transactional
+        def replace(transaction) -> bool:
+            doc = reference.get(transaction=transaction)
+            current = json.loads(doc.to_dict().get("record", "{}")) if doc.exists else None
+            if current != expected:
+                return False
+            transaction.set(reference, self._document(record))
+            return True
+
+        return replace(self._client.transaction())
+
+    def delete(self, task_id: str) -> None:
+        self._collection.document(task_id).delete()
+
+    def scan_active(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        query = self._collection.where(filter=FieldFilter("status", "in", sorted(ACTIVE_STATUSES)))
+        for doc in query.stream():
+            yield doc.id, json.loads(doc.to_dict().get("record", "{}"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "firestore",
+            "collection": self._collection.id,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+def build_task_store(pinned_prefixes: Tuple[str, ...] = ()) -> TaskStore:
+    """
+    Builds the task store configured by TASK_STORE_BACKEND.
+    Keys starting with one of pinned_prefixes are exempt from size-based eviction.
+    """
+    backend = settings.TASK_STORE_BACKEND.lower()
+    if backend == "sqlite":
+        logger.info(f"Using SQLite task store at {settings.TASK_STORE_PATH}.")
+        return SQLiteTaskStore(settings.TASK_STORE_PATH, ttl_seconds=settings.TASK_STORE_TTL_SECONDS)
+    if backend == "firestore":
+        logger.info(f"Using Firestore task store in database '{settings.TASK_STORE_DB}'.")
+        return FirestoreTaskStore(settings.TASK_STORE_DB, settings.TASK_STORE_COLLECTION,
+                                  ttl_seconds=settings.TASK_STORE_TTL_SECONDS)
+    if backend != "memory":
+        logger.warning(f"Unknown TASK_STORE_BACKEND '{settings.TASK_STORE_BACKEND}'. Falling back to in-memory store.")
+    return InMemoryTaskStore(
+        ttl_seconds=settings.TASK_STORE_TTL_SECONDS,
+        max_entries=settings.TASK_STORE_MAX_ENTRIES,
+        spill_dir=settings.TASK_STORE_SPILL_DIR,
+        pinned_prefixes=pinned_prefixes
+    )
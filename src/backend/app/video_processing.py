@@ -1,13 +1,17 @@
 import os
+import time
 import tempfile
 import uuid
 import logging
 from pathlib import Path
-from typing import Tuple, Optional
-from datetime import datetime, timedelta, timezone
+from typing import List, Tuple, Optional
 
-from google.cloud import storage, texttospeech, bigquery
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
+from google.cloud import storage, bigquery
+
+from app.quota import QUOTA_PERIODS, get_quota_ledger, quota_exceeded, quota_tables, quota_usage_query, quota_window_start
+
+# moviepy and Text-to-Speech are slow to import and only needed by the editing
+# endpoints, so they are imported in the functions that use them.
 
 # ==============================================================================
 # 1. INITIALIZATION AND CONFIGURATION
@@ -26,6 +30,7 @@ def _initialize_clients(project_id: str):
         storage_client = storage.Client(project=project_id)
         logger.info("Google Cloud Storage client initialized.")
     if tts_client is None:
+        from google.cloud import texttospeech
         tts_client = texttospeech.TextToSpeechClient()
         logger.info("Google Cloud Text-to-Speech client initialized.")
 
@@ -52,6 +57,8 @@ def apply_clipping(
     Clips a video to the specified start and end times.
     Returns the duration of the new clip.
     """
+    from moviepy.editor import VideoFileClip
+
     logger.info(f"Clipping video from {start_time}s to {end_time}s.")
     duration = 0
     with VideoFileClip(input_video_path) as video:
@@ -74,6 +81,9 @@ def apply_voiceover(
     Adds a voiceover to a video from text.
     Returns the duration of the new video.
     """
+    from google.cloud import texttospeech
+    from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
+
     _initialize_clients(project_id)
     logger.info(f"Generating voiceover for text: '{text_to_speak[:50]}...'")
 
@@ -171,16 +181,16 @@ def process_video_from_gcs(
     return f"gs://{bucket_name}/{output_blob_name}", duration
 
 
-def check_quota(user_email: str, bq_client: bigquery.Client, config: dict, app_conf: dict, project_id: Optional[str] = None, project_config: Optional[dict] = None) -> Tuple[bool, str]:
-    
-    # Determine which configuration to use
-    if project_config and not project_config.get('unrestricted', False):
-        quota_config = project_config.get('quota', {})
-        config_source = "Project"
-    else:
-        quota_config = config.get('quota', {})
-        config_source = "Global"
-
+def check_quota(user_email: str, bq_client: bigquery.Client, config: dict, app_conf: dict, project_id: Optional[str] = None, project_config: Optional[dict] = None, requested_count: int = 1, requested_cost: float = 0) -> Tuple[bool, str]:
+    """
+    Returns (exceeded, message) for the user or creative project.
+    requested_count and requested_cost let a batch be checked as a whole: the
+    quota is exceeded if the current usage plus the request does not fit.
+    Usage comes from the in-process quota ledger, including generations still
+    in flight; BigQuery is only queried before the ledger is loaded or for
+    periods it does not track.
+    """
+    quota_config, config_source = _resolve_quota_config(config, project_config)
     quota_type = quota_config.get('type', 'NO_LIMIT')
 
     if quota_type == 'NO_LIMIT':
@@ -188,62 +198,77 @@ def check_quota(user_email: str, bq_client: bigquery.Client, config: dict, app_c
 
     limit = quota_config.get('limit')
     period = quota_config.get('period', 'day')
-    now = datetime.now(timezone.utc)
-    
-    start_time = None
-    if period == 'day':
-        start_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'week':
-        start_time = now - timedelta(days=now.weekday())
-        start_time = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    base_query = f"""
-        FROM `{bq_client.project}.{app_conf.get('ANALYSIS_DATASET')}.{app_conf.get('HISTORY_TABLE')}`
-        WHERE status = 'SUCCESS'
+
+    scope, key = ("project", project_id) if config_source == "Project" else ("user", user_email)
+    ledger = get_quota_ledger()
+    usage = ledger.usage(scope, key, period)
+    if usage is None:
+        committed_count, committed_cost = _query_quota_usage(user_email, bq_client, app_conf, period, config_source, project_id)
+        reserved_count, reserved_cost = ledger.reserved(scope, key)
+        usage = committed_count + reserved_count, committed_cost + reserved_cost
+    generation_count, total_cost = usage
+
+    if quota_exceeded(quota_type, limit, generation_count, total_cost, requested_count, requested_cost):
+        message = "Total cost reaches to reserved limitation."
+        return True, message
+
+    return False, ""
+
+def reserve_quota(user_email: str, bq_client: bigquery.Client, config: dict, app_conf: dict, project_id: Optional[str], project_config: Optional[dict], amounts: List[Tuple[int, float]]) -> Tuple[bool, str, List[str]]:
+    """
+    Returns (exceeded, message, reservation_ids) for generations of the given
+    (count, cost) amounts. Unless the quota is exceeded, each amount is reserved
+    against the user and the creative project, atomically with the check, so
+    concurrent requests cannot together overshoot the limit. Each reservation
+    must be released with get_quota_ledger().release() once the generation has
+    been logged or has failed.
+    """
+    quota_config, config_source = _resolve_quota_config(config, project_config)
+    quota_type = quota_config.get('type', 'NO_LIMIT')
+    limit = quota_config.get('limit')
+    period = quota_config.get('period', 'day')
+
+    scope, key = ("project", project_id) if config_source == "Project" else ("user", user_email)
+    ledger = get_quota_ledger()
+    committed, committed_at = None, None
+    if quota_type != 'NO_LIMIT' and (not ledger.loaded or period not in QUOTA_PERIODS):
+        committed_at = time.time()
+        committed = _query_quota_usage(user_email, bq_client, app_conf, period, config_source, project_id)
+
+    reservation_ids = ledger.try_reserve(scope, key, period, quota_type, limit, user_email, project_id, amounts,
+                                         committed, committed_at)
+    if reservation_ids is None:
+        return True, "Total cost reaches to reserved limitation.", []
+    return False, "", reservation_ids
+
+def _resolve_quota_config(config: dict, project_config: Optional[dict]) -> Tuple[dict, str]:
+    """
+    Returns the quota configuration that applies and its source, "Project" or "Global".
+    """
+    if project_config and not project_config.get('unrestricted', False):
+        return project_config.get('quota', {}), "Project"
+    return config.get('quota', {}), "Global"
+
+def _query_quota_usage(user_email: str, bq_client: bigquery.Client, app_conf: dict, period: str, config_source: str, project_id: Optional[str]) -> Tuple[int, float]:
     """
-    
-    query_parameters = []
+    Returns (generation_count, total_cost) of the quota window from BigQuery,
+    over successful rows of the video, image and image enrichment history tables.
+    """
+    start_time = quota_window_start(period)
+    # Global config applies to the user
+    scope, key = ("project", project_id) if config_source == "Project" else ("user", user_email)
+
+    query_parameters = [bigquery.ScalarQueryParameter("key", "STRING", key)]
     if start_time:
-        base_query += " AND trigger_time >= @start_time"
         query_parameters.append(bigquery.ScalarQueryParameter("start_time", "TIMESTAMP", start_time))
 
-    if config_source == "Project":
-        base_query += " AND creative_project_id = @project_id"
-        query_parameters.append(bigquery.ScalarQueryParameter("project_id", "STRING", project_id))
-    else: # Global config applies to the user
-        base_query += " AND user_email = @user_email"
-        query_parameters.append(bigquery.ScalarQueryParameter("user_email", "STRING", user_email))
-
-    query = f"""
-        SELECT
-            COUNT(*) as generation_count,
-            SUM(
-                CASE
-                    WHEN STARTS_WITH(model_used, 'veo-3.0') THEN
-                        CASE
-                            WHEN with_audio IS NOT FALSE THEN video_duration * 0.75
-                            ELSE video_duration * 0.50
-                        END
-                    WHEN STARTS_WITH(model_used, 'veo-2.0') THEN video_duration * 0.50
-                    ELSE 0
-                END
-            ) as total_cost
-        {base_query}
-    """
+    query = quota_usage_query(bq_client.project, app_conf.get('ANALYSIS_DATASET'), quota_tables(app_conf), scope, start_time is not None)
     job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
     query_job = bq_client.query(query, job_config=job_config)
     results = list(query_job.result())
 
     if not results:
-        return False, ""
+        return 0, 0
 
     row = results[0]
-    generation_count = row.generation_count or 0
-    total_cost = row.total_cost or 0
-
-    if (quota_type == 'GENERATION_QUANTITY' and generation_count >= limit) or \
-       (quota_type == 'COST_LIMIT' and total_cost >= limit):
-        message = "Total cost reaches to reserved limitation."
-        return True, message
-
-    return False, ""
+    return row.generation_count or 0, row.total_cost or 0
@@ -1,45 +1,27 @@
+import asyncio
 import os
 import uvicorn
 import json
 import logging
-import re
-import sys
-import tempfile
+import threading
 import time
-import uuid
-from datetime import datetime, timedelta, timezone
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-
-import google.auth
-import google.genai as genai
-import vertexai
+from contextlib import asynccontextmanager
+
 from authlib.integrations.starlette_client import OAuth, OAuthError
-from fastapi import (APIRouter, Depends, FastAPI, File, Form, HTTPException,
-                   Request, UploadFile)
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request as GoogleAuthRequest
-from google.cloud import (bigquery, firestore, secretmanager, storage,
-                          tasks_v2)
-from google.cloud.firestore_v1.base_query import FieldFilter
-from google.genai import types
+from starlette.concurrency import run_in_threadpool
 from starlette.config import Config
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import JSONResponse, RedirectResponse, FileResponse
-from vertexai.preview.vision_models import ImageGenerationModel
-
-from app.config import settings
-from app.dependencies import (get_bq_client, get_config_db,
-                          get_creative_projects_db, get_db_client,
-                          get_genai_client, get_groups_db, get_imagen_client,
-                          get_prompt_gallery_db, get_shared_videos_db)
-from app.schemas import (ImageGenerationRequest, TaskResponse,
-                     TaskStatus, VideoGenerationRequest)
-from app.services import GenerationService
-from app.task_manager import create_task, get_task_status
-from app.video_processing import check_quota, process_video_from_gcs
+from starlette.responses import RedirectResponse, FileResponse
+
+from app.config import DEV_SECRET_KEY, settings
+from app.dependencies import check_clients, init_clients
+from app.bq_writer import get_bq_writer
+from app.quota import start_quota_reconciliation
+from app.services import get_generation_service
+from app.task_manager import start_task_recovery
 from app.routers.api import router as api_router
 from app.routers.videos import router as videos_router
 from app.routers.images import router as images_router
@@ -53,10 +35,47 @@ logger = logging.getLogger(__name__)
 # 3. FASTAPI APP AND MIDDLEWARE SETUP
 # ==============================================================================
 
-app = FastAPI(title="Veo Generation API")
+async def check_clients_periodically():
+    while True:
+        await asyncio.sleep(settings.CLIENT_HEALTH_CHECK_SECONDS)
+        await run_in_threadpool(check_clients)
+
 
-SECRET_KEY = os.environ.get('SECRET_KEY', 'a-very-secret-key-for-dev')
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, max_age=7200)
+def warm_up_generation_service():
+    # The service is built from the shared clients; if that fails, the routes build it again on first use.
+    try:
+        get_generation_service().warm_up()
+    except Exception as e:
+        logger.warning(f"Generation service warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared clients are created once here and injected into the routes as dependencies.
+    await run_in_threadpool(init_clients)
+    # Replays history rows spooled by earlier processes and starts the background writer.
+    if settings.ENABLE_BIGQUERY_LOGGING:
+        get_bq_writer().start()
+    # Loads quota usage from BigQuery and keeps reconciling it in the background.
+    start_quota_reconciliation()
+    # Load the embedding model in the background; it is only needed by generation callbacks.
+    warm_up = asyncio.create_task(run_in_threadpool(warm_up_generation_service))
+    # Re-attach to Veo operations left running by a previous process (persistent task stores only).
+    start_task_recovery()
+    health_checks = asyncio.create_task(check_clients_periodically())
+    yield
+    health_checks.cancel()
+    # A model load still running in its worker thread cannot be interrupted; stop waiting for it.
+    warm_up.cancel()
+    # Inserts queued history rows; whatever does not make it in time is spooled for the next start.
+    await run_in_threadpool(get_bq_writer().close, 10)
+
+
+app = FastAPI(title="Veo Generation API", lifespan=lifespan)
+
+if settings.ENABLE_OAUTH and settings.SECRET_KEY == DEV_SECRET_KEY:
+    logger.error("SECRET_KEY is not set; sessions use the development key and media links are refused.")
+app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY, max_age=7200)
 
 origins = [
     settings.FRONTEND_URL,
@@ -75,34 +94,53 @@ app.add_middleware(
 # ==============================================================================
 
 def get_oauth_secrets(secret_id, version_id="latest"):
+    # Imported here so processes that never serve a login do not load the Secret Manager client.
+    from google.cloud import secretmanager
+
     client = secretmanager.SecretManagerServiceClient()
     name = f"projects/{settings.PROJECT_ID}/secrets/{secret_id}/versions/{version_id}"
-    try:
-        response = client.access_secret_version(name=name)
-        return response.payload.data.decode('UTF-8')
-    except Exception as e:
-        logger.critical(f"Failed to access secret '{secret_id}'. Error: {e}", exc_info=True)
-        sys.exit(1)
+    response = client.access_secret_version(name=name)
+    return response.payload.data.decode('UTF-8')
+
+
+# The OAuth client is built on the first login rather than at import, and rebuilt with a
+# freshly fetched secret after OAUTH_SECRET_TTL_SECONDS so rotated secrets are picked up.
+_oauth_lock = threading.Lock()
+_oauth_state = {"oauth": None, "fetched_at": 0.0}
+
+
+def get_oauth() -> OAuth:
+    with _oauth_lock:
+        oauth = _oauth_state["oauth"]
+        if oauth is not None and time.monotonic() - _oauth_state["fetched_at"] < settings.OAUTH_SECRET_TTL_SECONDS:
+            return oauth
+        try:
+            secrets = json.loads(get_oauth_secrets(settings.SECRET_ID))
+        except Exception as e:
+            logger.critical(f"Failed to access secret '{settings.SECRET_ID}'. Error: {e}", exc_info=True)
+            if oauth is None:
+                raise HTTPException(status_code=500, detail="Server configuration error: OAuth secrets are unavailable.")
+            # Keep using the previous secret until the Secret Manager is reachable again.
+            return oauth
+
+        config_data = {
+            'GOOGLE_CLIENT_ID': secrets.get('GOOGLE_CLIENT_ID'),
+            'GOOGLE_CLIENT_SECRET': secrets.get('GOOGLE_CLIENT_SECRET'),
+        }
+        oauth = OAuth(Config(environ=config_data))
+        oauth.register(
+            name='google',
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_kwargs={'scope': 'openid email profile'},
+        )
+        _oauth_state.update(oauth=oauth, fetched_at=time.monotonic())
+        return oauth
 
 
 if settings.ENABLE_OAUTH:
 
-    secrets_str = get_oauth_secrets(settings.SECRET_ID)
-    secrets = json.loads(secrets_str)
     ALLOWED_DOMAINS = settings.ALLOWED_DOMAINS
 
-    config_data = {
-        'GOOGLE_CLIENT_ID': secrets.get('GOOGLE_CLIENT_ID'),
-        'GOOGLE_CLIENT_SECRET': secrets.get('GOOGLE_CLIENT_SECRET'),
-    }
-    starlette_config = Config(environ=config_data)
-    oauth = OAuth(starlette_config)
-    oauth.register(
-        name='google',
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={'scope': 'openid email profile'},
-    )
-
 
     @app.get('/login')
     async def login(request: Request):
@@ -110,6 +148,7 @@ if settings.ENABLE_OAUTH:
         if not redirect_uri:
             logger.error("REDIRECT_URI is not configured. Cannot initiate login.")
             raise HTTPException(status_code=500, detail="Server configuration error: REDIRECT_URI is missing.")
+        oauth = await run_in_threadpool(get_oauth)
         return await oauth.google.authorize_redirect(request, redirect_uri)
 
 
@@ -119,6 +158,7 @@ if settings.ENABLE_OAUTH:
         if not frontend_url:
             logger.error("FRONTEND_URL is not configured. Cannot complete auth.")
             raise HTTPException(status_code=500, detail="Server configuration error: FRONTEND_URL is missing.")
+        oauth = await run_in_threadpool(get_oauth)
         try:
             token = await oauth.google.authorize_access_token(request)
             user_info = dict(token)["userinfo"]
@@ -0,0 +1,114 @@
+"""
+Measures cold-start time of the backend and reports the most expensive imports.
+
+Each run imports the app in a fresh interpreter with `-X importtime`, like a new
+Cloud Run instance would. Run from src/backend:
+
+    python scripts/profile_startup.py                      # 5 runs, top 20 imports
+    python scripts/profile_startup.py --runs 10 --top 40
+    python scripts/profile_startup.py --budget-seconds 3   # exit 1 if the median is slower
+    python scripts/profile_startup.py --json               # machine-readable, for tracking over time
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+TIMED_IMPORT = """
+import time
+started = time.perf_counter()
+import {module}
+print(f"STARTUP_SECONDS={{time.perf_counter() - started}}")
+"""
+
+
+def run_once(module: str) -> Tuple[float, Dict[str, int]]:
+    """
+    Imports `module` in a new interpreter. Returns the import wall time in seconds
+    and the cumulative import time in microseconds of every imported module.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", TIMED_IMPORT.format(module=module)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise SystemExit(f"Importing {module} failed with exit code {completed.returncode}.")
+
+    startup_seconds = next(
+        float(line.split("=", 1)[1]) for line in completed.stdout.splitlines() if line.startswith("STARTUP_SECONDS=")
+    )
+    cumulative_us = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        cumulative_us[name.strip()] = int(cumulative)
+    return startup_seconds, cumulative_us
+
+
+def top_packages(runs: List[Dict[str, int]], limit: int) -> List[Tuple[str, float]]:
+    """
+    Returns the top-level packages with the highest median cumulative import time, in milliseconds.
+    A package's cost is that of its most expensive module, which includes everything it imported first.
+    """
+    per_package = defaultdict(list)
+    for cumulative_us in runs:
+        package_costs = defaultdict(int)
+        for name, micros in cumulative_us.items():
+            root = name.split(".")[0]
+            package_costs[root] = max(package_costs[root], micros)
+        for root, micros in package_costs.items():
+            per_package[root].append(micros)
+    medians = {root: statistics.median(values) / 1000 for root, values in per_package.items()}
+    return sorted(medians.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import (default: main).")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh-interpreter imports.")
+    parser.add_argument("--top", type=int, default=20, help="Number of packages to report.")
+    parser.add_argument("--budget-seconds", type=float, help="Fail if the median startup time exceeds this.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    timings, import_runs = [], []
+    for _ in range(args.runs):
+        startup_seconds, cumulative_us = run_once(args.module)
+        timings.append(startup_seconds)
+        import_runs.append(cumulative_us)
+
+    median_seconds = statistics.median(timings)
+    packages = top_packages(import_runs, args.top)
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "runs": args.runs,
+            "median_seconds": round(median_seconds, 3),
+            "min_seconds": round(min(timings), 3),
+            "max_seconds": round(max(timings), 3),
+            "packages_ms": {name: round(ms, 1) for name, ms in packages},
+        }, indent=2))
+    else:
+        print(f"import {args.module}: median {median_seconds:.3f}s, "
+              f"min {min(timings):.3f}s, max {max(timings):.3f}s over {args.runs} runs\n")
+        print(f"{'package':<40} {'cumulative ms':>14}")
+        for name, ms in packages:
+            print(f"{name:<40} {ms:>14.1f}")
+
+    if args.budget_seconds is not None and median_seconds > args.budget_seconds:
+        print(f"\nStartup time {median_seconds:.3f}s exceeds the budget of {args.budget_seconds:.3f}s.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Stress test of quota reservations under concurrent generation requests.
+
+Many threads submit video generations against one creative project with a
+COST_LIMIT quota. Each admitted generation runs for a random time and then
+succeeds, fails or is cancelled, like a task in the background processor:
+success logs its cost to the ledger and then releases the reservation,
+failure and cancellation only release it. Run from src/backend:
+
+    python scripts/quota_stress.py                         # reservations
+    python scripts/quota_stress.py --naive                 # check-then-act, for comparison
+    python scripts/quota_stress.py --threads 64 --requests 2000 --limit 200
+
+Exits 1 if the spent cost exceeds the limit or reservations are left behind.
+With --naive, requests checked concurrently all see the same usage, so the
+spent cost typically overshoots the limit.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.quota import QuotaLedger, estimate_quota_cost, quota_exceeded  # noqa: E402
+
+PROJECT_ID = "stress-project"
+QUOTA_TYPE = "COST_LIMIT"
+PERIOD = "day"
+# (model, duration, generateAudio) of the simulated requests.
+REQUEST_SHAPES = [("veo-3.0-generate-preview", 8, True), ("veo-3.0-fast-generate-preview", 8, False), ("veo-2.0-generate-001", 5, False)]
+
+
+def simulate_request(ledger: QuotaLedger, args, outcomes: dict, outcomes_lock: threading.Lock):
+    rng = random.Random()
+    model, duration, with_audio = rng.choice(REQUEST_SHAPES)
+    user_email = f"user{rng.randrange(args.users)}@example.com"
+    cost = estimate_quota_cost(model, duration, with_audio)
+
+    reservation_id = None
+    if args.naive:
+        count, spent = ledger.usage("project", PROJECT_ID, PERIOD)
+        admitted = not quota_exceeded(QUOTA_TYPE, args.limit, count, spent, 1, cost)
+    else:
+        reservation_ids = ledger.try_reserve("project", PROJECT_ID, PERIOD, QUOTA_TYPE, args.limit,
+                                             user_email, PROJECT_ID, [(1, cost)])
+        admitted = reservation_ids is not None
+        if admitted:
+            reservation_id = reservation_ids[0]
+    if not admitted:
+        with outcomes_lock:
+            outcomes["rejected"] += 1
+        return
+
+    time.sleep(rng.uniform(0, args.max_run_ms / 1000))
+    roll = rng.random()
+    outcome = "success" if roll < args.success_rate else "cancelled" if roll < args.success_rate + args.cancel_rate else "failure"
+    if outcome == "success":
+        ledger.record(user_email, PROJECT_ID, datetime.now(timezone.utc), cost)
+    ledger.release(reservation_id)
+    with outcomes_lock:
+        outcomes[outcome] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32, help="Concurrent requests.")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests to submit.")
+    parser.add_argument("--limit", type=float, default=100, help="Project COST_LIMIT in USD.")
+    parser.add_argument("--users", type=int, default=10, help="Distinct users submitting to the project.")
+    parser.add_argument("--max-run-ms", type=float, default=20, help="Upper bound of a simulated generation's run time.")
+    parser.add_argument("--success-rate", type=float, default=0.7)
+    parser.add_argument("--cancel-rate", type=float, default=0.1)
+    parser.add_argument("--naive", action="store_true", help="Check usage without reserving, as before reservations.")
+    args = parser.parse_args()
+
+    ledger = QuotaLedger()
+    ledger.replace([], time.time())
+    outcomes = {"success": 0, "failure": 0, "cancelled": 0, "rejected": 0}
+    outcomes_lock = threading.Lock()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        futures = [pool.submit(simulate_request, ledger, args, outcomes, outcomes_lock) for _ in range(args.requests)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    count, spent = ledger.usage("project", PROJECT_ID, PERIOD)
+    reserved_count, reserved_cost = ledger.reserved("project", PROJECT_ID)
+    print(f"{'naive check' if args.naive else 'reservations'}: {args.requests} requests on {args.threads} threads in {elapsed:.2f}s")
+    print("  " + ", ".join(f"{name} {value}" for name, value in outcomes.items()))
+    print(f"  spent {spent:.2f} of limit {args.limit:.2f} over {count} videos; "
+          f"{reserved_count} reservations ({reserved_cost:.2f}) left")
+
+    failures = []
+    if spent >= args.limit:
+        failures.append(f"spent cost {spent:.2f} exceeds the limit {args.limit:.2f}")
+    if reserved_count:
+        failures.append(f"{reserved_count} reservations were not released")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
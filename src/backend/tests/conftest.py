@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Run from src/backend with `python -m pytest`; the app package lives next to this directory.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
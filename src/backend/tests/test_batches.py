@@ -0,0 +1,77 @@
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import dependencies
+from app.config import settings
+from app.routers.api import router
+from app.task_manager import create_batch, get_batch_status
+
+
+def wait_for_batch(batch_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = get_batch_status(batch_id)
+        if status["status"] != "RUNNING":
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Batch {batch_id} is still running")
+
+
+def fail():
+    raise RuntimeError("generation failed")
+
+
+def test_batch_runs_at_most_max_concurrency_items():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def target():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {"ok": True}
+
+    batch_id, task_ids = create_batch([{"target_func": target} for _ in range(6)], max_concurrency=2)
+    status = wait_for_batch(batch_id)
+    assert status["status"] == "SUCCESS"
+    assert status["counts"] == {"SUCCESS": 6}
+    assert [item["task_id"] for item in status["items"]] == task_ids
+    assert peak[0] <= 2
+
+
+def test_batch_status_reports_failures():
+    batch_id, _ = create_batch([{"target_func": fail}, {"target_func": lambda: {"error": "RAI blocked"}}], 2)
+    assert wait_for_batch(batch_id)["status"] == "FAILURE"
+
+    batch_id, _ = create_batch([{"target_func": fail}, {"target_func": lambda: {"ok": True}}], 2)
+    status = wait_for_batch(batch_id)
+    assert status["status"] == "PARTIAL_SUCCESS"
+    assert status["counts"] == {"FAILURE": 1, "SUCCESS": 1}
+
+
+def test_batch_endpoint_checks_the_owner(monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_OAUTH", True)
+    batch_id, _ = create_batch([{"target_func": lambda: {"ok": True}}], 1, owner="owner@example.com")
+    wait_for_batch(batch_id)
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    current_user = {}
+    app.dependency_overrides[dependencies.get_user] = lambda: current_user.get("user")
+    with TestClient(app) as client:
+        assert client.get(f"/api/batches/{batch_id}").status_code == 401
+        current_user["user"] = {"email": "other@example.com", "role": "USER"}
+        assert client.get(f"/api/batches/{batch_id}").status_code == 403
+        current_user["user"] = {"email": "admin@example.com", "role": "APP_ADMIN"}
+        assert client.get(f"/api/batches/{batch_id}").status_code == 200
+        current_user["user"] = {"email": "owner@example.com", "role": "USER"}
+        response = client.get(f"/api/batches/{batch_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "SUCCESS"
+        assert client.get("/api/batches/no-such-batch").status_code == 404
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+
+from app.bq_writer import BigQueryWriter
+
+
+class FakeBigQueryClient:
+    def __init__(self, fail_times=0, invalid_rows=()):
+        self.fail_times = fail_times
+        self.invalid_rows = set(invalid_rows)
+        self.inserted = []
+        self.block = None
+
+    def insert_rows_json(self, table_id, rows, row_ids):
+        if self.block:
+            self.block.wait(5)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("BigQuery unavailable")
+        # Like BigQuery, one invalid row stops the whole request.
+        errors = []
+        if any(row["id"] in self.invalid_rows for row in rows):
+            errors = [{"index": index, "errors": [{"reason": "invalid" if row["id"] in self.invalid_rows else "stopped"}]}
+                      for index, row in enumerate(rows)]
+        if not errors:
+            self.inserted.extend((table_id, row["id"]) for row in rows)
+        return errors
+
+
+def make_writer(client, tmp_path, **kwargs):
+    return BigQueryWriter(lambda: client, str(tmp_path / "spool.jsonl"), backoff_seconds=0, **kwargs)
+
+
+def spooled_ids(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line)["row"]["id"] for line in path.read_text().splitlines()]
+
+
+def test_rows_are_inserted_in_batches_per_table(tmp_path):
+    client = FakeBigQueryClient()
+    writer = make_writer(client, tmp_path, batch_size=2)
+    for n in range(3):
+        writer.submit("project.dataset.veo", {"id": n})
+    writer.submit("project.dataset.imagen", {"id": 10})
+    assert writer.flush(5)
+    assert sorted(client.inserted) == [("project.dataset.imagen", 10), ("project.dataset.veo", 0),
+                                       ("project.dataset.veo", 1), ("project.dataset.veo", 2)]
+    writer.close(5)
+    assert writer.stats()["inserted"] == 4
+
+
+def test_invalid_rows_are_dropped_and_stopped_rows_retried(tmp_path):
+    client = FakeBigQueryClient(invalid_rows={1})
+    writer = make_writer(client, tmp_path)
+    for n in range(3):
+        writer.submit("t", {"id": n})
+    assert writer.flush(5)
+    writer.close(5)
+    assert sorted(client.inserted) == [("t", 0), ("t", 2)]
+    assert writer.stats()["rejected"] == 1
+    assert spooled_ids(tmp_path) == []
+
+
+def test_failed_inserts_are_spooled_and_replayed_on_start(tmp_path):
+    client = FakeBigQueryClient(fail_times=10)
+    writer = make_writer(client, tmp_path, max_retries=1)
+    writer.submit("t", {"id": 1})
+    writer.close(5)
+    assert spooled_ids(tmp_path) == [1]
+
+    client.fail_times = 0
+    replaying = make_writer(client, tmp_path)
+    replaying.start()
+    assert replaying.flush(5)
+    replaying.close(5)
+    assert client.inserted == [("t", 1)]
+    assert spooled_ids(tmp_path) == []
+    assert replaying.stats()["replayed"] == 1
+
+
+def test_replay_files_of_an_earlier_process_with_the_same_pid_are_replayed(tmp_path):
+    # Left behind mid-replay by a process that had this PID before a container restart.
+    record = {"table_id": "t", "insert_id": "i1", "row": {"id": 1}}
+    (tmp_path / f"spool.jsonl.replay-{os.getpid()}-0123abcd").write_text(json.dumps(record) + "\n")
+    client = FakeBigQueryClient()
+    writer = make_writer(client, tmp_path)
+    writer.start()
+    assert writer.flush(5)
+    writer.close(5)
+    assert client.inserted == [("t", 1)]
+    assert list(tmp_path.glob("spool.jsonl.replay-*")) == []
+
+
+def test_flush_spools_rows_when_the_queue_stays_full(tmp_path):
+    client = FakeBigQueryClient()
+    client.block = threading.Event()
+    writer = make_writer(client, tmp_path, batch_size=1, max_queue=2)
+    writer.submit("t", {"id": 0})
+    writer.submit("t", {"id": 1})
+    writer.submit("t", {"id": 2})
+    writer.submit("t", {"id": 3})
+
+    assert writer.flush(0.2) is False
+    client.block.set()
+    writer.close(5)
+    # Every row is either inserted or spooled, exactly once.
+    assert sorted([row_id for _, row_id in client.inserted] + spooled_ids(tmp_path)) == [0, 1, 2, 3]
+    assert spooled_ids(tmp_path)
+
+
+def test_close_stops_the_writer_before_spooling_leftovers(tmp_path):
+    client = FakeBigQueryClient()
+    client.block = threading.Event()
+    writer = make_writer(client, tmp_path, batch_size=1, max_queue=3)
+    for n in range(4):
+        writer.submit("t", {"id": n})
+
+    threading.Timer(0.2, client.block.set).start()
+    writer.close(5)
+    assert not writer._thread.is_alive()
+    assert sorted([row_id for _, row_id in client.inserted] + spooled_ids(tmp_path)) == [0, 1, 2, 3]
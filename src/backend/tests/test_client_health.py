@@ -0,0 +1,112 @@
+import types
+
+import pytest
+
+from app import dependencies, services, signed_urls
+from app.config import settings
+
+
+class FakeStorageClient:
+    healthy = True
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_bucket(self, name):
+        if not FakeStorageClient.healthy:
+            raise ConnectionError("connection reset")
+        return name
+
+
+class FakeBigQueryClient:
+    healthy = True
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_dataset(self, dataset):
+        if not FakeBigQueryClient.healthy:
+            raise ConnectionError("token expired")
+        return dataset
+
+
+class FakeGenAIClient:
+    healthy = True
+
+    def __init__(self, *args, **kwargs):
+        self.models = self
+
+    def list(self, config=None):
+        if not FakeGenAIClient.healthy:
+            raise ConnectionError("unauthenticated")
+        return iter([])
+
+
+class FakeVeoApiClient:
+    def __init__(self, *args):
+        self.storage_client = FakeStorageClient()
+
+
+CACHED_FACTORIES = (dependencies.get_storage_client, dependencies.get_bq_client, dependencies.get_genai_client,
+                    dependencies.get_imagen_client, dependencies.get_veo_client,
+                    services.get_generation_service, signed_urls.get_url_signer)
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    monkeypatch.setattr(dependencies, "storage", types.SimpleNamespace(Client=FakeStorageClient))
+    monkeypatch.setattr(dependencies, "bigquery", types.SimpleNamespace(Client=FakeBigQueryClient))
+    monkeypatch.setattr(dependencies, "genai", types.SimpleNamespace(Client=FakeGenAIClient))
+    monkeypatch.setattr(services, "VeoApiClient", FakeVeoApiClient)
+    monkeypatch.setattr(signed_urls, "_load_signing_credentials", lambda credential_manager: object())
+    monkeypatch.setattr(signed_urls, "get_credential_manager", lambda: None)
+    monkeypatch.setattr(settings, "ENABLE_BIGQUERY_LOGGING", True)
+    for factory in CACHED_FACTORIES:
+        factory.cache_clear()
+    FakeStorageClient.healthy = FakeBigQueryClient.healthy = FakeGenAIClient.healthy = True
+    yield
+    for factory in CACHED_FACTORIES:
+        factory.cache_clear()
+
+
+def test_healthy_clients_are_kept(fake_clients):
+    storage_client = dependencies.get_storage_client()
+    generation_service = services.get_generation_service()
+    health = dependencies.check_clients()
+    assert all(health.values())
+    assert set(health) == {"get_storage_client", "get_bq_client", "get_genai_client", "get_imagen_client", "get_veo_client"}
+    assert dependencies.get_storage_client() is storage_client
+    assert services.get_generation_service() is generation_service
+
+
+def test_failed_storage_client_is_rebuilt_with_its_services(fake_clients):
+    storage_client = dependencies.get_storage_client()
+    generation_service = services.get_generation_service()
+    url_signer = signed_urls.get_url_signer()
+    assert url_signer.storage_client is storage_client
+
+    FakeStorageClient.healthy = False
+    health = dependencies.check_clients()
+    assert health["get_storage_client"] is False
+    assert health["get_bq_client"] is True
+
+    assert dependencies.get_storage_client() is not storage_client
+    assert services.get_generation_service() is not generation_service
+    assert services.get_generation_service().storage_client is dependencies.get_storage_client()
+    assert signed_urls.get_url_signer().storage_client is dependencies.get_storage_client()
+
+
+def test_failed_genai_and_bigquery_clients_are_rebuilt(fake_clients):
+    genai_client = dependencies.get_genai_client()
+    bq_client = dependencies.get_bq_client()
+    generation_service = services.get_generation_service()
+    url_signer = signed_urls.get_url_signer()
+
+    FakeGenAIClient.healthy = FakeBigQueryClient.healthy = False
+    health = dependencies.check_clients()
+    assert not health["get_genai_client"] and not health["get_imagen_client"] and not health["get_bq_client"]
+    assert dependencies.get_genai_client() is not genai_client
+    assert dependencies.get_bq_client() is not bq_client
+    assert services.get_generation_service() is not generation_service
+    # The signer only holds the storage client, so it is kept.
+    assert signed_urls.get_url_signer() is url_signer
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from app.task_manager import InstrumentedExecutor, create_task, get_task_status
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_callbacks_run_on_their_own_pool():
+    threads = {}
+    unblock = threading.Event()
+
+    def on_success(result, **kwargs):
+        threads["callback"] = threading.current_thread().name
+        unblock.wait(5)
+
+    def target():
+        threads["target"] = threading.current_thread().name
+        return {"ok": True}
+
+    first = create_task(target, on_success)
+    wait_for(lambda: "callback" in threads)
+    assert threads["target"].startswith("generation")
+    assert threads["callback"].startswith("callbacks")
+    assert get_task_status(first)["status"] == "SUCCESS"
+
+    # A callback still running does not hold up the next generation.
+    second = create_task(lambda: {"ok": True})
+    wait_for(lambda: get_task_status(second)["status"] == "SUCCESS")
+    unblock.set()
+
+
+def test_executor_stats_track_the_queue():
+    executor = InstrumentedExecutor("test", max_workers=1)
+    release = threading.Event()
+    running = executor.submit(release.wait, 5)
+    wait_for(lambda: executor.stats()["active"] == 1)
+    queued = executor.submit(lambda: None)
+    cancelled = executor.submit(lambda: None)
+    assert cancelled.cancel()
+    stats = executor.stats()
+    assert stats["queued"] == 1 and stats["max_queued"] == 2
+
+    release.set()
+    running.result(5)
+    queued.result(5)
+    executor.shutdown(wait=True)
+    stats = executor.stats()
+    assert (stats["queued"], stats["active"], stats["completed"]) == (0, 0, 2)
@@ -0,0 +1,58 @@
+import sys
+import types
+
+import pytest
+
+from app import services
+from app.services import GenerationService
+
+
+@pytest.fixture
+def fake_vertexai(monkeypatch):
+    loads = []
+
+    class MultiModalEmbeddingModel:
+        fail = False
+
+        @classmethod
+        def from_pretrained(cls, model_id):
+            loads.append(model_id)
+            if cls.fail:
+                raise RuntimeError("model unavailable")
+            return cls()
+
+    vertexai = types.ModuleType("vertexai")
+    vertexai.init = lambda **kwargs: None
+    vision_models = types.ModuleType("vertexai.vision_models")
+    vision_models.MultiModalEmbeddingModel = MultiModalEmbeddingModel
+    vertexai.vision_models = vision_models
+    monkeypatch.setitem(sys.modules, "vertexai", vertexai)
+    monkeypatch.setitem(sys.modules, "vertexai.vision_models", vision_models)
+    return MultiModalEmbeddingModel, loads
+
+
+def test_embedding_model_is_loaded_once_on_first_use(fake_vertexai):
+    model_class, loads = fake_vertexai
+    service = GenerationService(None, None, None)
+    assert loads == []
+    service.warm_up()
+    assert isinstance(service.embedding_model, model_class)
+    assert service.embedding_model is service.embedding_model
+    assert len(loads) == 1
+
+
+def test_failed_embedding_model_load_is_retried_after_a_back_off(fake_vertexai, monkeypatch):
+    model_class, loads = fake_vertexai
+    now = [1000.0]
+    monkeypatch.setattr(services.time, "monotonic", lambda: now[0])
+    model_class.fail = True
+    service = GenerationService(None, None, None)
+    assert service.embedding_model is None
+    assert service.embedding_model is None
+    assert len(loads) == 1
+
+    model_class.fail = False
+    now[0] += services.EMBEDDING_MODEL_RETRY_SECONDS + 1
+    assert isinstance(service.embedding_model, model_class)
+    assert len(loads) == 2
+
@@ -0,0 +1,82 @@
+import json
+import types
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import dependencies, pagination
+from app.config import settings
+from app.history import HISTORY_COLUMNS, HISTORY_SOURCES, history_source
+from app.pagination import CountCache
+from app.routers import api
+from app.routers.api import router
+
+SCHEMA_DIR = Path(__file__).resolve().parent.parent / "schemas"
+SCHEMA_FILES = {"video": "veo_history.json", "image": "imagen_history.json", "image_enrichment": "image_enrichment_history.json"}
+# Legacy BigQuery type names used by the schema files.
+STANDARD_TYPES = {"FLOAT": "FLOAT64", "INTEGER": "INT64"}
+
+
+@pytest.mark.parametrize("asset_type", sorted(HISTORY_SOURCES))
+def test_history_columns_match_the_table_schemas(asset_type):
+    schema = json.loads((SCHEMA_DIR / SCHEMA_FILES[asset_type]).read_text())
+    table_columns = {column["name"]: STANDARD_TYPES.get(column["type"], column["type"]) for column in schema}
+    for name, column_type, asset_types in HISTORY_COLUMNS:
+        assert (asset_type in asset_types) == (name in table_columns), name
+        if name in table_columns:
+            assert table_columns[name] == column_type, name
+
+
+def test_history_source_filters_every_branch():
+    source = history_source(["image", "image_enrichment"], ["user_email = @user_email"])
+    branches = source.split("UNION ALL")
+    assert len(branches) == 2
+    assert all("WHERE user_email = @user_email" in branch for branch in branches)
+    assert "CAST(error_message AS STRING) AS error_message" in branches[1]
+    assert settings.HISTORY_TABLE not in source
+    assert history_source(None, []).count("UNION ALL") == len(HISTORY_SOURCES) - 1
+
+
+class FakeBigQueryClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, query, job_config=None):
+        self.queries.append(query)
+        result = [types.SimpleNamespace(total=len(self.rows))] if "COUNT(*)" in query else [dict(row) for row in self.rows]
+        return types.SimpleNamespace(result=lambda: result)
+
+
+def test_history_endpoint_returns_each_row_with_its_own_fields(monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_BIGQUERY_LOGGING", True)
+    monkeypatch.setattr(pagination, "get_count_cache", lambda: CountCache(ttl_seconds=60, max_entries=10))
+    monkeypatch.setattr(api, "media_url", lambda uri, user_email: f"/media/{uri}")
+    page_time = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    base = {name: None for name, _, _ in HISTORY_COLUMNS}
+    bq_client = FakeBigQueryClient([
+        {**base, "asset_type": "video", "prompt": "a cat", "output_video_gcs_paths": '["gs://b/v.mp4"]',
+         "page_time": page_time, "page_row_id": 2},
+        {**base, "asset_type": "image_enrichment", "prompt": "a dog", "status": "FAILURE", "error_message": "blocked",
+         "output_image_gcs_path": "gs://b/i.png", "page_time": page_time, "page_row_id": 1},
+    ])
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.dependency_overrides[dependencies.get_user] = lambda: {"email": "a@example.com", "role": "USER"}
+    app.dependency_overrides[dependencies.get_bq_client] = lambda: bq_client
+    app.dependency_overrides[dependencies.get_creative_projects_db] = lambda: None
+    with TestClient(app) as client:
+        assert client.get("/api/history?asset_type=video,audio").status_code == 400
+        response = client.get("/api/history")
+        assert response.status_code == 200
+        video, enrichment = response.json()["rows"]
+        assert video == {"asset_type": "video", "prompt": "a cat", "output_video_gcs_paths": '["gs://b/v.mp4"]',
+                         "signed_urls": ["/media/gs://b/v.mp4"], "video_name": "v.mp4"}
+        assert enrichment["error_message"] == "blocked"
+        assert enrichment["signed_url"] == "/media/gs://b/i.png"
+        assert response.json()["total"] == 2
+        assert response.json()["next_cursor"] is None
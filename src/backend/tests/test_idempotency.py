@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+from app import task_manager
+from app.task_manager import IdempotencyConflictError, build_request_key, claim_request, create_task, release_request
+from app.task_store import SQLiteTaskStore
+
+
+def new_request_key(idempotency_key=None, body=None):
+    return build_request_key("a@example.com", f"test/{uuid.uuid4()}", body or {"prompt": "a cat"}, idempotency_key)
+
+
+def test_request_keys_depend_on_the_idempotency_key_or_the_body():
+    by_body, fingerprint = build_request_key("a@example.com", "videos/generate", {"prompt": "a cat"})
+    assert build_request_key("a@example.com", "videos/generate", {"prompt": "a cat"}) == (by_body, fingerprint)
+    assert build_request_key("b@example.com", "videos/generate", {"prompt": "a cat"})[0] != by_body
+    by_key, same_fingerprint = build_request_key("a@example.com", "videos/generate", {"prompt": "a cat"}, "k1")
+    assert by_key != by_body and same_fingerprint == fingerprint
+
+
+def test_duplicate_of_an_in_flight_request_gets_its_task():
+    request_key, fingerprint = new_request_key()
+    task_manager._task_store.set("running-task", {"status": "RUNNING"})
+    assert claim_request(request_key, fingerprint, "running-task", 5) is None
+    assert claim_request(request_key, fingerprint, "duplicate", 5) == "running-task"
+
+
+def test_finished_request_is_only_reused_within_the_window(monkeypatch):
+    request_key, fingerprint = new_request_key()
+    task_manager._task_store.set("done-task", {"status": "SUCCESS"})
+    assert claim_request(request_key, fingerprint, "done-task", 5) is None
+    assert claim_request(request_key, fingerprint, "repeat-1", 5) == "done-task"
+
+    later = time.time() + 6
+    monkeypatch.setattr("app.task_manager.time.time", lambda: later)
+    assert claim_request(request_key, fingerprint, "repeat-2", 5) is None
+    assert task_manager._task_store.get("idem:" + request_key)["task_id"] == "repeat-2"
+
+
+@pytest.mark.parametrize("status", ["FAILURE", "CANCELLED"])
+def test_failed_or_cancelled_request_is_not_reused(status):
+    request_key, fingerprint = new_request_key("retry-key")
+    task_manager._task_store.set(f"{status}-task", {"status": status})
+    assert claim_request(request_key, fingerprint, f"{status}-task", 600) is None
+    assert claim_request(request_key, fingerprint, "retry", 600) is None
+
+
+def test_claim_whose_task_is_gone_is_treated_as_unclaimed(monkeypatch):
+    request_key, fingerprint = new_request_key("evicted-key")
+    assert claim_request(request_key, fingerprint, "evicted-task", 600) is None
+    # While the first request may still be starting its task, duplicates wait for it.
+    assert claim_request(request_key, fingerprint, "too-early", 600) == "evicted-task"
+
+    later = time.time() + task_manager.CLAIM_START_GRACE_SECONDS + 1
+    monkeypatch.setattr("app.task_manager.time.time", lambda: later)
+    assert claim_request(request_key, fingerprint, "after-eviction", 600) is None
+
+
+def test_reused_idempotency_key_with_another_body_conflicts():
+    request_key, fingerprint = new_request_key("shared-key", {"prompt": "a cat"})
+    assert claim_request(request_key, fingerprint, "first", 600) is None
+    with pytest.raises(IdempotencyConflictError):
+        claim_request(request_key, "other-fingerprint", "second", 600)
+
+
+def test_released_request_can_be_claimed_again():
+    request_key, fingerprint = new_request_key()
+    assert claim_request(request_key, fingerprint, "rejected", 5) is None
+    release_request(request_key)
+    assert claim_request(request_key, fingerprint, "accepted", 5) is None
+
+
+def test_only_one_concurrent_request_takes_over_a_stale_claim():
+    request_key, fingerprint = new_request_key("stale-key")
+    task_manager._task_store.set("failed-task", {"status": "FAILURE"})
+    assert claim_request(request_key, fingerprint, "failed-task", 600) is None
+
+    winners = []
+    barrier = threading.Barrier(8)
+
+    def retry(n):
+        barrier.wait()
+        if claim_request(request_key, fingerprint, f"retry-{n}", 600) is None:
+            winners.append(n)
+
+    threads = [threading.Thread(target=retry, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+
+
+def test_created_task_is_returned_to_duplicates():
+    request_key, fingerprint = new_request_key()
+    release = threading.Event()
+    task_id = str(uuid.uuid4())
+    assert claim_request(request_key, fingerprint, task_id, 5) is None
+    create_task(lambda: release.wait(5), task_id=task_id, staged=False)
+    try:
+        assert claim_request(request_key, fingerprint, "duplicate", 5) == task_id
+    finally:
+        release.set()
+
+
+def test_persistent_stores_are_claimed_off_the_event_loop(monkeypatch, tmp_path):
+    threads = []
+
+    def claim(*args):
+        threads.append(threading.current_thread())
+        return claim_request(*args)
+
+    async def endpoint(request_key, fingerprint):
+        return await task_manager.run_task_call(claim, request_key, fingerprint, "task", 5)
+
+    request_key, fingerprint = new_request_key()
+    asyncio.run(endpoint(request_key, fingerprint))
+    assert threads[-1] is threading.main_thread()
+
+    monkeypatch.setattr(task_manager, "_task_store", SQLiteTaskStore(str(tmp_path / "tasks.db")))
+    request_key, fingerprint = new_request_key()
+    asyncio.run(endpoint(request_key, fingerprint))
+    assert threads[-1] is not threading.main_thread()
+    assert task_manager._task_store.get("idem:" + request_key)["task_id"] == "task"
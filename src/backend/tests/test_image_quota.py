@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import dependencies, services, video_processing
+from app.quota import QuotaLedger, estimate_enrichment_quota_cost, estimate_image_quota_cost
+from app.routers import images
+from app.services import GenerationService, get_generation_service
+
+MODEL = "imagen-4.0-generate-001"
+USER = {"email": "a@example.com", "role": "USER"}
+
+
+class FakeGenerationService:
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.release = threading.Event()
+        self.finished = []
+
+    def generate_image(self, prompt, user_info, **kwargs):
+        self.release.wait(5)
+        return {"images": []}
+
+    def on_image_generation_success(self, result, **kwargs):
+        self.ledger.release(kwargs.get("quota_reservation_id"))
+        self.finished.append(kwargs)
+
+    on_image_enrichment_success = on_image_generation_success
+
+    def on_generation_error(self, error, asset_type, **kwargs):
+        self.ledger.release(kwargs.get("quota_reservation_id"))
+        self.finished.append(kwargs)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    ledger = QuotaLedger()
+    ledger.replace([], time.time() - 60)
+    monkeypatch.setattr(video_processing, "get_quota_ledger", lambda: ledger)
+    monkeypatch.setattr(images, "get_quota_ledger", lambda: ledger)
+    return ledger
+
+
+def make_client(monkeypatch, generation_service, limit):
+    monkeypatch.setattr(images, "get_config", lambda db: {"quota": {"type": "COST_LIMIT", "limit": limit, "period": "day"}})
+    monkeypatch.setattr(images, "get_project_config", lambda db, project_id: None)
+    app = FastAPI()
+    app.include_router(images.router, prefix="/api/images")
+    app.dependency_overrides[dependencies.get_user] = lambda: USER
+    app.dependency_overrides[dependencies.get_bq_client] = lambda: None
+    app.dependency_overrides[dependencies.get_config_db] = lambda: None
+    app.dependency_overrides[get_generation_service] = lambda: generation_service
+    return TestClient(app)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_image_quota_is_priced_from_the_pricing_config():
+    assert estimate_image_quota_cost(MODEL) == pytest.approx(0.04)
+    assert estimate_image_quota_cost("unknown-model") == 0
+    assert estimate_enrichment_quota_cost("gemini-2.5-flash-image") == pytest.approx(30 * 1290 / 1_000_000)
+
+
+def test_generate_reserves_the_priced_images_until_they_are_logged(monkeypatch, ledger):
+    generation_service = FakeGenerationService(ledger)
+    with make_client(monkeypatch, generation_service, limit=1) as client:
+        response = client.post("/api/images/generate", json={"prompt": "a cat", "model": MODEL, "sample_count": 2})
+        assert response.status_code == 200
+        count, cost = ledger.reserved("user", USER["email"])
+        assert count == 2 and cost == pytest.approx(0.08)
+
+        generation_service.release.set()
+        wait_for(lambda: generation_service.finished)
+        assert generation_service.finished[0]["quota_reservation_id"]
+        assert ledger.reserved("user", USER["email"]) == (0, 0)
+
+
+def test_rejected_batch_releases_the_reservations_it_took(monkeypatch, ledger):
+    generation_service = FakeGenerationService(ledger)
+    requests = [{"prompt": "a cat", "model": MODEL, "creative_project_id": None},
+                {"prompt": "a dog", "model": MODEL, "creative_project_id": "p1"}]
+    with make_client(monkeypatch, generation_service, limit=0.05) as client:
+        response = client.post("/api/images/batch", json={"requests": requests})
+        assert response.status_code == 429
+        assert ledger.reserved("user", USER["email"]) == (0, 0)
+
+        response = client.post("/api/images/batch", json={"requests": requests[:1]})
+        assert response.status_code == 200
+        assert ledger.reserved("user", USER["email"])[0] == 1
+        generation_service.release.set()
+        wait_for(lambda: generation_service.finished)
+        assert ledger.reserved("user", USER["email"]) == (0, 0)
+
+
+def test_failed_submission_releases_the_claim_and_the_reservation(monkeypatch, ledger):
+    generation_service = FakeGenerationService(ledger)
+    body = {"prompt": "a cat", "model": MODEL}
+
+    def create_task(*args, **kwargs):
+        raise RuntimeError("task store unavailable")
+
+    with make_client(monkeypatch, generation_service, limit=1) as client:
+        with monkeypatch.context() as patch:
+            patch.setattr(images, "create_task", create_task)
+            with pytest.raises(RuntimeError):
+                client.post("/api/images/generate", json=body)
+        assert ledger.reserved("user", USER["email"]) == (0, 0)
+
+        # The retry is new work, not a duplicate of the request that failed.
+        response = client.post("/api/images/generate", json=body)
+        assert response.status_code == 200
+        assert ledger.reserved("user", USER["email"])[0] == 1
+        generation_service.release.set()
+        wait_for(lambda: generation_service.finished)
+
+
+def test_failed_enrichment_submission_releases_the_reservation(monkeypatch, ledger):
+    def create_task(*args, **kwargs):
+        raise RuntimeError("task store unavailable")
+
+    monkeypatch.setattr(images, "create_task", create_task)
+    form = {"model": "gemini-2.5-flash-image", "sub_prompt": "brighter", "previous_image_gcs_paths": "gs://bucket/a.png"}
+    with make_client(monkeypatch, FakeGenerationService(ledger), limit=1) as client:
+        with pytest.raises(RuntimeError):
+            client.post("/api/images/enrich", data=form)
+    assert ledger.reserved("user", USER["email"]) == (0, 0)
+
+
+@pytest.mark.parametrize("callback", ["on_image_generation_success", "on_image_enrichment_success"])
+def test_success_callbacks_release_the_reservation_even_if_logging_fails(monkeypatch, ledger, callback):
+    monkeypatch.setattr(services, "get_quota_ledger", lambda: ledger)
+    reservation_id = ledger.try_reserve("user", USER["email"], "day", "NO_LIMIT", None, USER["email"], None, [(1, 0.04)])[0]
+    generation_service = GenerationService.__new__(GenerationService)
+    monkeypatch.setattr(generation_service, "_log_image_generation", lambda *args, **kwargs: 1 / 0, raising=False)
+    monkeypatch.setattr(generation_service, "_log_image_enrichment", lambda *args, **kwargs: 1 / 0, raising=False)
+
+    with pytest.raises(ZeroDivisionError):
+        getattr(generation_service, callback)({"images": []}, quota_reservation_id=reservation_id)
+    assert ledger.reserved("user", USER["email"]) == (0, 0)
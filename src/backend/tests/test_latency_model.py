@@ -0,0 +1,62 @@
+import types
+
+from app.latency_model import (DENSE_POLL_DIVISIONS, MAX_POLL_INTERVAL_SECONDS, MIN_POLL_INTERVAL_SECONDS,
+                               LatencyModel, video_latency_key)
+from app.operation_poller import OperationPoller
+
+KEY = ("veo-3.0-generate-001", 8, "720p", True)
+
+
+def trained_model(samples, key=KEY):
+    model = LatencyModel(fallback_interval_seconds=15)
+    for seconds in samples:
+        model.record(key, seconds)
+    return model
+
+
+def test_video_latency_key_defaults():
+    assert video_latency_key({"model": "veo", "resolution": "1080p", "generateAudio": 1}) == ("veo", 8, "1080p", True)
+    assert video_latency_key({}) == ("", 8, "", False)
+
+
+def test_unknown_keys_use_the_fixed_interval():
+    model = trained_model([60, 70, 80, 90])
+    assert model.quantiles(KEY) is None
+    assert model.next_delay(KEY, 0) == 15
+    assert model.next_delay(None, 0) == 15
+
+
+def test_schedule_sleeps_to_the_window_then_polls_densely():
+    model = trained_model(range(60, 160))
+    p10, p50, p90 = model.quantiles(KEY)
+    assert (p10, p50, p90) == (70, 110, 150)
+    # Before p10 the poller sleeps straight to it, capped at the longest interval.
+    assert model.next_delay(KEY, 0) == MAX_POLL_INTERVAL_SECONDS
+    assert model.next_delay(KEY, 50) == 20
+    assert model.next_delay(KEY, 69.5) == MIN_POLL_INTERVAL_SECONDS
+    assert model.next_delay(KEY, 100) == (150 - 70) / DENSE_POLL_DIVISIONS
+    assert model.next_delay(KEY, 200) == 15
+
+
+def test_keys_without_samples_borrow_the_model_distribution():
+    model = trained_model(range(60, 160))
+    other_key = (KEY[0], 4, "1080p", False)
+    assert model.quantiles(other_key) == model.quantiles(KEY)
+    assert model.quantiles(("veo-2.0-generate-001", 8, "720p", False)) is None
+
+
+def test_finished_operations_teach_the_model():
+    class FakeGenAIClient:
+        def __init__(self):
+            self.aio = types.SimpleNamespace(operations=types.SimpleNamespace(get=self._get))
+
+        async def _get(self, operation):
+            return types.SimpleNamespace(name=operation.name, done=True)
+
+    latency_model = LatencyModel(fallback_interval_seconds=0.01)
+    client = FakeGenAIClient()
+    poller = OperationPoller(lambda: client, poll_interval_seconds=0.01, latency_model=latency_model)
+    for n in range(5):
+        poller.watch(types.SimpleNamespace(name=f"op-{n}", done=False), latency_key=KEY).result(timeout=5)
+    p10, p50, p90 = latency_model.quantiles(KEY)
+    assert 0 < p10 <= p50 <= p90 < 1
@@ -0,0 +1,60 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import dependencies
+from app.config import DEV_SECRET_KEY, settings
+from app.media import media_url, parse_media_url
+from app.routers import api
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch):
+    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret-key")
+
+
+def test_media_links_are_stable_within_a_window_and_bound_to_the_user():
+    link = media_url("gs://bucket/v.mp4", "a@example.com")
+    assert link == media_url("gs://bucket/v.mp4", "a@example.com")
+    assert link != media_url("gs://bucket/v.mp4", "b@example.com")
+    assert parse_media_url(link, "a@example.com") == "gs://bucket/v.mp4"
+    with pytest.raises(ValueError):
+        parse_media_url(link, "b@example.com")
+    assert media_url(None, "a@example.com") is None
+    assert media_url("https://example.com/v.mp4", "a@example.com") is None
+    assert parse_media_url("https://storage.googleapis.com/bucket/v.mp4", "a@example.com") is None
+
+
+def test_media_endpoint_redirects_to_a_signed_url(monkeypatch):
+    class FakeSigner:
+        def sign_url(self, gcs_uri):
+            return f"https://storage.example/{gcs_uri[5:]}?sig=1"
+
+    monkeypatch.setattr(settings, "ENABLE_OAUTH", True)
+    monkeypatch.setattr(api, "get_url_signer", lambda: FakeSigner())
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    current_user = {"user": {"email": "a@example.com"}}
+    app.dependency_overrides[dependencies.get_user] = lambda: current_user["user"]
+
+    query = {key: values[0] for key, values in parse_qs(urlparse(media_url("gs://bucket/v.mp4", "a@example.com")).query).items()}
+    with TestClient(app) as client:
+        response = client.get("/api/media", params=query, follow_redirects=False)
+        assert response.status_code == 302
+        assert response.headers["location"] == "https://storage.example/bucket/v.mp4?sig=1"
+        assert "max-age" in response.headers["cache-control"]
+
+        current_user["user"] = {"email": "b@example.com"}
+        assert client.get("/api/media", params=query, follow_redirects=False).status_code == 403
+
+
+def test_media_links_are_refused_with_the_development_key_under_oauth(monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_OAUTH", True)
+    monkeypatch.setattr(settings, "SECRET_KEY", DEV_SECRET_KEY)
+    with pytest.raises(RuntimeError):
+        media_url("gs://bucket/v.mp4", "a@example.com")
+
+    monkeypatch.setattr(settings, "ENABLE_OAUTH", False)
+    assert media_url("gs://bucket/v.mp4", "a@example.com")
@@ -0,0 +1,91 @@
+import time
+import types
+
+import pytest
+
+from app import operation_poller
+from app.operation_poller import OperationPoller, cancel_operation
+
+
+def operation(name, polls_left):
+    return types.SimpleNamespace(name=name, done=polls_left == 0, polls_left=polls_left)
+
+
+class FakeGenAIClient:
+    """
+    Finishes an operation after it has been polled `polls_left` times.
+    """
+
+    def __init__(self):
+        self.gets = 0
+        self.aio = types.SimpleNamespace(operations=types.SimpleNamespace(get=self._get))
+
+    async def _get(self, op):
+        self.gets += 1
+        return operation(op.name, op.polls_left - 1)
+
+
+def test_one_poller_resolves_many_operations():
+    client = FakeGenAIClient()
+    poller = OperationPoller(lambda: client, poll_interval_seconds=0.01)
+    futures = [poller.watch(operation(f"op-{n}", n % 4)) for n in range(50)]
+
+    finished = [future.result(timeout=5) for future in futures]
+    assert all(op.done for op in finished)
+    assert [op.name for op in finished] == [f"op-{n}" for n in range(50)]
+    assert client.gets == poller.poll_count == sum(n % 4 for n in range(50))
+    assert poller.pending_count == 0
+
+
+def test_operation_that_never_finishes_times_out():
+    client = FakeGenAIClient()
+    poller = OperationPoller(lambda: client, poll_interval_seconds=0.01)
+    with pytest.raises(TimeoutError):
+        poller.watch(operation("stuck", -1), timeout_seconds=0.05).result(timeout=5)
+    assert poller.pending_count == 0
+
+
+def test_timeout_does_not_wait_for_a_long_poll_interval():
+    client = FakeGenAIClient()
+    poller = OperationPoller(lambda: client, poll_interval_seconds=60)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        poller.watch(operation("stuck", -1), timeout_seconds=0.1).result(timeout=5)
+    assert time.monotonic() - started < 1
+    # The operation is still polled once at the deadline.
+    assert client.gets == 1
+
+
+def test_every_poll_uses_the_current_client():
+    clients = [FakeGenAIClient(), FakeGenAIClient()]
+    calls = []
+
+    def get_client():
+        calls.append(None)
+        return clients[min(len(calls), 2) - 1]
+
+    poller = OperationPoller(get_client, poll_interval_seconds=0.01)
+    poller.watch(operation("op", 3)).result(timeout=5)
+    assert clients[0].gets == 1 and clients[1].gets == 2
+
+
+
+def test_cancel_uses_the_shared_credentials(monkeypatch):
+    posts = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+    def post(url, headers, timeout):
+        posts.append((url, headers))
+        return FakeResponse()
+
+    credential_manager = types.SimpleNamespace(credentials=types.SimpleNamespace(token="cached-token"))
+    monkeypatch.setattr(operation_poller, "get_credential_manager", lambda: credential_manager)
+    monkeypatch.setattr(operation_poller.requests, "post", post)
+    cancel_operation("projects/p/locations/us-central1/publishers/google/models/veo/operations/op-1")
+    assert posts == [(
+        "https://us-central1-aiplatform.googleapis.com/v1/projects/p/locations/us-central1/publishers/google/models/veo/operations/op-1:cancel",
+        {"Authorization": "Bearer cached-token"},
+    )]
@@ -0,0 +1,96 @@
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import pagination
+from app.pagination import CountCache, decode_cursor, encode_cursor, query_history_page
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeBigQueryClient:
+    """
+    A history table of `row_count` rows, one per minute, newest first.
+    """
+
+    def __init__(self, row_count):
+        self.rows = [{"prompt": f"p{n}", "page_time": START - timedelta(minutes=n), "page_row_id": n}
+                     for n in range(row_count)]
+        self.queries = []
+
+    def query(self, query, job_config=None):
+        self.queries.append((query, {p.name: p.value for p in job_config.query_parameters}))
+        if "COUNT(*)" in query:
+            result = [types.SimpleNamespace(total=len(self.rows))]
+        else:
+            params = self.queries[-1][1]
+            rows = [row for row in self.rows if "cursor_time" not in params or row["page_time"] < params["cursor_time"]]
+            limit = int(query.split("LIMIT ")[1].split()[0])
+            offset = int(query.split("OFFSET ")[1].split()[0]) if "OFFSET" in query else 0
+            result = [dict(row) for row in rows[offset:offset + limit]]
+        return types.SimpleNamespace(result=lambda: result)
+
+    def page_queries(self):
+        return [query for query, _ in self.queries if "COUNT(*)" not in query]
+
+
+@pytest.fixture(autouse=True)
+def count_cache(monkeypatch):
+    cache = CountCache(ttl_seconds=60, max_entries=10)
+    monkeypatch.setattr(pagination, "get_count_cache", lambda: cache)
+    return cache
+
+
+def read_page(client, cursor=None, page=1):
+    return query_history_page(client, "`p.d.t`", "prompt", ["user_email = @user_email"], [], "row_id", 2,
+                              cursor=cursor, page=page)
+
+
+def test_cursors_round_trip_and_reject_garbage():
+    cursor = encode_cursor(START, -42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (START, -42)
+    for garbage in ("", "not-a-cursor", encode_cursor(START, 1)[:-3]):
+        with pytest.raises(ValueError):
+            decode_cursor(garbage)
+
+
+def test_cursor_pages_walk_the_table_once():
+    client = FakeBigQueryClient(5)
+    prompts, cursor = [], None
+    while True:
+        rows, total, cursor = read_page(client, cursor)
+        assert total == 5
+        assert all(set(row) == {"prompt"} for row in rows)
+        prompts.extend(row["prompt"] for row in rows)
+        if not cursor:
+            break
+    assert prompts == ["p0", "p1", "p2", "p3", "p4"]
+    # The total is counted once and then served from the cache.
+    assert sum("COUNT(*)" in query for query, _ in client.queries) == 1
+    assert all("OFFSET" not in query for query in client.page_queries())
+    assert "@cursor_row_id" in client.page_queries()[-1]
+
+
+def test_page_numbers_fall_back_to_offset_paging():
+    client = FakeBigQueryClient(5)
+    rows, _, next_cursor = read_page(client, page=3)
+    assert [row["prompt"] for row in rows] == ["p4"]
+    assert next_cursor is None
+    assert "OFFSET 4" in client.page_queries()[-1]
+
+
+def test_count_cache_expires_and_evicts_the_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pagination.time, "monotonic", lambda: now[0])
+    cache = CountCache(ttl_seconds=10, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    now[0] += 10
+    assert cache.get("a") is None
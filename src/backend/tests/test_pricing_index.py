@@ -0,0 +1,50 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app import config_manager
+from app.config_manager import PricingIndex, get_pricing_index
+
+VIDEO_CONFIG = {"models": [
+    {"id": "veo", "pricing": [
+        {"effective_date": "2025-10-01", "video_with_audio": 0.4},
+        {"effective_date": "2025-01-01", "video_with_audio": 0.75},
+    ]},
+    {"id": "unpriced"},
+]}
+IMAGE_CONFIG = {"models": [{"id": "imagen", "pricing": [{"effective_date": "2025-01-01", "per_image": 0.04}]}]}
+
+
+def test_price_is_the_version_in_effect_on_the_usage_date():
+    index = PricingIndex({"video": VIDEO_CONFIG, "image": IMAGE_CONFIG})
+    assert index.price("veo", date(2024, 12, 31)) is None
+    assert index.price("veo", date(2025, 1, 1))["video_with_audio"] == 0.75
+    assert index.price("veo", date(2025, 9, 30))["video_with_audio"] == 0.75
+    assert index.price("veo", datetime(2025, 10, 1, 23, tzinfo=timezone.utc))["video_with_audio"] == 0.4
+    assert index.price("imagen", date(2026, 1, 1), "image")["per_image"] == 0.04
+    assert index.price("unpriced", date(2026, 1, 1)) is None
+    assert index.price("unknown", date(2026, 1, 1)) is None
+    # Unknown model types are priced as video.
+    assert index.price("veo", date(2026, 1, 1), "video_edit")["video_with_audio"] == 0.4
+    assert [day for day, _ in index.versions("veo")] == [date(2025, 1, 1), date(2025, 10, 1)]
+
+
+def test_prices_are_read_only_and_configs_are_left_unchanged():
+    index = PricingIndex({"video": VIDEO_CONFIG})
+    with pytest.raises(TypeError):
+        index.price("veo", date(2026, 1, 1))["video_with_audio"] = 0
+    assert [price["effective_date"] for price in VIDEO_CONFIG["models"][0]["pricing"]] == ["2025-10-01", "2025-01-01"]
+
+
+def test_index_is_rebuilt_only_when_a_config_is_reloaded(monkeypatch):
+    configs = {"video": VIDEO_CONFIG, "image": IMAGE_CONFIG, "image_enrichment": {"models": []}}
+    monkeypatch.setattr(config_manager, "PRICING_CONFIG_LOADERS",
+                        {model_type: (lambda model_type=model_type: configs[model_type]) for model_type in configs})
+    monkeypatch.setattr(config_manager, "_pricing_index", None)
+    index = get_pricing_index()
+    assert get_pricing_index() is index
+
+    configs["image"] = {"models": [{"id": "imagen", "pricing": [{"effective_date": "2025-01-01", "per_image": 0.05}]}]}
+    reloaded = get_pricing_index()
+    assert reloaded is not index
+    assert reloaded.price("imagen", date(2026, 1, 1), "image")["per_image"] == 0.05
@@ -0,0 +1,125 @@
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import video_processing
+from app.config import settings
+from app.quota import LONGEST_QUOTA_PERIOD_SECONDS, QuotaLedger, quota_exceeded
+from app.video_processing import check_quota
+
+
+class FakeBigQueryClient:
+    project = "test-project"
+
+    def __init__(self, generation_count=0, total_cost=0.0):
+        self.row = types.SimpleNamespace(generation_count=generation_count, total_cost=total_cost)
+        self.queries = []
+
+    def query(self, query, job_config=None):
+        self.queries.append(query)
+        return types.SimpleNamespace(result=lambda: [self.row])
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    ledger = QuotaLedger()
+    monkeypatch.setattr(video_processing, "get_quota_ledger", lambda: ledger)
+    return ledger
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def test_usage_is_unknown_until_the_ledger_is_loaded():
+    ledger = QuotaLedger()
+    ledger.record("a@example.com", "p1", now(), 2.5)
+    assert ledger.usage("user", "a@example.com", "day") is None
+    # A snapshot started before the record does not contain it, so the record is re-applied.
+    ledger.replace([], time.time() - 60)
+    assert ledger.usage("user", "a@example.com", "day") == (1, 2.5)
+    assert ledger.usage("project", "p1", "week") == (1, 2.5)
+    assert ledger.usage("user", "a@example.com", "total") is None
+
+
+def test_snapshot_keeps_records_logged_after_it_started():
+    ledger = QuotaLedger()
+    ledger.record("a@example.com", None, now(), 1.0)
+    snapshot_started_at = time.time()
+    ledger.record("a@example.com", None, now(), 2.0)
+    # The snapshot already counts the first record, but not the second.
+    ledger.replace([("a@example.com", None, now().date(), 1, 1.0)], snapshot_started_at)
+    assert ledger.usage("user", "a@example.com", "day") == (2, 3.0)
+
+
+def test_queried_usage_counts_records_logged_after_the_query_started():
+    ledger = QuotaLedger()
+    ledger.record("a@example.com", None, now(), 1.0)
+    queried_at = time.time()
+    # Logged and released while the query ran, so neither the query nor the reservations see it.
+    ledger.record("a@example.com", None, now(), 2.0)
+    limit = {"quota_type": "COST_LIMIT", "limit": 4, "user_email": "a@example.com", "project_id": None}
+    assert ledger.try_reserve("user", "a@example.com", "day", amounts=[(1, 1.5)],
+                              committed=(1, 1.0), committed_at=queried_at, **limit) is None
+    assert ledger.try_reserve("user", "a@example.com", "day", amounts=[(1, 0.5)],
+                              committed=(1, 1.0), committed_at=queried_at, **limit)
+
+
+def test_cost_limit_admits_a_request_that_uses_it_up_exactly():
+    assert not quota_exceeded("COST_LIMIT", 10, 0, 6.0, 1, 4.0)
+    assert quota_exceeded("COST_LIMIT", 10, 0, 6.0, 1, 4.5)
+    assert quota_exceeded("COST_LIMIT", 10, 0, 10.0)
+    assert not quota_exceeded("COST_LIMIT", 10, 0, 9.5)
+
+
+def test_old_local_records_are_trimmed_without_reconciliation(monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr("app.quota.time.time", lambda: clock[0])
+    ledger = QuotaLedger()
+    for _ in range(3):
+        ledger.record("a@example.com", "p1", now(), 1.0)
+    clock[0] += LONGEST_QUOTA_PERIOD_SECONDS + 1
+    ledger.record("a@example.com", "p1", now(), 1.0)
+    assert len(ledger._recent) == 2
+
+
+def test_usage_of_earlier_days_only_counts_for_the_week(monkeypatch):
+    ledger = QuotaLedger()
+    today = now()
+    if today.weekday() == 0:
+        pytest.skip("No earlier day in the current week on Mondays.")
+    ledger.replace([("a@example.com", None, (today - timedelta(days=1)).date(), 4, 8.0)], time.time())
+    assert ledger.usage("user", "a@example.com", "day") == (0, 0.0)
+    assert ledger.usage("user", "a@example.com", "week") == (4, 8.0)
+
+
+def test_check_quota_answers_from_the_ledger(ledger):
+    ledger.replace([("a@example.com", None, now().date(), 2, 9.0)], time.time())
+    bq_client = FakeBigQueryClient()
+    config = {"quota": {"type": "COST_LIMIT", "limit": 10, "period": "day"}}
+
+    assert check_quota("a@example.com", bq_client, config, settings.dict()) == (False, "")
+    assert check_quota("a@example.com", bq_client, config, settings.dict(), requested_cost=1.0) == (False, "")
+    exceeded, message = check_quota("a@example.com", bq_client, config, settings.dict(), requested_cost=1.5)
+    assert exceeded and message
+    assert bq_client.queries == []
+
+
+def test_check_quota_queries_bigquery_until_the_ledger_is_loaded(ledger):
+    bq_client = FakeBigQueryClient(generation_count=5)
+    config = {"quota": {"type": "GENERATION_QUANTITY", "limit": 5, "period": "day"}}
+    exceeded, _ = check_quota("a@example.com", bq_client, config, settings.dict())
+    assert exceeded
+    assert len(bq_client.queries) == 1
+
+
+def test_unrestricted_project_falls_back_to_the_global_quota(ledger):
+    ledger.replace([("a@example.com", "p1", now().date(), 3, 0.0)], time.time())
+    config = {"quota": {"type": "GENERATION_QUANTITY", "limit": 3, "period": "day"}}
+    project_config = {"unrestricted": True, "quota": {"type": "NO_LIMIT"}}
+    exceeded, _ = check_quota("a@example.com", FakeBigQueryClient(), config, settings.dict(), "p1", project_config)
+    assert exceeded
+    project_config = {"quota": {"type": "GENERATION_QUANTITY", "limit": 10, "period": "day"}}
+    assert check_quota("a@example.com", FakeBigQueryClient(), config, settings.dict(), "p1", project_config) == (False, "")
@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+from app import task_manager, video_processing
+from app.quota import QuotaLedger
+from app.task_manager import TaskCancelledError, cancel_task, create_batch, get_task_status
+from app.video_processing import reserve_quota
+
+USER = "a@example.com"
+PROJECT = "p1"
+LIMIT = 20.0
+PROJECT_CONFIG = {"quota": {"type": "COST_LIMIT", "limit": LIMIT, "period": "day"}}
+
+
+class FakeBigQueryClient:
+    """
+    History tables holding the cost of every logged generation.
+    """
+    project = "test-project"
+
+    def __init__(self):
+        self.costs = []
+        self._lock = threading.Lock()
+
+    def log(self, cost):
+        with self._lock:
+            self.costs.append(cost)
+
+    def query(self, query, job_config=None):
+        with self._lock:
+            row = types.SimpleNamespace(generation_count=len(self.costs), total_cost=sum(self.costs))
+        return types.SimpleNamespace(result=lambda: [row])
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    ledger = QuotaLedger()
+    monkeypatch.setattr(video_processing, "get_quota_ledger", lambda: ledger)
+    return ledger
+
+
+@pytest.mark.parametrize("loaded", [True, False], ids=["ledger", "bigquery"])
+def test_concurrent_reservations_never_exceed_the_limit(ledger, loaded):
+    if loaded:
+        ledger.replace([], time.time() - 60)
+    bq_client = FakeBigQueryClient()
+    outcomes = {"complete": 0, "fail": 0, "cancel": 0, "rejected": 0}
+    outcomes_lock = threading.Lock()
+
+    def generate(seed):
+        rng = random.Random(seed)
+        cost = rng.choice([0.5, 1.0, 2.0])
+        exceeded, _, reservation_ids = reserve_quota(USER, bq_client, {}, {}, PROJECT, PROJECT_CONFIG, [(1, cost)])
+        if exceeded:
+            outcome = "rejected"
+        else:
+            time.sleep(rng.uniform(0, 0.005))
+            outcome = rng.choice(["complete", "complete", "fail", "cancel"])
+            if outcome == "complete":
+                bq_client.log(cost)
+                ledger.record(USER, PROJECT, datetime.now(timezone.utc), cost)
+            ledger.release(reservation_ids[0])
+        with outcomes_lock:
+            outcomes[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(generate, range(400)))
+
+    assert outcomes["rejected"] > 0
+    assert outcomes["complete"] == len(bq_client.costs)
+    assert sum(bq_client.costs) <= LIMIT
+    assert ledger.reserved("project", PROJECT) == (0, 0)
+    assert ledger.reserved("user", USER) == (0, 0)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def reserved_batch(ledger, blocker_release, errors):
+    """
+    A batch of two items of 1 USD run one at a time, each holding a reservation.
+    The first item blocks until `blocker_release` is set.
+    """
+    def on_success(result, quota_reservation_id=None, **kwargs):
+        ledger.release(quota_reservation_id)
+
+    def on_error(error, quota_reservation_id=None, **kwargs):
+        errors.append(error)
+        ledger.release(quota_reservation_id)
+
+    _, _, reservation_ids = reserve_quota(USER, FakeBigQueryClient(), {}, {}, PROJECT, PROJECT_CONFIG, [(1, 1.0), (1, 1.0)])
+    items = [
+        {"target_func": lambda **kwargs: blocker_release.wait(5) and {"ok": True}, "on_success": on_success,
+         "on_error": on_error, "kwargs": {"quota_reservation_id": reservation_ids[0]}},
+        {"target_func": lambda **kwargs: {"ok": True}, "on_error": on_error,
+         "kwargs": {"quota_reservation_id": reservation_ids[1]}},
+    ]
+    return create_batch(items, max_concurrency=1)
+
+
+def test_cancelling_a_pending_batch_item_releases_its_reservation(ledger):
+    release, errors = threading.Event(), []
+    _, (first, second) = reserved_batch(ledger, release, errors)
+    assert ledger.reserved("project", PROJECT) == (2, 2.0)
+
+    assert cancel_task(second)["status"] == "CANCELLED"
+    wait_for(lambda: errors)
+    assert [type(error) for error in errors] == [TaskCancelledError]
+    assert ledger.reserved("project", PROJECT) == (1, 1.0)
+
+    # The cancelled item is skipped when its slot frees up, without a second on_error.
+    release.set()
+    wait_for(lambda: get_task_status(first)["status"] == "SUCCESS")
+    time.sleep(0.05)
+    assert len(errors) == 1
+    assert get_task_status(second)["status"] == "CANCELLED"
+
+
+def test_batch_item_cancelled_by_another_worker_runs_on_error_when_reached(ledger):
+    release, errors = threading.Event(), []
+    _, (first, second) = reserved_batch(ledger, release, errors)
+
+    # Another worker sharing the store only sees the PENDING record.
+    task_manager._set_task_record(second, {"status": "CANCELLED", "error": "Task was cancelled."})
+    release.set()
+    wait_for(lambda: errors)
+    assert [type(error) for error in errors] == [TaskCancelledError]
+    wait_for(lambda: get_task_status(first)["status"] == "SUCCESS")
+    wait_for(lambda: ledger.reserved("project", PROJECT) == (0, 0))
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.api_core import exceptions as google_api_exceptions
+
+from app.rate_limiter import ModelLimit, RateLimiter, TokenBucket, _load_limits, is_rate_limit_error
+
+
+def limiter(limits=None, max_retries=2):
+    return RateLimiter(limits or {}, max_retries=max_retries, backoff_seconds=0.001, max_backoff_seconds=0.01)
+
+
+def test_concurrency_limit_caps_calls_in_flight():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    rate_limiter = limiter({"imagen": ModelLimit(concurrency=2)})
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: rate_limiter.call("imagen", call), range(8)))
+    assert peak[0] == 2
+
+
+def test_token_bucket_allows_a_burst_then_paces_calls():
+    bucket = TokenBucket(per_minute=600, burst=2)
+    started = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - started < 0.05
+    bucket.acquire()
+    bucket.acquire()
+    # 10 tokens a second: the two calls past the burst wait about 0.2s.
+    assert time.monotonic() - started >= 0.15
+
+
+def test_quota_errors_are_retried_and_others_are_not():
+    attempts = []
+
+    def flaky():
+        attempts.append(None)
+        if len(attempts) < 3:
+            raise google_api_exceptions.ResourceExhausted("quota")
+        return "ok"
+
+    assert limiter().call("veo", flaky) == "ok"
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(google_api_exceptions.ResourceExhausted):
+        limiter(max_retries=1).call("veo", flaky)
+    assert len(attempts) == 2
+
+    def broken():
+        attempts.append(None)
+        raise ValueError("bad request")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        limiter().call("veo", broken)
+    assert len(attempts) == 1
+
+
+def test_backoff_time_is_capped():
+    attempts = []
+
+    def throttled():
+        attempts.append(time.monotonic())
+        raise google_api_exceptions.TooManyRequests("slow down")
+
+    rate_limiter = RateLimiter({}, max_retries=100, backoff_seconds=1, max_backoff_seconds=1, max_retry_seconds=0.05)
+    started = time.monotonic()
+    with pytest.raises(google_api_exceptions.TooManyRequests):
+        rate_limiter.call("veo", throttled)
+    assert time.monotonic() - started < 0.5
+    assert len(attempts) < 100
+
+
+def test_retries_release_the_concurrency_slot():
+    limit = ModelLimit(concurrency=1)
+    attempts = []
+
+    def flaky():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise google_api_exceptions.TooManyRequests("slow down")
+        return "ok"
+
+    assert limiter({"veo": limit}).call("veo", flaky) == "ok"
+    assert limit._semaphore.acquire(blocking=False)
+
+
+def test_rate_limit_errors_of_both_sdks_are_recognised():
+    class GenAIError(Exception):
+        code = 429
+
+    assert is_rate_limit_error(google_api_exceptions.TooManyRequests("429"))
+    assert is_rate_limit_error(GenAIError("quota"))
+    assert is_rate_limit_error(RuntimeError("RESOURCE_EXHAUSTED: quota exceeded"))
+    assert not is_rate_limit_error(RuntimeError("INVALID_ARGUMENT"))
+
+
+def test_limits_are_loaded_from_the_model_configs():
+    limits = _load_limits()
+    assert "imagen-4.0-generate-001" in limits
+    assert "gemini-2.5-flash-image" in limits
@@ -0,0 +1,92 @@
+import time
+
+from app.signed_urls import SignedUrlCache, UrlSigner
+
+
+class FakeBlob:
+    def __init__(self, client, bucket_name, blob_name):
+        self.client, self.bucket_name, self.blob_name = client, bucket_name, blob_name
+
+    def generate_signed_url(self, **kwargs):
+        self.client.calls.append((self.bucket_name, self.blob_name, kwargs))
+        return f"https://storage.example/{self.bucket_name}/{self.blob_name}?sig={len(self.client.calls)}"
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.calls = []
+
+    def bucket(self, bucket_name):
+        client = self
+
+        class Bucket:
+            def blob(self, blob_name):
+                return FakeBlob(client, bucket_name, blob_name)
+
+        return Bucket()
+
+
+class FakeCredentialManager:
+    class credentials:
+        service_account_email = "signer@example.iam.gserviceaccount.com"
+        token = "access-token"
+
+
+def test_cache_returns_urls_with_enough_lifetime_left(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.signed_urls.time.monotonic", lambda: now[0])
+    cache = SignedUrlCache(max_entries=10, min_remaining_seconds=300)
+    cache.put("gs://b/a.mp4", "https://signed/a", expiration_seconds=3600)
+    assert cache.get("gs://b/a.mp4") == "https://signed/a"
+    now[0] += 3600 - 299
+    assert cache.get("gs://b/a.mp4") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = SignedUrlCache(max_entries=2, min_remaining_seconds=0)
+    cache.put("gs://b/1", "u1", 3600)
+    cache.put("gs://b/2", "u2", 3600)
+    cache.get("gs://b/1")
+    cache.put("gs://b/3", "u3", 3600)
+    assert cache.get("gs://b/2") is None
+    assert cache.get("gs://b/1") == "u1"
+    cache.put("gs://b/4", "", 3600)
+    assert cache.get("gs://b/4") is None
+
+
+def test_signer_reuses_cached_urls_and_skips_non_gcs_uris():
+    storage_client = FakeStorageClient()
+    signer = UrlSigner(storage_client, SignedUrlCache(100, 300), credential_manager=FakeCredentialManager())
+    uris = ["gs://bucket/a.mp4", "gs://bucket/b.png", "gs://bucket/a.mp4", "", "https://not-gcs/x"]
+    first = signer.sign_urls(uris)
+    assert set(first) == {"gs://bucket/a.mp4", "gs://bucket/b.png"}
+    assert len(storage_client.calls) == 2
+    _, _, kwargs = storage_client.calls[0]
+    assert kwargs["service_account_email"] == "signer@example.iam.gserviceaccount.com"
+    assert kwargs["access_token"] == "access-token"
+    assert kwargs["version"] == "v4"
+
+    assert signer.sign_urls(uris) == first
+    assert signer.sign_url("gs://bucket/a.mp4") == first["gs://bucket/a.mp4"]
+    assert len(storage_client.calls) == 2
+
+
+def test_urls_are_cached_per_expiry():
+    storage_client = FakeStorageClient()
+    signer = UrlSigner(storage_client, SignedUrlCache(100, 300), credential_manager=FakeCredentialManager())
+    signer.sign_url("gs://bucket/a.mp4", expiration_minutes=60)
+    signer.sign_url("gs://bucket/a.mp4", expiration_minutes=10080)
+    assert [kwargs["expiration"].total_seconds() for _, _, kwargs in storage_client.calls] == [3600, 604800]
+    signer.sign_url("gs://bucket/a.mp4", expiration_minutes=10080)
+    assert len(storage_client.calls) == 2
+
+
+def test_failed_signing_maps_to_an_empty_url_and_is_not_cached():
+    class BrokenStorageClient(FakeStorageClient):
+        def bucket(self, bucket_name):
+            raise RuntimeError("signBlob denied")
+
+    signer = UrlSigner(BrokenStorageClient(), SignedUrlCache(100, 300), credential_manager=FakeCredentialManager())
+    assert signer.sign_urls(["gs://bucket/a.mp4"]) == {"gs://bucket/a.mp4": ""}
+    assert signer.url_cache.get(("gs://bucket/a.mp4", 60)) is None
@@ -0,0 +1,78 @@
+import importlib
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# SDKs that are only imported by the features that use them.
+DEFERRED_MODULES = ("moviepy", "cv2", "vertexai", "google.cloud.texttospeech", "google.cloud.secretmanager")
+
+
+def test_routers_import_without_the_deferred_sdks():
+    script = (
+        "import sys, json\n"
+        "import app.routers.api, app.routers.videos, app.routers.images, app.routers.tools, app.services\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    loaded = json.loads(output.stdout.splitlines()[-1])
+    assert [name for name in loaded if name.startswith(DEFERRED_MODULES)] == []
+
+
+@pytest.fixture
+def main_module(tmp_path, monkeypatch):
+    # main.py serves the built frontend from static/static relative to the working directory.
+    (tmp_path / "static" / "static").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    main = importlib.import_module("main")
+    monkeypatch.setitem(main._oauth_state, "oauth", None)
+    monkeypatch.setitem(main._oauth_state, "fetched_at", 0.0)
+    return main
+
+
+def test_oauth_secret_is_fetched_on_first_use_and_refreshed(main_module, monkeypatch):
+    fetches = []
+
+    def get_oauth_secrets(secret_id):
+        fetches.append(secret_id)
+        if len(fetches) == 3:
+            raise ConnectionError("Secret Manager unavailable")
+        return json.dumps({"GOOGLE_CLIENT_ID": "id", "GOOGLE_CLIENT_SECRET": f"secret-{len(fetches)}"})
+
+    now = [1000.0]
+    monkeypatch.setattr(main_module, "get_oauth_secrets", get_oauth_secrets)
+    monkeypatch.setattr(main_module.time, "monotonic", lambda: now[0])
+
+    first = main_module.get_oauth()
+    assert main_module.get_oauth() is first
+    assert len(fetches) == 1
+
+    now[0] += main_module.settings.OAUTH_SECRET_TTL_SECONDS
+    refreshed = main_module.get_oauth()
+    assert refreshed is not first and len(fetches) == 2
+
+    # A failed refresh keeps serving logins with the previous client.
+    now[0] += main_module.settings.OAUTH_SECRET_TTL_SECONDS
+    assert main_module.get_oauth() is refreshed
+
+
+def test_missing_oauth_secret_fails_the_login_only(main_module, monkeypatch):
+    def get_oauth_secrets(secret_id):
+        raise ConnectionError("Secret Manager unavailable")
+
+    monkeypatch.setattr(main_module, "get_oauth_secrets", get_oauth_secrets)
+    with pytest.raises(HTTPException) as error:
+        main_module.get_oauth()
+    assert error.value.status_code == 500
+
+
+def test_failed_warm_up_does_not_abort_startup(main_module, monkeypatch):
+    def get_generation_service():
+        raise RuntimeError("GenAI client unavailable")
+
+    monkeypatch.setattr(main_module, "get_generation_service", get_generation_service)
+    main_module.warm_up_generation_service()
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from app import task_manager
+from app.task_manager import DeferredResult, TaskCancelledError, cancel_task, create_task, get_task_status
+
+
+def wait_for_status(task_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = get_task_status(task_id)
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Task {task_id} is still {get_task_status(task_id)['status']}")
+
+
+def test_output_of_a_cancelled_executing_task_is_still_logged():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def target():
+        started.set()
+        release.wait(5)
+        return {"video": "gs://bucket/v.mp4"}
+
+    task_id = create_task(target, lambda result, **kwargs: calls.append(("success", result)),
+                          lambda error, **kwargs: calls.append(("error", error)), staged=False, owner="a@example.com")
+    assert started.wait(5)
+    cancelled = cancel_task(task_id)
+    assert cancelled["status"] == "CANCELLED"
+    assert cancelled["owner"] == "a@example.com"
+    # Nothing is settled while the paid work is still running.
+    assert calls == []
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while not calls:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert calls == [("success", {"video": "gs://bucket/v.mp4"})]
+    assert get_task_status(task_id)["status"] == "CANCELLED"
+
+
+def test_cancelled_executing_task_that_fails_gets_a_cancellation_error():
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def target():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("generation failed")
+
+    task_id = create_task(target, None, lambda error, **kwargs: errors.append(error), staged=False)
+    assert started.wait(5)
+    cancel_task(task_id)
+    release.set()
+    wait_for_status(task_id, {"CANCELLED"})
+    deadline = time.monotonic() + 5
+    while not errors:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert [type(error) for error in errors] == [TaskCancelledError]
+
+
+def test_cancel_stops_deferred_work_and_waits_for_its_outcome():
+    future = Future()
+    stopped = threading.Event()
+    errors = []
+    task_id = create_task(lambda: DeferredResult(future, on_cancel=stopped.set), None,
+                          lambda error, **kwargs: errors.append(error), staged=False)
+    deadline = time.monotonic() + 5
+    while task_manager._task_handles.get(task_id) and task_manager._task_handles[task_id].deferred is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    cancel_task(task_id)
+    assert stopped.is_set()
+    # The remote work may not stop, so its outcome is still awaited.
+    assert not future.cancelled()
+    assert get_task_status(task_id)["status"] == "CANCELLED"
+    assert errors == []
+
+    future.set_exception(RuntimeError("operation cancelled"))
+    while not errors:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert [type(error) for error in errors] == [TaskCancelledError]
+    assert get_task_status(task_id)["status"] == "CANCELLED"
+
+
+def test_queued_task_is_settled_when_cancelled(monkeypatch):
+    executor = task_manager.InstrumentedExecutor("generation", max_workers=1)
+    monkeypatch.setattr(task_manager, "_executor", executor)
+    release = threading.Event()
+    ran, errors = [], []
+    blocker = create_task(lambda: release.wait(5) and {"ok": True})
+    queued = create_task(lambda: ran.append(True), None, lambda error, **kwargs: errors.append(error), staged=False)
+
+    cancel_task(queued)
+    release.set()
+    wait_for_status(blocker, {"SUCCESS"})
+    executor.shutdown(wait=True)
+    assert ran == []
+    assert [type(error) for error in errors] == [TaskCancelledError]
+    assert get_task_status(queued)["status"] == "CANCELLED"
+
+
+def test_task_cancelled_before_it_is_started_never_runs():
+    ran, errors = [], []
+    task_manager._set_task_record("cancelled-early", {"status": "CANCELLED", "error": "Task was cancelled."})
+    create_task(lambda: ran.append(True), None, lambda error, **kwargs: errors.append(error),
+                staged=False, task_id="cancelled-early")
+    time.sleep(0.05)
+    assert ran == []
+    assert [type(error) for error in errors] == [TaskCancelledError]
+    assert get_task_status("cancelled-early")["status"] == "CANCELLED"
+
+
+def test_status_writes_never_overwrite_a_cancellation():
+    task_manager._set_task_record("raced", {"status": "CANCELLED"})
+    kept = task_manager._transition_task_record("raced", {"status": "RUNNING"})
+    assert kept == {"status": "CANCELLED"}
+    assert get_task_status("raced")["status"] == "CANCELLED"
+
+
+def test_cancel_leaves_finished_tasks_unchanged():
+    task_id = create_task(lambda: {"ok": True}, staged=False)
+    wait_for_status(task_id, {"SUCCESS"})
+    assert cancel_task(task_id)["status"] == "SUCCESS"
+    assert cancel_task("no-such-task") == {"status": "not_found"}
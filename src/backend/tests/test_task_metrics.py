@@ -0,0 +1,55 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import dependencies
+from app.metrics import Histogram
+from app.routers.api import router
+from app.task_manager import create_task, get_task_metrics
+
+
+def test_histogram_quantiles_are_bucket_upper_bounds():
+    histogram = Histogram(buckets=(1, 5, 10))
+    assert histogram.snapshot()["p50"] is None
+    for value in (0.5, 0.7, 3, 4, 8, 30):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 6
+    assert snapshot["p50"] == 5
+    assert snapshot["p95"] == 30
+    assert snapshot["max"] == 30
+    assert snapshot["buckets"] == {"le_1": 2, "le_5": 2, "le_10": 1, "le_inf": 1}
+
+
+def test_finished_tasks_are_timed_per_function():
+    def timed_target():
+        time.sleep(0.02)
+        return {"ok": True}
+
+    before = get_task_metrics()["run_seconds"].get("timed_target", {}).get("count", 0)
+    create_task(timed_target, staged=False)
+    deadline = time.monotonic() + 5
+    while get_task_metrics()["run_seconds"].get("timed_target", {}).get("count", 0) == before:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    metrics = get_task_metrics()
+    assert metrics["run_seconds"]["timed_target"]["max"] >= 0.02
+    assert metrics["queued_seconds"]["timed_target"]["count"] == before + 1
+    assert set(metrics["executors"]) == {"generation", "callbacks"}
+
+
+def test_metrics_endpoint_is_admin_only():
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    current_user = {}
+    app.dependency_overrides[dependencies.get_user] = lambda: current_user.get("user")
+    with TestClient(app) as client:
+        assert client.get("/api/admin/tasks/metrics").status_code == 403
+        current_user["user"] = {"email": "a@example.com", "role": "USER"}
+        assert client.get("/api/admin/tasks/metrics").status_code == 403
+        current_user["user"] = {"email": "admin@example.com", "role": "APP_ADMIN"}
+        response = client.get("/api/admin/tasks/metrics")
+        assert response.status_code == 200
+        assert "in_flight_tasks" in response.json()
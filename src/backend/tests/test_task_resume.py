@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from app import task_manager
+from app.task_manager import DeferredResult, register_resumer, resume_interrupted_tasks
+from app.task_store import SQLiteTaskStore
+
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(task_manager, "_task_store", store)
+    return store
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_resumed_task_keeps_its_resume_context_until_the_target_returns(sqlite_store):
+    started, release = threading.Event(), threading.Event()
+    operation = Future()
+    results = []
+
+    def target(operation_name):
+        started.set()
+        release.wait(5)
+        return DeferredResult(operation, resume={"kind": "test-op", "operation_name": operation_name})
+
+    register_resumer("test-op", lambda resume: {
+        "target_func": target,
+        "on_success": lambda result, **kwargs: results.append(result),
+        "kwargs": {"operation_name": resume["operation_name"]},
+    })
+    resume = {"kind": "test-op", "operation_name": "operations/123"}
+    sqlite_store.set("interrupted", {"status": "RUNNING", "owner": "a@example.com", "resume": resume,
+                                     "worker": "dead-worker", "lease_until": time.time() - 1})
+
+    assert resume_interrupted_tasks() == 1
+    assert started.wait(5)
+    record = sqlite_store.get("interrupted")
+    assert record["resume"] == resume
+    assert record["worker"] == task_manager._WORKER_ID
+    assert record["lease_until"] > time.time()
+    assert record["owner"] == "a@example.com"
+    # Another pass must not take over the task while this process holds the lease.
+    assert resume_interrupted_tasks() == 0
+
+    release.set()
+    operation.set_result({"videos": ["gs://bucket/v.mp4"]})
+    wait_for(lambda: sqlite_store.get("interrupted")["status"] == "SUCCESS")
+    assert sqlite_store.get("interrupted")["result"] == {"videos": ["gs://bucket/v.mp4"]}
+
+
+def test_task_without_a_resumer_is_left_alone(sqlite_store):
+    sqlite_store.set("unknown", {"status": "RUNNING", "resume": {"kind": "no-such-kind"}, "lease_until": 0})
+    assert resume_interrupted_tasks() == 0
+    assert sqlite_store.get("unknown")["status"] == "RUNNING"
+
+
+def test_task_that_cannot_be_resumed_fails(sqlite_store):
+    def broken_resumer(resume):
+        raise RuntimeError("operation is gone")
+
+    register_resumer("broken", broken_resumer)
+    sqlite_store.set("broken-task", {"status": "RUNNING", "resume": {"kind": "broken"}, "lease_until": 0})
+    assert resume_interrupted_tasks() == 0
+    record = sqlite_store.get("broken-task")
+    assert record["status"] == "FAILURE"
+    assert "operation is gone" in record["error"]
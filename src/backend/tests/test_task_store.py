@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+from app.task_store import InMemoryTaskStore, SQLiteTaskStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryTaskStore()
+    return SQLiteTaskStore(str(tmp_path / "tasks.db"))
+
+
+def test_set_get_delete(store):
+    assert store.get("t1") is None
+    store.set("t1", {"status": "RUNNING"})
+    assert store.get("t1") == {"status": "RUNNING"}
+    store.set("t1", {"status": "SUCCESS", "result": {"video": ["gs://b/v.mp4"]}})
+    assert store.get("t1")["result"] == {"video": ["gs://b/v.mp4"]}
+    store.delete("t1")
+    assert store.get("t1") is None
+
+
+def test_claim_returns_existing_record(store):
+    assert store.claim("idem:k", {"task_id": "a"}) is None
+    assert store.claim("idem:k", {"task_id": "b"}) == {"task_id": "a"}
+    assert store.get("idem:k") == {"task_id": "a"}
+
+
+def test_claim_is_atomic_across_threads(store):
+    winners = []
+    barrier = threading.Barrier(8)
+
+    def claim(n):
+        barrier.wait()
+        if store.claim("idem:race", {"task_id": str(n)}) is None:
+            winners.append(n)
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+    assert store.get("idem:race") == {"task_id": str(winners[0])}
+
+
+def test_scan_active_yields_running_tasks(store):
+    store.set("running", {"status": "RUNNING"})
+    store.set("done", {"status": "SUCCESS"})
+    assert dict(store.scan_active()) == {"running": {"status": "RUNNING"}}
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    first, second = SQLiteTaskStore(path), SQLiteTaskStore(path)
+    first.set("t1", {"status": "RUNNING", "owner": "a@example.com"})
+    assert second.get("t1") == {"status": "RUNNING", "owner": "a@example.com"}
+    assert second.claim("t1", {"status": "RUNNING"}) == {"status": "RUNNING", "owner": "a@example.com"}
+
+
+def test_memory_store_evicts_least_recently_read_finished_records():
+    store = InMemoryTaskStore(max_entries=2)
+    store.set("old", {"status": "SUCCESS"})
+    store.set("read", {"status": "SUCCESS"})
+    store.get("old")
+    store.set("new", {"status": "SUCCESS"})
+    assert store.get("read") is None
+    assert store.get("old") == {"status": "SUCCESS"}
+    assert store.stats()["evicted"] == 1
+
+
+def test_memory_store_never_evicts_running_records():
+    store = InMemoryTaskStore(max_entries=1)
+    store.set("running", {"status": "RUNNING"})
+    store.set("done", {"status": "SUCCESS"})
+    store.set("other", {"status": "SUCCESS"})
+    assert store.get("running") == {"status": "RUNNING"}
+
+
+def test_memory_store_expires_finished_records(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.task_store.time.time", lambda: now[0])
+    store = InMemoryTaskStore(ttl_seconds=60)
+    store.set("done", {"status": "SUCCESS"})
+    store.set("running", {"status": "RUNNING"})
+    now[0] += 61
+    assert store.get("done") is None
+    assert store.get("running") == {"status": "RUNNING"}
+    assert store.stats()["expired"] == 1
+
+
+def test_memory_store_spills_evicted_records(tmp_path):
+    store = InMemoryTaskStore(max_entries=1, spill_dir=str(tmp_path))
+    store.set("first", {"status": "SUCCESS", "result": {"n": 1}})
+    store.set("second", {"status": "SUCCESS"})
+    assert store.get("first") == {"status": "SUCCESS", "result": {"n": 1}}
+    store.delete("first")
+    assert store.get("first") is None
+
+
+def test_sqlite_store_purges_expired_finished_records(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.task_store.time.time", lambda: now[0])
+    store = SQLiteTaskStore(str(tmp_path / "tasks.db"), ttl_seconds=60)
+    store.set("done", {"status": "SUCCESS"})
+    store.set("running", {"status": "RUNNING"})
+    now[0] += 3600
+    store.set("trigger", {"status": "RUNNING"})
+    assert store.get("done") is None
+    assert store.get("running") == {"status": "RUNNING"}
+
+
+def test_memory_store_never_evicts_pending_or_pinned_records():
+    store = InMemoryTaskStore(max_entries=2, pinned_prefixes=("batch:", "idem:"))
+    store.set("batch:b1", {"task_ids": ["a"]})
+    store.set("idem:k1", {"task_id": "a"})
+    store.set("a", {"status": "PENDING", "batch_id": "b1"})
+    for n in range(5):
+        store.set(f"done-{n}", {"status": "SUCCESS"})
+    assert store.get("batch:b1") == {"task_ids": ["a"]}
+    assert store.get("idem:k1") == {"task_id": "a"}
+    assert store.get("a") == {"status": "PENDING", "batch_id": "b1"}
+
+
+def test_compare_and_set_replaces_only_the_expected_record(store):
+    assert store.compare_and_set("idem:k", None, {"task_id": "a"})
+    assert not store.compare_and_set("idem:k", None, {"task_id": "b"})
+    assert not store.compare_and_set("idem:k", {"task_id": "b"}, {"task_id": "c"})
+    assert store.compare_and_set("idem:k", {"task_id": "a"}, {"task_id": "c"})
+    assert store.get("idem:k") == {"task_id": "c"}
@@ -0,0 +1,40 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import task_manager
+from app.routers.api import router
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return TestClient(app)
+
+
+def _events(body: str):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_stream_ends_for_finished_and_unknown_tasks():
+    task_manager._task_store.set("stream-done", {"status": "SUCCESS", "result": {"ok": True}})
+    with _client() as client:
+        response = client.get("/api/tasks/stream", params={"task_ids": "stream-done,stream-missing"})
+    assert response.status_code == 200
+    events = {event["task_id"]: event for event in _events(response.text)}
+    assert events["stream-done"]["status"] == "SUCCESS"
+    assert events["stream-missing"]["status"] == "not_found"
+
+
+def test_stream_pushes_transitions_until_terminal():
+    task_id = task_manager.create_task(lambda: {"video": "gs://bucket/v.mp4"}, staged=False)
+    with _client() as client:
+        response = client.get("/api/tasks/stream", params={"task_ids": task_id})
+    statuses = [event["status"] for event in _events(response.text)]
+    assert statuses[-1] == "SUCCESS"
+
+
+def test_stream_requires_task_ids():
+    with _client() as client:
+        assert client.get("/api/tasks/stream", params={"task_ids": " , "}).status_code == 400
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { watchTask } from './taskStream';
 
 /**
  * Captures a frame from a video (either uploaded file or remote URL)
@@ -42,29 +43,30 @@ export const signUrl = async (gcsUri) => {
 };
 
 /**
- * Polls a task until completion or failure.
- * Returns the final result object.
+ * Waits for a task to reach completion or failure.
+ * Returns the final result object. Rejects if the task fails, is not found,
+ * or is cancelled; a cancellation error has `cancelled` set to true.
  */
 export const pollTask = async (taskId) => {
   return new Promise((resolve, reject) => {
-    const checkStatus = async () => {
-      try {
-        const response = await axios.get(`/api/tasks/${taskId}`);
-        const { status, result, error } = response.data;
-
-        if (status === 'SUCCESS') {
-          resolve(result);
-        } else if (status === 'FAILURE') {
-          reject(new Error(error || "Task failed"));
-        } else {
-          // PENDING or RUNNING
-          setTimeout(checkStatus, 2000);
-        }
-      } catch (err) {
-        reject(err);
+    const unsubscribe = watchTask(taskId, ({ status, result, error }) => {
+      if (status === 'SUCCESS') {
+        unsubscribe();
+        resolve(result);
+      } else if (status === 'FAILURE') {
+        unsubscribe();
+        reject(new Error(error || "Task failed"));
+      } else if (status === 'CANCELLED') {
+        unsubscribe();
+        const cancelled = new Error(error || "Task was cancelled.");
+        cancelled.cancelled = true;
+        reject(cancelled);
+      } else if (status === 'not_found') {
+        unsubscribe();
+        reject(new Error("Task not found."));
       }
-    };
-    checkStatus();
+      // PENDING or RUNNING: keep waiting for the next update
+    }, reject);
   });
 };
 
@@ -0,0 +1,63 @@
+import axios from 'axios';
+
+const TERMINAL_STATUSES = ['SUCCESS', 'FAILURE', 'CANCELLED'];
+// A task that is not found (never existed or expired) will not change either.
+const FINAL_STATUSES = [...TERMINAL_STATUSES, 'not_found'];
+const FALLBACK_POLL_INTERVAL_MS = 5000;
+
+/**
+ * Watches a background task and calls onUpdate with the same
+ * { status, result, error } payload as GET /api/tasks/{task_id}.
+ *
+ * Status changes are pushed over Server-Sent Events. If the stream cannot be
+ * opened, it falls back to polling. Returns a function that stops watching.
+ */
+export const watchTask = (taskId, onUpdate, onError) => {
+  let stopped = false;
+  let source = null;
+  let pollTimer = null;
+
+  const stop = () => {
+    stopped = true;
+    if (source) source.close();
+    if (pollTimer) clearTimeout(pollTimer);
+  };
+
+  const startPolling = () => {
+    const checkStatus = async () => {
+      if (stopped) return;
+      try {
+        const response = await axios.get(`/api/tasks/${taskId}`);
+        onUpdate(response.data);
+        if (!stopped && !FINAL_STATUSES.includes(response.data.status)) {
+          pollTimer = setTimeout(checkStatus, FALLBACK_POLL_INTERVAL_MS);
+        }
+      } catch (err) {
+        if (!stopped && onError) onError(err);
+      }
+    };
+    checkStatus();
+  };
+
+  if (typeof EventSource === 'undefined') {
+    startPolling();
+    return stop;
+  }
+
+  source = new EventSource(`/api/tasks/stream?task_ids=${encodeURIComponent(taskId)}`);
+  source.addEventListener('task', (event) => {
+    const { task_id, ...status } = JSON.parse(event.data);
+    if (task_id !== taskId || stopped) return;
+    onUpdate(status);
+    if (FINAL_STATUSES.includes(status.status)) {
+      source.close();
+    }
+  });
+  source.onerror = () => {
+    // The browser retries on its own; switch to polling instead so a broken stream never stalls the UI.
+    source.close();
+    if (!stopped) startPolling();
+  };
+
+  return stop;
+};
@@ -1,10 +1,11 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect } from 'react';
 import { useTranslation } from 'react-i18next';
 import {
   Row, Col, Button, Input, Typography, Spin, Alert, Upload, Form, List, Select, Card
 } from 'antd';
 import { PlusOutlined, SendOutlined, DeleteOutlined, SyncOutlined } from '@ant-design/icons';
 import axios from 'axios';
+import { watchTask } from '../api/taskStream';
 import ImageCard from './ImageCard';
 
 const { Paragraph, Text } = Typography;
@@ -57,11 +58,10 @@ const ConversationalImageEnrichment = ({ user, onUseAsFirstFrame, onUseAsLastFra
     fetchProjects();
   }, [selectedProject, onProjectSelect]);
 
-  const pollTaskStatus = useCallback(async (taskId) => {
-    try {
-      const response = await axios.get(`/api/tasks/${taskId}`);
-      const { status, result, error } = response.data;
+  useEffect(() => {
+    if (!pollingTaskId) return;
 
+    const unsubscribe = watchTask(pollingTaskId, ({ status, result, error }) => {
       if (status === 'completed') {
         const newModelMessage = {
           type: 'model',
@@ -85,28 +85,23 @@ const ConversationalImageEnrichment = ({ user, onUseAsFirstFrame, onUseAsLastFra
         setGeneratingImages(0);
         setLoading(false);
         setPollingTaskId(null);
+        unsubscribe();
       } else if (status === 'failed') {
         setGeneratingImages(0);
         setError(error || 'An unexpected error occurred during generation.');
         setLoading(false);
         setPollingTaskId(null);
-      } else {
-        // If still processing, poll again
-        setTimeout(() => pollTaskStatus(taskId), 5000);
+        unsubscribe();
       }
-    } catch (err) {
+    }, () => {
       setError('Failed to get task status.');
       setGeneratingImages(0);
       setLoading(false);
       setPollingTaskId(null);
-    }
-  }, [user.email]);
+    });
 
-  useEffect(() => {
-    if (pollingTaskId) {
-      pollTaskStatus(pollingTaskId);
-    }
-  }, [pollingTaskId, pollTaskStatus]);
+    return () => unsubscribe();
+  }, [pollingTaskId, user.email]);
 
   const handleImageUpload = (files) => {
     const newFiles = [...imageFiles, ...files].slice(0, maxImages);
@@ -6,6 +6,7 @@ import {
 } from 'antd';
 import { ScissorOutlined, AudioOutlined, UploadOutlined, CloseOutlined, InboxOutlined, ArrowsAltOutlined } from '@ant-design/icons';
 import axios from 'axios';
+import { watchTask } from '../api/taskStream';
 import { useEditingModal } from '../hooks/useEditingModal';
 import EditingModal from './EditingModal';
 import { useNavigate } from 'react-router-dom';
@@ -272,45 +273,39 @@ const Dashboard = ({ initialFirstFrame, initialLastFrame }) => {
   useEffect(() => {
     if (!pollingTaskId) return;
 
-    const interval = setInterval(async () => {
-      try {
-        const response = await axios.get(`/api/tasks/${pollingTaskId}`);
-        const { status, result, error } = response.data;
-
-        if (status === 'completed') {
-          // The task itself completed, but the generation might have failed gracefully.
-          if (result.error || result.rai_reasons) {
-            if (result.rai_reasons) {
-              setRaiReasons(result.rai_reasons);
-            } else {
-              setError(result.error || 'An unexpected error occurred during generation.');
-            }
+    const unsubscribe = watchTask(pollingTaskId, ({ status, result, error }) => {
+      if (status === 'completed') {
+        // The task itself completed, but the generation might have failed gracefully.
+        if (result.error || result.rai_reasons) {
+          if (result.rai_reasons) {
+            setRaiReasons(result.rai_reasons);
           } else {
-            // This is a true success.
-            setGeneratedVideos(result.videos || []);
-            if (result.revisedPrompt) {
-              setRevisedPrompt(result.revisedPrompt);
-            }
+            setError(result.error || 'An unexpected error occurred during generation.');
+          }
+        } else {
+          // This is a true success.
+          setGeneratedVideos(result.videos || []);
+          if (result.revisedPrompt) {
+            setRevisedPrompt(result.revisedPrompt);
           }
-          setLoading(false);
-          setPollingTaskId(null);
-          clearInterval(interval);
-        } else if (status === 'failed') {
-          // The task itself failed unexpectedly.
-          setError(error || 'An unexpected error occurred during generation.');
-          setLoading(false);
-          setPollingTaskId(null);
-          clearInterval(interval);
         }
-      } catch (err) {
-        setError('Failed to get task status.');
         setLoading(false);
         setPollingTaskId(null);
-        clearInterval(interval);
+        unsubscribe();
+      } else if (status === 'failed') {
+        // The task itself failed unexpectedly.
+        setError(error || 'An unexpected error occurred during generation.');
+        setLoading(false);
+        setPollingTaskId(null);
+        unsubscribe();
       }
-    }, 5000); // Poll every 5 seconds
+    }, () => {
+      setError('Failed to get task status.');
+      setLoading(false);
+      setPollingTaskId(null);
+    });
 
-    return () => clearInterval(interval);
+    return () => unsubscribe();
   }, [pollingTaskId]);
 
   const onFinish = async (values) => {
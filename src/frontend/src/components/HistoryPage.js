@@ -193,21 +193,20 @@ const HistoryPage = ({ user, onUseAsFirstFrame, onUseAsLastFrame }) => {
       activeFilters.status = 'SUCCESS';
     }
 
-    let endpoint;
-    if (activeTab === 'video') {
-      endpoint = '/api/videos/history';
-    } else if (activeTab === 'image') {
-      endpoint = '/api/images/history';
-    } else {
-      endpoint = '/api/images/enrichment-history';
-    }
+    const assetType = activeTab === 'image-enrichment' ? 'image_enrichment' : activeTab;
+
+    // Continue from the cursor of the cached previous page, so the backend does not re-scan earlier pages.
+    const previousPage = cache[`${activeTab}-${JSON.stringify(filters)}-${newPage - 1}-${newRowsPerPage}`];
+    const cursor = !isCleared && newPage > 1 ? previousPage?.next_cursor : undefined;
 
     try {
-      const response = await axios.get(endpoint, {
+      const response = await axios.get('/api/history', {
         params: {
           ...activeFilters,
+          asset_type: assetType,
           page: newPage,
-          page_size: newRowsPerPage
+          page_size: newRowsPerPage,
+          ...(cursor ? { cursor } : {})
         }
       });
       const data = response.data;
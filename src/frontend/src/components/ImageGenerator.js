@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useTranslation } from 'react-i18next';
 import axios from 'axios';
+import { watchTask } from '../api/taskStream';
 import {
   Row, Col, Typography, Spin, Alert, Button,
   Form, Input, Select, Slider, Card
@@ -64,43 +65,37 @@ const ImageGenerator = ({ user, onUseAsFirstFrame }) => {
   useEffect(() => {
     if (!pollingTaskId) return;
 
-    const interval = setInterval(async () => {
-      try {
-        const response = await axios.get(`/api/tasks/${pollingTaskId}`);
-        const { status, result, error } = response.data;
-
-        if (status === 'completed') {
-          const syntheticImages = result.images.map(img => ({
-            ...img,
-            prompt: result.prompt,
-            model_used: result.model_used,
-            status: 'SUCCESS',
-            trigger_time: new Date().toISOString(),
-            user_email: user.email,
-            resolution: result.resolution,
-          }));
-          setGeneratedImages(syntheticImages);
-          if (result.rai_reasons) {
-            setRaiReasons(result.rai_reasons);
-          }
-          setLoading(false);
-          setPollingTaskId(null);
-          clearInterval(interval);
-        } else if (status === 'failed') {
-          setError(error || 'An unexpected error occurred during generation.');
-          setLoading(false);
-          setPollingTaskId(null);
-          clearInterval(interval);
+    const unsubscribe = watchTask(pollingTaskId, ({ status, result, error }) => {
+      if (status === 'completed') {
+        const syntheticImages = result.images.map(img => ({
+          ...img,
+          prompt: result.prompt,
+          model_used: result.model_used,
+          status: 'SUCCESS',
+          trigger_time: new Date().toISOString(),
+          user_email: user.email,
+          resolution: result.resolution,
+        }));
+        setGeneratedImages(syntheticImages);
+        if (result.rai_reasons) {
+          setRaiReasons(result.rai_reasons);
         }
-      } catch (err) {
-        setError('Failed to get task status.');
         setLoading(false);
         setPollingTaskId(null);
-        clearInterval(interval);
+        unsubscribe();
+      } else if (status === 'failed') {
+        setError(error || 'An unexpected error occurred during generation.');
+        setLoading(false);
+        setPollingTaskId(null);
+        unsubscribe();
       }
-    }, 5000); // Poll every 5 seconds
+    }, () => {
+      setError('Failed to get task status.');
+      setLoading(false);
+      setPollingTaskId(null);
+    });
 
-    return () => clearInterval(interval);
+    return () => unsubscribe();
   }, [pollingTaskId, user.email]);
 
   const handleSubmit = async (values) => {
@@ -5,6 +5,7 @@ import {
 } from 'antd';
 import { ReloadOutlined } from '@ant-design/icons';
 import axios from 'axios';
+import { watchTask } from '../api/taskStream';
 import VideoHistorySelector from './VideoHistorySelector';
 
 const { Title } = Typography;
@@ -76,35 +77,29 @@ const VideoExtensionPanel = ({ video }) => {
   useEffect(() => {
     if (!pollingTaskId) return;
 
-    const interval = setInterval(async () => {
-      try {
-        const response = await axios.get(`/api/tasks/${pollingTaskId}`);
-        const { status, result, error } = response.data;
-
-        if (status === 'completed') {
-          if (result.error) {
-            setError(result.error || 'An unexpected error occurred during generation.');
-          } else {
-            setGeneratedVideos(result.videos || []);
-          }
-          setLoading(false);
-          setPollingTaskId(null);
-          clearInterval(interval);
-        } else if (status === 'failed') {
-          setError(error || 'An unexpected error occurred during generation.');
-          setLoading(false);
-          setPollingTaskId(null);
-          clearInterval(interval);
+    const unsubscribe = watchTask(pollingTaskId, ({ status, result, error }) => {
+      if (status === 'completed') {
+        if (result.error) {
+          setError(result.error || 'An unexpected error occurred during generation.');
+        } else {
+          setGeneratedVideos(result.videos || []);
         }
-      } catch (err) {
-        setError('Failed to get task status.');
         setLoading(false);
         setPollingTaskId(null);
-        clearInterval(interval);
+        unsubscribe();
+      } else if (status === 'failed') {
+        setError(error || 'An unexpected error occurred during generation.');
+        setLoading(false);
+        setPollingTaskId(null);
+        unsubscribe();
       }
-    }, 5000);
+    }, () => {
+      setError('Failed to get task status.');
+      setLoading(false);
+      setPollingTaskId(null);
+    });
 
-    return () => clearInterval(interval);
+    return () => unsubscribe();
   }, [pollingTaskId]);
 
   const handleExtendClick = (video) => {
@@ -184,7 +184,9 @@ const useStore = create((set, get) => ({
         edges: state.edges.filter((edge) => edge.target !== newNodeId),
       }));
       // Ideally, we should show a toast or notification here
-      alert(`Generation failed: ${error.message}`);
+      if (!error.cancelled) {
+        alert(`Generation failed: ${error.message}`);
+      }
     }
   },
 }));